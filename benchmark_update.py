@@ -0,0 +1,483 @@
+import os
+import io
+import csv
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import http_client
+import update_data
+from generate_item_json import generate_json_from_directory
+from run_metrics import run_metrics
+from rate_control import RateController
+
+try:
+    import resource # Unix only: peak RSS is reported as None elsewhere
+except ImportError:
+    resource = None
+
+# Configuration
+ITEM_ID_BASE = 10000000000
+ICON_ID_BASE = 20000000000
+ITEMS_PER_PAGE = 100
+ITEMS_PER_ICON = 3 # Items sharing one icon, like blueprints and their products do upstream
+HISTORY_WEEKS = 52
+CATEGORY_COUNT = 20
+GROUPS_PER_CATEGORY = 12
+ICON_SIZE_PIXELS = 64
+BASE_DATE_UPDATED = datetime(2025, 1, 6, 12, 0, tzinfo=timezone.utc)
+ITEM_CSV_HEADERS = ['id', 'name', 'category_name', 'group_name', 'weekly_average_price', 'icon_id', 'date_created', 'date_updated', 'icon_url']
+PRICE_CSV_HEADERS = ['id', 'name', 'estimated_price', 'date_updated', 'category_name', 'group_name', 'icon_id']
+NAME_WORDS = ['Compact', 'Enduring', 'Scoped', 'Heavy', 'Light', 'Advanced', 'Standard', 'Improved', 'Prototype', 'Ionic', 'Thermal', 'Kinetic']
+
+class MockEchoesServer:
+    """
+    Local stand-in for the echoes.mobi endpoints used by update_data.py, serving a synthetic
+    catalog of num_items items. Responses are deterministic for a given seed and generation:
+    bumping generation moves date_updated (and the current price) forward one week for
+    update_fraction of the items, as a new weekly price publication would.
+    Each response waits latency_seconds (plus up to jitter_seconds), error_rate of the
+    requests are answered with 503, requests beyond server_requests_per_second in any second
+    get a 429 (0 disables the limit), and CSV endpoints honour If-None-Match.
+    """
+    def __init__(self, num_items: int, seed: int = 0, latency_seconds: float = 0.0, jitter_seconds: float = 0.0,
+                 error_rate: float = 0.0, items_per_page: int = ITEMS_PER_PAGE, history_weeks: int = HISTORY_WEEKS,
+                 update_fraction: float = 0.1, server_requests_per_second: float = 0):
+        self.num_items = num_items
+        self.seed = seed
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.items_per_page = items_per_page
+        self.history_weeks = history_weeks
+        self.update_fraction = update_fraction
+        self.server_requests_per_second = server_requests_per_second
+        self._window_start = 0.0
+        self._window_requests = 0
+        self.generation = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'bytes_sent': 0, 'errors': 0, 'not_modified': 0, 'throttled': 0}
+        # Updated items are a fixed pseudo-random subset, so a warm run touches the same share every time
+        self._update_rank = random.Random(seed + 1).sample(range(num_items), num_items) if num_items else []
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        handler = type('MockEchoesHandler', (_MockEchoesHandler,), {'mock': self})
+        self._httpd = _QuietThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def _over_rate_limit(self) -> bool:
+        if not self.server_requests_per_second:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_requests = 0
+            self._window_requests += 1
+            return self._window_requests > self.server_requests_per_second
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _jitter(self) -> float:
+        with self._lock:
+            return self._random.uniform(0, self.jitter_seconds) if self.jitter_seconds else 0.0
+
+    # Synthetic catalog
+
+    def _weeks_advanced(self, index: int) -> int:
+        return self.generation if self._update_rank[index] < self.num_items * self.update_fraction else 0
+
+    def item_row(self, index: int) -> dict:
+        category_number = index % CATEGORY_COUNT
+        group_number = (index // CATEGORY_COUNT) % GROUPS_PER_CATEGORY
+        icon_id = ICON_ID_BASE + index // ITEMS_PER_ICON
+        date_updated = BASE_DATE_UPDATED + timedelta(weeks=self._weeks_advanced(index))
+        return {
+            'id': str(ITEM_ID_BASE + index),
+            'name': f"{NAME_WORDS[index % len(NAME_WORDS)]} Module {index:06d}",
+            'category_name': f"Category {category_number:02d}",
+            'group_name': f"Group {category_number:02d}-{group_number:02d}",
+            'weekly_average_price': f"{self.price(index, self._weeks_advanced(index)):.2f}",
+            'icon_id': str(icon_id),
+            'date_created': '2023-07-12T14:22:29+00:00',
+            'date_updated': date_updated.isoformat(),
+            'icon_url': f"{self.base_url}/public/icons/{icon_id}.png"
+        }
+
+    def price(self, index: int, week_offset: int) -> float:
+        # Smooth per-item random walk, cheap to evaluate for any week
+        base = 1000.0 * (1 + (index * 7919 + self.seed) % 100000)
+        return base * (1 + 0.05 * ((week_offset * 31 + index) % 17 - 8) / 8)
+
+    def items_page_csv(self, page_number: int, newest_first: bool = False) -> str:
+        order = range(self.num_items)
+        if newest_first: # order[dateUpdated]=desc
+            order = sorted(order, key=lambda index: -self._weeks_advanced(index))
+        first = max((page_number - 1) * self.items_per_page, 0)
+        rows = [self.item_row(index) for index in order[first:first + self.items_per_page]]
+        return _to_csv(ITEM_CSV_HEADERS, rows)
+
+    def item_prices_csv(self) -> str:
+        rows = []
+        for index in range(self.num_items):
+            item = self.item_row(index)
+            rows.append({
+                'id': item['id'],
+                'name': item['name'],
+                'estimated_price': item['weekly_average_price'],
+                'date_updated': item['date_updated'],
+                'category_name': item['category_name'],
+                'group_name': item['group_name'],
+                'icon_id': item['icon_id']
+            })
+        return _to_csv(PRICE_CSV_HEADERS, rows)
+
+    def history_csv(self, item_id: str) -> str:
+        try:
+            index = int(item_id) - ITEM_ID_BASE
+        except ValueError:
+            index = -1
+        if not 0 <= index < self.num_items:
+            return _to_csv(update_data.HISTORY_CSV_HEADERS, [])
+        last_week = self._weeks_advanced(index)
+        rows = []
+        for row_number, week_offset in enumerate(range(last_week - self.history_weeks + 1, last_week + 1)):
+            date = (BASE_DATE_UPDATED + timedelta(weeks=week_offset)).isoformat()
+            iso_year, iso_week, _ = (BASE_DATE_UPDATED + timedelta(weeks=week_offset)).isocalendar()
+            rows.append({
+                'id': str(index * 10000 + row_number + 1),
+                'item_id': item_id,
+                'price': f"{self.price(index, week_offset):.2f}",
+                'week': f"{iso_week:02d}",
+                'year': str(iso_year),
+                'date_created': date,
+                'date_updated': date
+            })
+        return _to_csv(update_data.HISTORY_CSV_HEADERS, rows)
+
+def _to_csv(headers: list[str], rows: list[dict]) -> str:
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=headers, lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+def icon_png(icon_id: int, size: int = ICON_SIZE_PIXELS) -> bytes:
+    """
+    Returns a valid size x size RGB PNG whose colour depends on icon_id.
+    """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    colour = bytes([(icon_id * 37) % 256, (icon_id * 91) % 256, (icon_id * 53) % 256])
+    # Per-pixel noise keeps the compressed size closer to real icons
+    pixel_random = random.Random(icon_id)
+    scanlines = b''.join(b'\x00' + bytes(channel ^ pixel_random.getrandbits(4) for _ in range(size) for channel in colour)
+                         for _ in range(size))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(scanlines, 9))
+            + chunk(b'IEND', b''))
+
+class _QuietThreadingHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients closing keep-alive connections (e.g. after an unread 503 body) are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+class _MockEchoesHandler(BaseHTTPRequestHandler):
+    mock = None # MockEchoesServer, set on the per-server subclass
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real server
+    disable_nagle_algorithm = True # Headers and body are separate writes; don't let delayed ACKs stall them
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        mock = self.mock
+        mock._count('requests')
+        delay = mock.latency_seconds + mock._jitter()
+        if delay:
+            time.sleep(delay)
+        if mock._over_rate_limit():
+            mock._count('throttled')
+            self._send(429, b'Too Many Requests', 'text/plain', retry_after=1)
+            return
+        if mock._should_fail():
+            mock._count('errors')
+            self._send(503, b'Service Unavailable', 'text/plain')
+            return
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/api/items':
+            newest_first = query.get('order[dateUpdated]', [''])[0] == 'desc'
+            body, content_type = mock.items_page_csv(int(query.get('page', ['1'])[0]), newest_first).encode('utf-8'), 'text/csv'
+        elif url.path == '/api/v2/item_prices':
+            body, content_type = mock.item_prices_csv().encode('utf-8'), 'text/csv'
+        elif url.path == '/api/item_weekly_average_prices':
+            body, content_type = mock.history_csv(query.get('itemId', [''])[0]).encode('utf-8'), 'text/csv'
+        elif url.path.startswith('/public/icons/') and url.path.endswith('.png'):
+            try:
+                body, content_type = icon_png(int(os.path.basename(url.path)[:-4])), 'image/png'
+            except ValueError:
+                self._send(404, b'Not Found', 'text/plain')
+                return
+        else:
+            self._send(404, b'Not Found', 'text/plain')
+            return
+
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            mock._count('not_modified')
+            self._send(304, b'', content_type, etag)
+            return
+        self._send(200, body, content_type, etag)
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: str | None = None, retry_after: int | None = None):
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.mock._count('bytes_sent', len(body))
+
+def _snapshot_files(root_dir: str) -> dict:
+    snapshot = {}
+    for dirpath, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (file_stat.st_size, file_stat.st_mtime_ns)
+    return snapshot
+
+def _peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _run_phase(name: str, server: MockEchoesServer, work_dir: str, verbose: bool, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) and returns (result, stats) with the phase's wall time, the requests
+    and bytes served by the mock server, the files created or modified under work_dir and the
+    process's peak RSS so far (which includes the in-process mock server).
+    """
+    files_before = _snapshot_files(work_dir)
+    counters_before = server.counters()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output, run_metrics.phase(name):
+        result = func(*args, **kwargs)
+    wall_seconds = time.perf_counter() - start
+    counters_after = server.counters()
+    files_after = _snapshot_files(work_dir)
+
+    written = [path for path, signature in files_after.items() if files_before.get(path) != signature]
+    requests_made = counters_after['requests'] - counters_before['requests']
+    stats = {
+        'phase': name,
+        'wall_seconds': round(wall_seconds, 3),
+        'requests': requests_made,
+        'requests_per_second': round(requests_made / wall_seconds, 1) if wall_seconds > 0 else None,
+        'errors_injected': counters_after['errors'] - counters_before['errors'],
+        'throttled': counters_after['throttled'] - counters_before['throttled'],
+        'not_modified': counters_after['not_modified'] - counters_before['not_modified'],
+        'bytes_received': counters_after['bytes_sent'] - counters_before['bytes_sent'],
+        'files_written': len(written),
+        'bytes_written': sum(files_after[path][0] for path in written),
+        'peak_rss_mb': _peak_rss_mb()
+    }
+    return result, stats
+
+def run_update_pipeline(server: MockEchoesServer, work_dir: str, verbose: bool = False) -> list[dict]:
+    """
+    Runs one update_data.py pass (as in its __main__) against server inside work_dir,
+    followed by generate_json_from_directory. Returns the stats of each phase.
+    """
+    phases = []
+    items_to_update, all_items_data = _record(phases, _run_phase('items', server, work_dir, verbose, update_data.fetch_and_save_items))
+    if not all_items_data:
+        return phases
+    icon_flags_before = bytes(all_items_data.icon_downloaded)
+    all_items_data = _record(phases, _run_phase('icons', server, work_dir, verbose, update_data.download_item_icons, all_items_data))
+    current_prices = _record(phases, _run_phase('prices', server, work_dir, verbose, update_data.load_all_current_prices))
+    _record(phases, _run_phase('save_items', server, work_dir, verbose, update_data.save_items_after_icon_download,
+                               all_items_data, icon_flags_before))
+    _record(phases, _run_phase('histories', server, work_dir, verbose, update_data.fetch_and_save_histories,
+                               items_to_update, current_prices, items_by_id=all_items_data))
+    _record(phases, _run_phase('generate_json', server, work_dir, verbose, generate_json_from_directory,
+                               update_data.HISTORIES_BASE_DIR, 'item_data.json',
+                               item_lists_csv_path=update_data.ITEMS_OUTPUT_CSV_FILE, icons_dir=update_data.ICONS_BASE_DIR))
+    return phases
+
+def _record(phases: list[dict], phase_result: tuple):
+    result, stats = phase_result
+    phases.append(stats)
+    return result
+
+def _total(phases: list[dict]) -> dict:
+    total = {'phase': 'total'}
+    for key in ('wall_seconds', 'requests', 'errors_injected', 'throttled', 'not_modified', 'bytes_received', 'files_written', 'bytes_written'):
+        total[key] = sum(phase[key] for phase in phases)
+    total['wall_seconds'] = round(total['wall_seconds'], 3)
+    total['requests_per_second'] = round(total['requests'] / total['wall_seconds'], 1) if total['wall_seconds'] > 0 else None
+    total['peak_rss_mb'] = max((phase['peak_rss_mb'] for phase in phases if phase['peak_rss_mb'] is not None), default=None)
+    return total
+
+def run_benchmark(num_items: int, runs: int = 2, seed: int = 0, latency_seconds: float = 0.0, jitter_seconds: float = 0.0,
+                  error_rate: float = 0.0, items_per_page: int = ITEMS_PER_PAGE, history_weeks: int = HISTORY_WEEKS,
+                  update_fraction: float = 0.1, max_requests_per_second: float = 0, server_requests_per_second: float = 0,
+                  work_dir: str | None = None, verbose: bool = False) -> dict:
+    """
+    Benchmarks update_data.py end to end against a MockEchoesServer in a scratch directory.
+    The first run starts from an empty tree (cold); each further run bumps the server's
+    generation so update_fraction of the items get a new weekly price (warm).
+    max_requests_per_second replaces http_client's global cap for the benchmark (0 disables it);
+    the adaptive rate controller still applies and is reset for every run.
+    Returns a report with the configuration, per-phase stats and the run_metrics report
+    (per-endpoint latency histograms, retries, errors) of every run.
+    """
+    server = MockEchoesServer(num_items, seed=seed, latency_seconds=latency_seconds, jitter_seconds=jitter_seconds,
+                              error_rate=error_rate, items_per_page=items_per_page, history_weeks=history_weeks,
+                              update_fraction=update_fraction, server_requests_per_second=server_requests_per_second)
+    keep_work_dir = work_dir is not None
+    work_dir = os.path.abspath(work_dir or tempfile.mkdtemp(prefix='echoes_benchmark_'))
+    os.makedirs(work_dir, exist_ok=True)
+    original_dir = os.getcwd()
+    original_urls = (update_data.API_BASE_URL_ITEMS, update_data.API_BASE_URL_HISTORY, update_data.API_V2_ITEM_PRICES_URL)
+    original_rate_limiter = http_client.request_rate_limiter
+    original_rate_controller = http_client.rate_controller
+
+    server.start()
+    report = {
+        'config': {
+            'items': num_items, 'runs': runs, 'seed': seed, 'latency_seconds': latency_seconds,
+            'jitter_seconds': jitter_seconds, 'error_rate': error_rate, 'items_per_page': items_per_page,
+            'history_weeks': history_weeks, 'update_fraction': update_fraction,
+            'max_requests_per_second': max_requests_per_second, 'server_requests_per_second': server_requests_per_second,
+            'work_dir': work_dir
+        },
+        'runs': []
+    }
+    try:
+        update_data.API_BASE_URL_ITEMS = f"{server.base_url}/api/items"
+        update_data.API_BASE_URL_HISTORY = f"{server.base_url}/api/item_weekly_average_prices?page=1&itemId="
+        update_data.API_V2_ITEM_PRICES_URL = f"{server.base_url}/api/v2/item_prices"
+        http_client.request_rate_limiter = http_client.RequestRateLimiter(max_requests_per_second)
+        os.chdir(work_dir) # update_data.py and http_client.py use paths relative to the working directory
+        for run_number in range(runs):
+            server.generation = run_number
+            run_metrics.reset()
+            http_client.rate_controller = RateController() # Each update run starts with fresh budgets
+            phases = run_update_pipeline(server, work_dir, verbose)
+            run_metrics.set_section('rate_control', http_client.rate_controller.report())
+            report['runs'].append({'run': run_number + 1, 'kind': 'cold' if run_number == 0 else 'warm',
+                                   'phases': phases, 'total': _total(phases), 'metrics': run_metrics.report()})
+        # Write the HTTP validator cache into the scratch directory now rather than at exit
+        http_client.save_validator_cache()
+        http_client._validators = None
+    finally:
+        os.chdir(original_dir)
+        update_data.API_BASE_URL_ITEMS, update_data.API_BASE_URL_HISTORY, update_data.API_V2_ITEM_PRICES_URL = original_urls
+        http_client.request_rate_limiter = original_rate_limiter
+        http_client.rate_controller = original_rate_controller
+        server.stop()
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+def print_report(report: dict):
+    config = report['config']
+    print(f"Benchmark: {config['items']} items, latency {config['latency_seconds'] * 1000:.0f}ms "
+          f"(+{config['jitter_seconds'] * 1000:.0f}ms jitter), error rate {config['error_rate']:.1%}, "
+          f"client rate limit {config['max_requests_per_second'] or 'off'}, server rate limit {config['server_requests_per_second'] or 'off'}")
+    header = f"{'phase':<14}{'wall s':>9}{'requests':>10}{'req/s':>9}{'errors':>8}{'429s':>7}{'304s':>7}{'MB recv':>9}{'files':>8}{'MB written':>12}{'peak RSS MB':>13}"
+    for run in report['runs']:
+        print(f"\nRun {run['run']} ({run['kind']})")
+        print(header)
+        for phase in run['phases'] + [run['total']]:
+            rss = f"{phase['peak_rss_mb']:.1f}" if phase['peak_rss_mb'] is not None else 'n/a'
+            rate = f"{phase['requests_per_second']:.1f}" if phase['requests_per_second'] is not None else 'n/a'
+            print(f"{phase['phase']:<14}{phase['wall_seconds']:>9.2f}{phase['requests']:>10}{rate:>9}"
+                  f"{phase['errors_injected']:>8}{phase['throttled']:>7}{phase['not_modified']:>7}{phase['bytes_received'] / 1e6:>9.2f}"
+                  f"{phase['files_written']:>8}{phase['bytes_written'] / 1e6:>12.2f}{rss:>13}")
+        for name, budget in run['metrics'].get('rate_control', {}).items():
+            print(f"  rate control {name}: settled {budget['settled_requests_per_second']} req/s, "
+                  f"{budget['settled_concurrency']} in flight, {budget['decreases']} backoffs")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark update_data.py offline against a local mock of the echoes.mobi API.")
+    parser.add_argument('--items', type=int, default=1000, help="Catalog size served by the mock (e.g. 1000 to 100000)")
+    parser.add_argument('--runs', type=int, default=2, help="Runs against the same tree: the first is cold, the rest warm")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Delay added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="Random extra delay of up to this much")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument('--items-per-page', type=int, default=ITEMS_PER_PAGE)
+    parser.add_argument('--history-weeks', type=int, default=HISTORY_WEEKS, help="Rows in each full history")
+    parser.add_argument('--update-fraction', type=float, default=0.1, help="Share of items with a new price in each warm run")
+    parser.add_argument('--max-rps', type=float, default=0, help="Client request rate limit during the benchmark (0 disables it)")
+    parser.add_argument('--server-rps', type=float, default=0, help="Answer requests beyond this many per second with 429 (0 disables it)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="Keep the generated tree in this directory instead of a temporary one")
+    parser.add_argument('--json', help="Also write the report as JSON to this file")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    benchmark_report = run_benchmark(args.items, runs=args.runs, seed=args.seed, latency_seconds=args.latency_ms / 1000,
+                                     jitter_seconds=args.jitter_ms / 1000, error_rate=args.error_rate,
+                                     items_per_page=args.items_per_page, history_weeks=args.history_weeks,
+                                     update_fraction=args.update_fraction, max_requests_per_second=args.max_rps,
+                                     server_requests_per_second=args.server_rps,
+                                     work_dir=args.work_dir, verbose=args.verbose)
+    print_report(benchmark_report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(benchmark_report, f, indent=2)
+        print(f"\nReport written to {args.json}")
@@ -0,0 +1,185 @@
+import os
+import csv
+import json
+import argparse
+from datetime import date
+import numpy as np
+
+from history_store import HistoryStore
+
+# Configuration
+ITEM_DATA_JSON_FILE = "item_data.json"
+ITEM_STATS_JSON_FILE = "item_stats.json"
+CHANGE_PERIODS_DAYS = (7, 30, 90)
+SMA_PERIODS_DAYS = (7, 14, 30) # Same day-window SMA as calculateSMA in scripts.js
+SECONDS_PER_DAY = 86400
+EPOCH_DATE = date(1970, 1, 1)
+
+def iter_history_entries(item_data: dict):
+    """
+    Yields every leaf entry ({'history_path', 'icon_path'}) of the nested item_data.json structure.
+    """
+    for value in item_data.values():
+        if isinstance(value, dict):
+            if 'history_path' in value:
+                yield value
+            else:
+                yield from iter_history_entries(value)
+
+def _read_series_from_csv(history_file_path: str) -> tuple[list[int], list[float]]:
+    """
+    Returns (days since epoch of date_created, prices) for one history CSV.
+    Rows with an unparsable date are skipped; unparsable prices become NaN.
+    """
+    days = []
+    prices = []
+    with open(history_file_path, mode='r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        try:
+            price_index = header.index('price')
+            date_index = header.index('date_created')
+        except ValueError:
+            return days, prices
+        for row in reader:
+            try:
+                day = (date.fromisoformat(row[date_index][:10]) - EPOCH_DATE).days
+            except (IndexError, ValueError):
+                continue
+            try:
+                price = float(row[price_index])
+            except ValueError:
+                price = float('nan')
+            days.append(day)
+            prices.append(price)
+    return days, prices
+
+def load_price_series(history_path: str, history_store: HistoryStore = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns one item's (days since epoch, prices) as int64 and float64 arrays, in file order.
+    The series is read from history_store when it holds the item (keyed by the item ID in the
+    file name) for this very file, otherwise from the CSV file: an item with history files in two
+    directories has only one of them in the store. Missing or unreadable files give empty arrays.
+    """
+    item_id = os.path.basename(history_path)[:-len("_history.csv")]
+    store_entry = history_store.items.get(item_id) if history_store is not None else None
+    if store_entry and store_entry.get('path') and os.path.normpath(store_entry['path']) == os.path.normpath(history_path):
+        records = history_store.read_item(item_id)
+        return records['date_created'] // SECONDS_PER_DAY, np.asarray(records['price'], dtype=np.float64)
+    days, prices = [], []
+    if os.path.exists(history_path):
+        try:
+            days, prices = _read_series_from_csv(history_path)
+        except (OSError, csv.Error) as e:
+            print(f"Error reading {history_path}: {e}. Skipping.")
+    return np.asarray(days, dtype=np.int64), np.asarray(prices, dtype=np.float64)
+
+def load_price_matrix(history_paths: list[str], history_store: HistoryStore = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Loads every history into two (items x max_points) float64 arrays, (days, prices).
+    Rows are in date order (stable for same-day points, as a history file may be out of order) and
+    right-aligned so column -1 holds each item's latest point; missing points (and rows without a price)
+    are NaN-padded on the left.
+    """
+    series = []
+    for history_path in history_paths:
+        days, prices = load_price_series(history_path, history_store)
+        order = np.argsort(days, kind='stable')
+        days, prices = days[order], prices[order]
+        has_price = ~np.isnan(prices)
+        series.append((days[has_price], prices[has_price]))
+
+    # At least one column, so an empty catalog still yields well-formed matrices
+    max_points = max((len(prices) for _, prices in series), default=1) or 1
+    days_matrix = np.full((len(series), max_points), np.nan)
+    price_matrix = np.full((len(series), max_points), np.nan)
+    for row, (days, prices) in enumerate(series):
+        if len(prices):
+            days_matrix[row, max_points - len(prices):] = days
+            price_matrix[row, max_points - len(prices):] = prices
+    return days_matrix, price_matrix
+
+def _value_at_or_before(days: np.ndarray, prices: np.ndarray, valid: np.ndarray, cutoff_days: np.ndarray) -> np.ndarray:
+    """
+    For each row, returns the last valid price dated on or before that row's cutoff day (NaN if none).
+    """
+    mask = valid & (days <= cutoff_days[:, None])
+    last_index = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+    values = prices[np.arange(len(prices)), last_index]
+    return np.where(mask.any(axis=1), values, np.nan)
+
+def compute_item_stats(days: np.ndarray, prices: np.ndarray) -> dict:
+    """
+    Computes the summary statistics for every row of right-aligned (days, prices) matrices in one pass.
+    Returns a dict of 1-D arrays, one value per item.
+    """
+    valid = ~np.isnan(prices)
+    point_counts = valid.sum(axis=1)
+    has_data = point_counts > 0
+    first_index = np.minimum(prices.shape[1] - point_counts, prices.shape[1] - 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        latest = prices[:, -1]
+        latest_day = days[:, -1]
+        first = prices[np.arange(len(prices)), first_index]
+        high = np.where(has_data, np.max(np.where(valid, prices, -np.inf), axis=1, initial=-np.inf), np.nan)
+        low = np.where(has_data, np.min(np.where(valid, prices, np.inf), axis=1, initial=np.inf), np.nan)
+
+        stats = {
+            'points': point_counts,
+            'latest': latest,
+            'latest_day': latest_day,
+            'first': first,
+            'high': high,
+            'low': low
+        }
+        for period in CHANGE_PERIODS_DAYS:
+            base = _value_at_or_before(days, prices, valid, latest_day - period)
+            stats[f'change_{period}d'] = np.where(base != 0, (latest - base) / base * 100, np.nan)
+        for period in SMA_PERIODS_DAYS:
+            window = valid & (days >= (latest_day - (period - 1))[:, None])
+            stats[f'sma_{period}'] = np.where(window, prices, 0).sum(axis=1) / window.sum(axis=1)
+    return stats
+
+def _json_number(value):
+    return None if not np.isfinite(value) else round(float(value), 2)
+
+def build_item_stats(item_data_json_file: str = ITEM_DATA_JSON_FILE, output_file: str = ITEM_STATS_JSON_FILE):
+    """
+    Writes one compact JSON file with the latest price, changes, min/max and SMAs of every item,
+    keyed by the history_path emitted by generate_item_json.py.
+    """
+    with open(item_data_json_file, 'r', encoding='utf-8') as f:
+        history_paths = [entry['history_path'] for entry in iter_history_entries(json.load(f))]
+
+    history_store = HistoryStore() if HistoryStore.exists() else None
+    days, prices = load_price_matrix(history_paths, history_store)
+    stats = compute_item_stats(days, prices)
+
+    item_stats = {}
+    for row, history_path in enumerate(history_paths):
+        if not stats['points'][row]:
+            continue
+        item_stats[history_path] = {
+            'latest': _json_number(stats['latest'][row]),
+            'latest_date': date.fromordinal(EPOCH_DATE.toordinal() + int(stats['latest_day'][row])).isoformat(),
+            'first': _json_number(stats['first'][row]),
+            'high': _json_number(stats['high'][row]),
+            'low': _json_number(stats['low'][row]),
+            'points': int(stats['points'][row]),
+            'change': {str(period): _json_number(stats[f'change_{period}d'][row]) for period in CHANGE_PERIODS_DAYS},
+            'sma': {str(period): _json_number(stats[f'sma_{period}'][row]) for period in SMA_PERIODS_DAYS}
+        }
+
+    # Written via a temp file so the site never serves a truncated item_stats.json
+    with open(output_file + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(item_stats, separators=(',', ':')))
+    os.replace(output_file + '.tmp', output_file)
+    print(f"Wrote stats for {len(item_stats)} of {len(history_paths)} items to {output_file}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute per-item summary stats for the dashboard.")
+    parser.add_argument('--item-data', default=ITEM_DATA_JSON_FILE)
+    parser.add_argument('--output', default=ITEM_STATS_JSON_FILE)
+    args = parser.parse_args()
+    build_item_stats(args.item_data, args.output)
@@ -0,0 +1,217 @@
+import os
+import json
+import gzip
+import argparse
+from datetime import date, timedelta
+import numpy as np
+
+from history_store import HistoryStore
+from build_item_stats import ITEM_DATA_JSON_FILE, EPOCH_DATE, iter_history_entries, load_price_series
+
+try:
+    import brotli # Optional: only needed for the .br variants
+except ImportError:
+    brotli = None
+
+# Configuration
+HISTORY_BUNDLES_DIR = "history_bundles"
+HISTORY_BUNDLES_INDEX_FILE = "index.json"
+BUNDLE_FORMAT_VERSION = 2
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+CHART_POINT_BUDGET = 200 # Same as CHART_POINT_BUDGET in scripts.js; longer series also get monthly and LTTB versions
+TIMEFRAME_MONTHS = {'30D': 0, '3M': 3, '6M': 6, '1Y': 12} # Timeframe buttons of the chart; 30D goes back 30 days instead
+
+def shard_name_for_history_path(history_path: str) -> str:
+    """
+    Returns the shard a history belongs to: one per category/group, taken from the
+    item_histories/<category>/<group>/<item>/<id>_history.csv path emitted by generate_item_json.py.
+    """
+    parts = history_path.split('/')
+    return '/'.join(parts[1:3]) if len(parts) >= 5 else '_ungrouped'
+
+def encode_series(days: np.ndarray, prices: np.ndarray) -> dict:
+    """
+    Packs one series as numeric arrays: the first date as days since epoch ('d0'),
+    the day gap to each following point ('dd', small integers) and the prices ('p', null where missing).
+    """
+    if not len(days):
+        return {'d0': None, 'dd': [], 'p': []}
+    return {
+        'd0': int(days[0]),
+        'dd': np.diff(days).astype(int).tolist(),
+        'p': [None if price != price else round(price, 2) for price in prices.tolist()]
+    }
+
+def timeframe_start_day(last_day: int, timeframe: str) -> int:
+    """
+    Returns the first day (since epoch) shown by a timeframe button for a series ending on last_day,
+    with the calendar arithmetic of the old filterDataByTimeframe in scripts.js: 30 days back, or the
+    same day of month N months back, overflowing into the next month as Date.setMonth does (May 31 - 3M = Mar 3).
+    """
+    last_date = EPOCH_DATE + timedelta(days=int(last_day))
+    months = TIMEFRAME_MONTHS[timeframe]
+    if not months:
+        return int(last_day) - 30
+    month_index = last_date.year * 12 + last_date.month - 1 - months
+    start_date = date(month_index // 12, month_index % 12 + 1, 1) + timedelta(days=last_date.day - 1)
+    return (start_date - EPOCH_DATE).days
+
+def timeframe_offsets(days: np.ndarray) -> dict:
+    """Returns the index of the first point of each timeframe in a chronological series of days."""
+    if not len(days):
+        return {}
+    return {timeframe: int(np.searchsorted(days, timeframe_start_day(days[-1], timeframe), side='left')) for timeframe in TIMEFRAME_MONTHS}
+
+def monthly_ohlc(days: np.ndarray, prices: np.ndarray) -> dict:
+    """
+    Aggregates a series per calendar month into open/high/low/close prices ('o', 'h', 'l', 'c'), each month
+    dated by its last point, encoded like encode_series. Points without a price are left out.
+    """
+    valid = ~np.isnan(prices)
+    days, prices = days[valid], prices[valid]
+    if not len(days):
+        return {'d0': None, 'dd': [], 'o': [], 'h': [], 'l': [], 'c': [], 'tf': {}}
+    months = days.astype('datetime64[D]').astype('datetime64[M]')
+    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    ends = np.r_[starts[1:], len(days)] - 1
+    month_days = days[ends]
+    encoded = encode_series(month_days, prices[ends])
+    return {
+        'd0': encoded['d0'],
+        'dd': encoded['dd'],
+        'o': np.round(prices[starts], 2).tolist(),
+        'h': np.round(np.maximum.reduceat(prices, starts), 2).tolist(),
+        'l': np.round(np.minimum.reduceat(prices, starts), 2).tolist(),
+        'c': encoded['p'],
+        'tf': timeframe_offsets(month_days)
+    }
+
+def lttb_indices(days: np.ndarray, prices: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling: returns the indices of threshold points (first and
+    last included) that keep the visual shape of the line. Series within the threshold are returned whole.
+    """
+    n = len(days)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = days.astype(np.float64)
+    bucket_size = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, n)
+        if next_start >= next_end: # The last bucket is averaged against the final point
+            next_start, next_end = n - 1, n
+        average_x, average_y = x[next_start:next_end].mean(), prices[next_start:next_end].mean()
+        areas = np.abs((x[previous] - average_x) * (prices[start:end] - prices[previous])
+                       - (x[previous] - x[start:end]) * (average_y - prices[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def encode_multi_resolution(days: np.ndarray, prices: np.ndarray, point_budget: int = CHART_POINT_BUDGET) -> dict:
+    """
+    Packs one series with its timeframe start offsets ('tf'). Series longer than point_budget also get
+    monthly OHLC aggregates ('m', see monthly_ohlc) and an LTTB downsampling to point_budget points
+    ('l', priced points only), each with its own offsets, so the chart never has to plot more.
+    Points are put in date order first (stably, keeping the file order of same-day rows), since the
+    offsets and monthly grouping rely on it and a history file may be out of order (see fsck_histories.py).
+    """
+    order = np.argsort(days, kind='stable')
+    days, prices = days[order], prices[order]
+    series = encode_series(days, prices)
+    series['tf'] = timeframe_offsets(days)
+    if len(days) > point_budget:
+        series['m'] = monthly_ohlc(days, prices)
+        valid = ~np.isnan(prices)
+        priced_days, priced_prices = days[valid], prices[valid]
+        selected = lttb_indices(priced_days, priced_prices, point_budget)
+        series['l'] = encode_series(priced_days[selected], priced_prices[selected])
+        series['l']['tf'] = timeframe_offsets(priced_days[selected])
+    return series
+
+def _write_if_changed(path: str, data: bytes) -> bool:
+    """
+    Writes data to path (via a temp file) unless the file already holds exactly that content,
+    so unchanged shards keep their mtime and HTTP validators.
+    """
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return True
+
+def _write_with_variants(path: str, data: bytes) -> bool:
+    """
+    Writes path plus its precompressed .gz (and .br when brotli is installed) variants.
+    Returns True if the content changed.
+    """
+    if not _write_if_changed(path, data):
+        return False
+    # mtime=0 keeps the gzip output byte-identical for identical input
+    _write_if_changed(path + '.gz', gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+    if brotli is not None:
+        _write_if_changed(path + '.br', brotli.compress(data, quality=BROTLI_QUALITY))
+    return True
+
+def bundle_histories(item_data_json_file: str = ITEM_DATA_JSON_FILE, bundles_dir: str = HISTORY_BUNDLES_DIR,
+                     point_budget: int = CHART_POINT_BUDGET):
+    """
+    Packs every history listed in item_data.json into one JSON shard per category/group
+    (<bundles_dir>/<category>/<group>.json, with .gz/.br variants) and writes an index
+    mapping each history_path to [shard number, offset of its series within the shard].
+    Each series carries its chart resolutions, see encode_multi_resolution.
+    """
+    with open(item_data_json_file, 'r', encoding='utf-8') as f:
+        history_paths = [entry['history_path'] for entry in iter_history_entries(json.load(f))]
+
+    shards = {}
+    for history_path in history_paths:
+        shards.setdefault(shard_name_for_history_path(history_path), []).append(history_path)
+
+    history_store = HistoryStore() if HistoryStore.exists() else None
+    shard_files = []
+    index_items = {}
+    shards_written = 0
+    for shard_number, shard_name in enumerate(sorted(shards)):
+        shard_file = shard_name + '.json'
+        series = []
+        for offset, history_path in enumerate(shards[shard_name]):
+            series.append(encode_multi_resolution(*load_price_series(history_path, history_store), point_budget))
+            index_items[history_path] = [shard_number, offset]
+        data = json.dumps({'version': BUNDLE_FORMAT_VERSION, 'series': series}, separators=(',', ':')).encode('utf-8')
+        if _write_with_variants(os.path.join(bundles_dir, shard_file), data):
+            shards_written += 1
+        shard_files.append(shard_file)
+
+    index = {'version': BUNDLE_FORMAT_VERSION, 'shards': shard_files, 'items': index_items}
+    _write_with_variants(os.path.join(bundles_dir, HISTORY_BUNDLES_INDEX_FILE),
+                         json.dumps(index, separators=(',', ':')).encode('utf-8'))
+
+    # Remove shards of categories/groups that no longer exist
+    expected_files = {os.path.normpath(os.path.join(bundles_dir, name)) for name in shard_files + [HISTORY_BUNDLES_INDEX_FILE]}
+    for dirpath, _, filenames in os.walk(bundles_dir):
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(dirpath, filename))
+            base_path = path[:-len(os.path.splitext(path)[1])] if path.endswith(('.gz', '.br')) else path
+            if base_path not in expected_files:
+                os.remove(path)
+
+    print(f"Bundled {len(index_items)} histories into {len(shard_files)} shards in {bundles_dir} ({shards_written} rewritten).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack item histories into per-category/group bundles for the frontend.")
+    parser.add_argument('--item-data', default=ITEM_DATA_JSON_FILE)
+    parser.add_argument('--output-dir', default=HISTORY_BUNDLES_DIR)
+    parser.add_argument('--point-budget', type=int, default=CHART_POINT_BUDGET, help="Most points the chart plots; longer series get downsampled versions")
+    args = parser.parse_args()
+    bundle_histories(args.item_data, args.output_dir, args.point_budget)
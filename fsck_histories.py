@@ -0,0 +1,332 @@
+import os
+import csv
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Only light modules here: every worker process imports this one
+from history_store import HistoryStore, iso_to_epoch, sanitize_for_path, HISTORIES_BASE_DIR, HISTORY_CSV_HEADERS
+
+# Configuration
+ITEMS_CSV_FILE = "item_lists.csv"
+FSCK_INDEX_FILE = os.path.join(".update_state", "fsck_index.json") # Per-file check results, reused while size and mtime match
+FSCK_WORKERS = os.cpu_count() or 1
+FSCK_CHUNK_SIZE = 64 # Items handed to a worker process at a time
+FSCK_LISTED_TREES = 20 # Duplicated directory pairs printed in the summary (all are in the returned summary)
+HISTORY_FILE_SUFFIX = "_history.csv"
+PROBLEM_KINDS = ('unreadable', 'malformed_rows', 'foreign_rows', 'repeated_ids', 'duplicate_weeks', 'out_of_order')
+
+def _to_int(value, default=None):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def read_history_rows(history_file_path: str) -> tuple[list[dict], int]:
+    """
+    Reads a history CSV. Returns its well-formed rows (dicts with exactly HISTORY_CSV_HEADERS)
+    and the number of malformed lines (too few or too many fields) that were left out.
+    Raises ValueError if the header lacks any of HISTORY_CSV_HEADERS.
+    """
+    with open(history_file_path, mode='r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or any(header not in reader.fieldnames for header in HISTORY_CSV_HEADERS):
+            raise ValueError(f"unexpected header {reader.fieldnames}")
+        rows = []
+        malformed_rows = 0
+        for row in reader:
+            if None in row or any(row.get(header) is None for header in HISTORY_CSV_HEADERS):
+                malformed_rows += 1
+                continue
+            rows.append({header: row[header] for header in HISTORY_CSV_HEADERS})
+    return rows, malformed_rows
+
+def find_problems(item_id: str, rows: list[dict]) -> Counter:
+    """
+    Counts the rows of one item's history that break its invariants: rows of another item,
+    row ids or ISO weeks seen earlier in the file, and rows dated before an earlier row.
+    """
+    problems = Counter()
+    seen_ids = set()
+    seen_weeks = set()
+    latest_date_created = None
+    for row in rows:
+        if row['item_id'] != item_id:
+            problems['foreign_rows'] += 1
+            continue
+        if row['id'] in seen_ids:
+            problems['repeated_ids'] += 1
+        seen_ids.add(row['id'])
+        week_key = (row['year'], row['week'].lstrip('0'))
+        if week_key in seen_weeks:
+            problems['duplicate_weeks'] += 1
+        seen_weeks.add(week_key)
+        date_created = iso_to_epoch(row['date_created'])
+        if latest_date_created is not None and date_created < latest_date_created:
+            problems['out_of_order'] += 1
+        latest_date_created = date_created if latest_date_created is None else max(latest_date_created, date_created)
+    return problems
+
+def normalize_rows(item_id: str, rows: list[dict]) -> list[dict]:
+    """
+    Returns the item's rows sorted by date_created, with rows of other items and exact duplicates dropped,
+    one row per ISO week (the most recently updated one, as the weekly average only changes until the week
+    closes) and repeated row ids renumbered after the highest id.
+    """
+    rows = [row for row in rows if row['item_id'] == item_id]
+    rows = list({tuple(row[header] for header in HISTORY_CSV_HEADERS): row for row in rows}.values())
+    rows.sort(key=lambda row: (iso_to_epoch(row['date_created']), iso_to_epoch(row['date_updated']), _to_int(row['id'], 0)))
+
+    latest_by_week = {}
+    for position, row in enumerate(rows):
+        week_key = (row['year'], row['week'].lstrip('0'))
+        kept = latest_by_week.get(week_key)
+        if kept is None or iso_to_epoch(row['date_updated']) >= iso_to_epoch(rows[kept]['date_updated']):
+            latest_by_week[week_key] = position
+    rows = [rows[position] for position in sorted(latest_by_week.values())]
+
+    next_id = max((_to_int(row['id'], 0) for row in rows), default=0) + 1
+    seen_ids = set()
+    for row in rows:
+        if row['id'] in seen_ids or _to_int(row['id']) is None:
+            row['id'] = str(next_id)
+            next_id += 1
+        seen_ids.add(row['id'])
+    return rows
+
+def _file_entry(history_file_path: str, item_id: str, rows: int, problems: Counter) -> dict:
+    file_stat = os.stat(history_file_path)
+    return {'item_id': item_id, 'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'rows': rows, 'problems': dict(problems)}
+
+def check_item(task: tuple[str, list[str]]) -> dict:
+    """Checks every history file of one item (worker process). Returns {path: index entry}."""
+    item_id, history_file_paths = task
+    entries = {}
+    for history_file_path in history_file_paths:
+        try:
+            rows, malformed_rows = read_history_rows(history_file_path)
+        except (OSError, ValueError, csv.Error):
+            entries[history_file_path] = _file_entry(history_file_path, item_id, 0, Counter(unreadable=1))
+            continue
+        problems = find_problems(item_id, rows)
+        if malformed_rows:
+            problems['malformed_rows'] = malformed_rows
+        entries[history_file_path] = _file_entry(history_file_path, item_id, len(rows), problems)
+    return entries
+
+def _remove_empty_dirs(directory: str, stop_dir: str):
+    stop_dir = os.path.abspath(stop_dir)
+    while os.path.abspath(directory) != stop_dir and os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+def fix_item(task: tuple[str, list[str], str, str, bool]) -> dict:
+    """
+    Merges every history file of one item into canonical_path (worker process): rows of all copies
+    are combined and normalized (see normalize_rows), written via a temp file, and the other copies
+    removed along with directories left empty. Unreadable copies are left in place.
+    Returns {'entries': {path: index entry}, 'removed': [paths], 'rows': rows if return_rows else None}.
+    """
+    item_id, history_file_paths, canonical_path, histories_dir, return_rows = task
+    all_rows = []
+    merged_paths = []
+    for history_file_path in history_file_paths:
+        try:
+            rows, _ = read_history_rows(history_file_path)
+        except (OSError, ValueError, csv.Error):
+            continue
+        all_rows.extend(rows)
+        merged_paths.append(history_file_path)
+    if not merged_paths:
+        return {'entries': check_item((item_id, history_file_paths)), 'removed': [], 'rows': None}
+
+    rows = normalize_rows(item_id, all_rows)
+    os.makedirs(os.path.dirname(canonical_path), exist_ok=True)
+    temp_path = canonical_path + '.tmp'
+    with open(temp_path, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_CSV_HEADERS, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, canonical_path)
+
+    removed = []
+    for history_file_path in merged_paths:
+        if os.path.abspath(history_file_path) != os.path.abspath(canonical_path):
+            os.remove(history_file_path)
+            _remove_empty_dirs(os.path.dirname(history_file_path), histories_dir)
+            removed.append(history_file_path)
+    remaining_paths = [path for path in history_file_paths if path not in removed and path != canonical_path]
+    entries = check_item((item_id, [canonical_path] + remaining_paths))
+    return {'entries': entries, 'removed': removed, 'rows': rows if return_rows else None}
+
+def find_history_files(histories_dir: str = HISTORIES_BASE_DIR) -> dict:
+    """Returns every history file under histories_dir grouped by item ID (from the file name): {item_id: [paths]}."""
+    paths_by_item = {}
+    for dirpath, _, filenames in os.walk(histories_dir):
+        for filename in filenames:
+            if filename.endswith(HISTORY_FILE_SUFFIX):
+                paths_by_item.setdefault(filename[:-len(HISTORY_FILE_SUFFIX)], []).append(os.path.join(dirpath, filename))
+    for paths in paths_by_item.values():
+        paths.sort()
+    return paths_by_item
+
+def canonical_history_paths(histories_dir: str = HISTORIES_BASE_DIR, items_csv_path: str = ITEMS_CSV_FILE) -> dict:
+    """Returns the path update_data.py writes each item's history to, from item_lists.csv: {item_id: path}."""
+    paths = {}
+    if os.path.exists(items_csv_path):
+        with open(items_csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                item_id = row.get('id')
+                if item_id:
+                    paths[item_id] = os.path.join(histories_dir, sanitize_for_path(row.get('category_name', 'UnknownCategory')),
+                                                  sanitize_for_path(row.get('group_name', 'UnknownGroup')),
+                                                  sanitize_for_path(row.get('name', f'UnknownItem_{item_id}')),
+                                                  f"{sanitize_for_path(item_id)}{HISTORY_FILE_SUFFIX}")
+    return paths
+
+def _group_dir(history_file_path: str, histories_dir: str) -> str:
+    """The <category>/<group> part of an item_histories/<category>/<group>/<item>/<id>_history.csv path."""
+    return os.path.dirname(os.path.dirname(os.path.relpath(history_file_path, histories_dir)))
+
+def fsck_histories(fix: bool = False, workers: int = FSCK_WORKERS, histories_dir: str = HISTORIES_BASE_DIR,
+                   index_path: str = FSCK_INDEX_FILE, items_csv_path: str = ITEMS_CSV_FILE, full: bool = False) -> dict:
+    """
+    Checks every history file under histories_dir with a pool of worker processes for unreadable files,
+    malformed lines, rows of other items, repeated row ids, duplicate ISO weeks, rows out of date order,
+    and items with history files in more than one directory (e.g. after a category was renamed,
+    Ship/Carriers and Ship/Carrier). Files whose size and mtime match index_path from an earlier run
+    are not read again unless full is set.
+    With fix, the affected items are rewritten in the worker processes: each item's copies are merged into
+    the path update_data.py uses for it (from item_lists.csv, else the most recently written copy),
+    sorted, and deduplicated (see normalize_rows). The history store and indicator cache, when built,
+    are updated for the rewritten items.
+    Returns the summary that is also printed.
+    """
+    start = time.perf_counter()
+    index = {}
+    if os.path.exists(index_path) and not full:
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {index_path}: {e}. Checking every history file.")
+
+    paths_by_item = find_history_files(histories_dir)
+    entries = {}
+    tasks = []
+    for item_id, history_file_paths in paths_by_item.items():
+        cached = []
+        for history_file_path in history_file_paths:
+            entry = index.get(history_file_path)
+            file_stat = os.stat(history_file_path)
+            if entry and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns:
+                cached.append(entry)
+        if len(cached) == len(history_file_paths):
+            entries.update(zip(history_file_paths, cached))
+        else:
+            tasks.append((item_id, history_file_paths))
+
+    workers = max(workers, 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for item_entries in executor.map(check_item, tasks, chunksize=FSCK_CHUNK_SIZE):
+            entries.update(item_entries)
+
+        duplicated_items = {item_id: paths for item_id, paths in paths_by_item.items() if len(paths) > 1}
+        items_with_problems = {item_id for item_id, paths in paths_by_item.items() if any(entries[path]['problems'] for path in paths)}
+        problem_files = Counter()
+        problem_rows = Counter()
+        for paths in paths_by_item.values():
+            for path in paths:
+                for kind, count in entries[path]['problems'].items():
+                    problem_files[kind] += 1
+                    problem_rows[kind] += count
+        duplicated_trees = Counter()
+        for paths in duplicated_items.values():
+            group_dirs = sorted({_group_dir(path, histories_dir) for path in paths})
+            duplicated_trees[' vs '.join(group_dirs) if len(group_dirs) > 1 else f"{group_dirs[0]} (several item directories)"] += 1
+
+        summary = {
+            'items': len(paths_by_item),
+            'files': sum(len(paths) for paths in paths_by_item.values()),
+            'files_checked': sum(len(paths) for _, paths in tasks),
+            'items_with_problems': len(items_with_problems),
+            'problem_files': {kind: problem_files[kind] for kind in PROBLEM_KINDS if problem_files[kind]},
+            'problem_rows': {kind: problem_rows[kind] for kind in PROBLEM_KINDS if problem_rows[kind]},
+            'duplicated_items': len(duplicated_items),
+            'duplicated_trees': dict(duplicated_trees.most_common()),
+            'items_fixed': 0,
+            'files_removed': 0
+        }
+
+        if fix and (duplicated_items or items_with_problems):
+            canonical_paths = canonical_history_paths(histories_dir, items_csv_path)
+            try:
+                from indicator_cache import IndicatorCache # Needs NumPy; the indicator cache is optional
+            except ImportError:
+                IndicatorCache = None
+            history_store = HistoryStore() if HistoryStore.exists() else None
+            indicator_cache = IndicatorCache() if IndicatorCache is not None and IndicatorCache.exists() else None
+            fix_tasks = []
+            for item_id in sorted(items_with_problems | set(duplicated_items)):
+                paths = paths_by_item[item_id]
+                canonical_path = paths[0] if len(paths) == 1 else canonical_paths.get(item_id)
+                if not canonical_path:
+                    canonical_path = max(paths, key=lambda path: os.stat(path).st_mtime_ns)
+                fix_tasks.append((item_id, paths, canonical_path, histories_dir, history_store is not None))
+            print(f"Fixing {len(fix_tasks)} items with {workers} worker processes...")
+            for fix_task, result in zip(fix_tasks, executor.map(fix_item, fix_tasks, chunksize=FSCK_CHUNK_SIZE)):
+                item_id, canonical_path = fix_task[0], fix_task[2]
+                for removed_path in result['removed']:
+                    entries.pop(removed_path, None)
+                entries.update(result['entries'])
+                summary['files_removed'] += len(result['removed'])
+                summary['items_fixed'] += 1
+                if history_store is not None and result['rows'] is not None:
+                    history_store.replace_item(item_id, result['rows'], canonical_path)
+                if indicator_cache is not None:
+                    indicator_cache.mark_for_rebuild(item_id, canonical_path)
+            if history_store is not None:
+                history_store.save_index()
+            if indicator_cache is not None:
+                indicator_cache.refresh(history_store=history_store)
+
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({path: entry for path, entry in entries.items() if os.path.exists(path)}, f)
+    os.replace(temp_path, index_path)
+    summary['elapsed_seconds'] = round(time.perf_counter() - start, 2)
+
+    unchanged_files = summary['files'] - summary['files_checked']
+    print(f"Checked {summary['files_checked']} of {summary['files']} history files ({summary['items']} items) in {summary['elapsed_seconds']}s"
+          + (f"; {unchanged_files} were unchanged since the last check." if unchanged_files else "."))
+    for kind in PROBLEM_KINDS:
+        if problem_files[kind]:
+            print(f"  {kind}: {problem_rows[kind]} in {problem_files[kind]} files")
+    if duplicated_items:
+        print(f"  {len(duplicated_items)} items have history files in more than one directory:")
+        for trees, item_count in duplicated_trees.most_common(FSCK_LISTED_TREES):
+            print(f"    {trees}: {item_count} items")
+        if len(duplicated_trees) > FSCK_LISTED_TREES:
+            print(f"    ... and {len(duplicated_trees) - FSCK_LISTED_TREES} more")
+    if not items_with_problems and not duplicated_items:
+        print("No problems found.")
+    elif fix:
+        print(f"Fixed {summary['items_fixed']} items and removed {summary['files_removed']} duplicate history files.")
+        if summary['files_removed']:
+            print("Run generate_item_json.py to point item_data.json at the remaining history files.")
+    else:
+        print("Run with --fix to merge, sort and deduplicate the affected histories.")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check item history CSVs for duplicate, out-of-order and misplaced rows, and optionally fix them.")
+    parser.add_argument('--fix', action='store_true', help="Merge each affected item's history files into one sorted, deduplicated file")
+    parser.add_argument('--workers', type=int, default=FSCK_WORKERS, help=f"Worker processes (default: {FSCK_WORKERS})")
+    parser.add_argument('--histories-dir', default=HISTORIES_BASE_DIR, help=f"History CSV directory (default: {HISTORIES_BASE_DIR})")
+    parser.add_argument('--index', default=FSCK_INDEX_FILE, help=f"Check results reused for unchanged files (default: {FSCK_INDEX_FILE})")
+    parser.add_argument('--full', action='store_true', help="Check every file, ignoring results from earlier runs")
+    args = parser.parse_args()
+    fsck_histories(fix=args.fix, workers=args.workers, histories_dir=args.histories_dir, index_path=args.index, full=args.full)
@@ -2,6 +2,21 @@ import os
 import json
 import csv
 import re
+import argparse
+
+from search_index import build_search_index
+from run_metrics import run_metrics, profiled
+try:
+    # Need NumPy; item_stats.json and the history bundles are optional for the frontend
+    from build_item_stats import build_item_stats
+    from bundle_histories import bundle_histories
+except ImportError:
+    build_item_stats = bundle_histories = None
+
+GENERATOR_MANIFEST_FILE = os.path.join(".update_state", "item_data_manifest.json")
+GENERATE_REPORT_FILE = os.path.join(".update_state", "generate_report.json")
+CATALOG_DIR = "item_catalog" # Sharded catalog for the frontend: manifest.json, lookup.json, categories/*.json
+CATALOG_LOOKUP_COLUMNS = ['id', 'name', 'history_path', 'icon_path']
 
 # Ensure this is at the top-level of the script for generate_item_json.py
 def sanitize_for_path(name_str):
@@ -12,16 +27,126 @@ def sanitize_for_path(name_str):
     name_str = re.sub(r'[^\w\-_.]', '', name_str) # Allow dots for filenames
     return name_str[:100]
 
-def generate_json_from_directory(root_dir, output_file, item_lists_csv_path="item_lists.csv"):
+def _load_manifest(manifest_path, root_dir_abs, icons_dir_abs):
+    """
+    Loads the directory listings and item entries saved by the previous build.
+    The manifest is ignored if it was built for different directories.
+    """
+    if manifest_path and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('root_dir') == root_dir_abs and manifest.get('icons_dir') == icons_dir_abs:
+                return manifest
+        except (OSError, ValueError) as e:
+            print(f"Error reading '{manifest_path}': {e}. Doing a full rebuild.")
+    return {'root_dir': root_dir_abs, 'icons_dir': icons_dir_abs, 'listings': {}, 'entries': {}}
+
+def _list_directory(dir_abs, previous_listing):
+    """
+    Returns {'mtime_ns', 'subdirs', 'files'} for dir_abs. The previous listing is reused
+    as long as the directory's mtime is unchanged, since adding or removing entries updates it.
+    """
+    mtime_ns = os.stat(dir_abs).st_mtime_ns
+    if previous_listing and previous_listing['mtime_ns'] == mtime_ns:
+        return previous_listing
+    subdirs = []
+    filenames = []
+    with os.scandir(dir_abs) as it:
+        for entry in it:
+            # Filter out hidden directories and files if necessary (e.g., .git)
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            else:
+                filenames.append(entry.name)
+    return {'mtime_ns': mtime_ns, 'subdirs': sorted(subdirs), 'files': sorted(filenames)}
+
+def _write_if_changed(path, text):
+    """
+    Writes text to path (via a temp file) unless the file already holds exactly that text,
+    so unchanged catalog files keep their HTTP validators.
+    """
+    data = text.encode('utf-8')
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return True
+
+def _iter_leaf_entries(node):
+    """
+    Yields (item name, entry) for every item below a level of the nested item_data structure, in key order.
+    """
+    for key, value in node.items():
+        if 'history_path' in value:
+            yield key, value
+        else:
+            yield from _iter_leaf_entries(value)
+
+def write_catalog(data_structure, catalog_dir=CATALOG_DIR, item_lists_csv_path=None):
+    """
+    Writes the sharded catalog loaded by the frontend instead of the whole item_data.json:
+    - manifest.json: the top-level categories with their item counts and shard file,
+    - categories/<category>.json: that category's subtree of item_data.json, fetched on demand,
+    - lookup.json: a flat id/name/history_path/icon_path table, in the same order as the tree,
+    - search_index.json: the prebuilt name search index (see search_index.py), if item_lists_csv_path is given.
+    Files whose content is unchanged are left untouched; shards of removed categories are deleted.
+    """
+    categories = []
+    lookup_rows = []
+    files_written = 0
+    for category_name, subtree in data_structure.items():
+        shard_file = f"categories/{category_name}.json"
+        leaves = list(_iter_leaf_entries(subtree))
+        categories.append({'name': category_name, 'count': len(leaves), 'file': shard_file})
+        for item_name, entry in leaves:
+            item_id = entry['history_path'].rsplit('/', 1)[-1][:-len("_history.csv")]
+            lookup_rows.append([item_id, item_name, entry['history_path'], entry['icon_path']])
+        files_written += _write_if_changed(os.path.join(catalog_dir, shard_file), json.dumps(subtree, separators=(',', ':')))
+
+    manifest = {'total': len(lookup_rows), 'categories': categories}
+    lookup = {'columns': CATALOG_LOOKUP_COLUMNS, 'rows': lookup_rows}
+    files_written += _write_if_changed(os.path.join(catalog_dir, "manifest.json"), json.dumps(manifest, separators=(',', ':')))
+    files_written += _write_if_changed(os.path.join(catalog_dir, "lookup.json"), json.dumps(lookup, separators=(',', ':')))
+    if item_lists_csv_path and os.path.exists(item_lists_csv_path):
+        search_index = build_search_index(item_lists_csv_path, lookup_rows)
+        files_written += _write_if_changed(os.path.join(catalog_dir, "search_index.json"), json.dumps(search_index, separators=(',', ':')))
+
+    categories_dir = os.path.join(catalog_dir, "categories")
+    expected_files = {category['file'].split('/', 1)[1] for category in categories}
+    for filename in os.listdir(categories_dir) if os.path.isdir(categories_dir) else []:
+        if filename not in expected_files:
+            os.remove(os.path.join(categories_dir, filename))
+    print(f"Wrote catalog to {catalog_dir}: {len(categories)} categories, {len(lookup_rows)} items ({files_written} files changed).")
+
+def generate_json_from_directory(root_dir, output_file, item_lists_csv_path="item_lists.csv", icons_dir="item_icons",
+                                 incremental=True, compact=False, manifest_path=GENERATOR_MANIFEST_FILE,
+                                 catalog_dir=CATALOG_DIR):
     """
     Generates a JSON file representing the directory structure and item files
     within root_dir, including paths to icons.
+    Icons are taken from the shared icon store in icons_dir (a sibling of root_dir),
+    falling back to a copy inside the item's own directory.
+    With incremental=True, directory listings and item entries from the previous build
+    (saved in manifest_path) are reused for every directory whose mtime has not changed,
+    so only new or changed items are re-listed and recomputed.
+    With compact=True the JSON is written without indentation.
+    Unless catalog_dir is None, the sharded catalog (see write_catalog) is written there as well.
     """
     data_structure = {}
     item_details_map = {}
     root_dir_abs = os.path.abspath(root_dir)
     # output_base_dir is the directory containing root_dir (e.g., project root)
     output_base_dir = os.path.dirname(root_dir_abs)
+    icons_dir_abs = os.path.join(output_base_dir, icons_dir)
+    stored_icon_filenames = set(os.listdir(icons_dir_abs)) if os.path.isdir(icons_dir_abs) else set()
 
     try:
         with open(item_lists_csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
@@ -41,58 +166,113 @@ def generate_json_from_directory(root_dir, output_file, item_lists_csv_path="ite
     except Exception as e:
         print(f"Error reading '{item_lists_csv_path}': {e}. Icon paths will be missing.")
 
+    previous_manifest = _load_manifest(manifest_path if incremental else None, root_dir_abs, icons_dir_abs)
+    listings = {}
+    entries = {}
+    directories_relisted = 0
+    entries_recomputed = 0
 
-    for dirpath, dirnames, filenames in os.walk(root_dir_abs):
-        # Filter out hidden directories and files if necessary (e.g., .git)
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
-        filenames[:] = [f for f in filenames if not f.startswith('.')]
+    # Depth-first walk in sorted order, so the JSON keys come out sorted
+    pending_dirs = [""]
+    while pending_dirs:
+        relative_item_dir_to_root_dir = pending_dirs.pop()
+        dirpath = os.path.join(root_dir_abs, relative_item_dir_to_root_dir)
+        previous_listing = previous_manifest['listings'].get(relative_item_dir_to_root_dir)
+        listing = _list_directory(dirpath, previous_listing)
+        if listing is not previous_listing:
+            directories_relisted += 1
+        listings[relative_item_dir_to_root_dir] = listing
+        pending_dirs.extend(os.path.join(relative_item_dir_to_root_dir, d) for d in reversed(listing['subdirs']))
 
-        for filename in filenames:
-            if filename.endswith("_history.csv"):
-                history_file_disk_path = os.path.join(dirpath, filename)
+        history_filenames = [f for f in listing['files'] if f.endswith("_history.csv")]
+        if not history_filenames:
+            continue
 
-                # Path relative to the directory containing root_dir (e.g., project root)
-                history_path_in_json = os.path.relpath(history_file_disk_path, output_base_dir).replace(os.sep, '/')
+        # These parts should match how map_key was created (sanitized category, group, name)
+        structure_parts_for_lookup = tuple(relative_item_dir_to_root_dir.split(os.sep))
+        item_detail = item_details_map.get(structure_parts_for_lookup)
 
-                icon_path_in_json = "" # Default
+        icon_filename_sanitized = ""
+        if item_detail and item_detail.get('icon_id') and item_detail.get('icon_downloaded') == 'True':
+            icon_filename_sanitized = sanitize_for_path(str(item_detail['icon_id'])) + ".png" # Sanitizing icon_id just in case
 
-                # Construct key to look up icon_id
-                # Relative path from root_dir_abs to current dirpath (e.g., Category/Group/ItemName)
-                relative_item_dir_to_root_dir = os.path.relpath(dirpath, root_dir_abs)
-                
-                # These parts should match how map_key was created (sanitized category, group, name)
-                structure_parts_for_lookup = tuple(relative_item_dir_to_root_dir.split(os.sep))
-                
-                item_detail = item_details_map.get(structure_parts_for_lookup)
+        # The entry only depends on the listing, the icon details and whether the icon is in the store
+        entry_signature = [listing['mtime_ns'], icon_filename_sanitized, icon_filename_sanitized in stored_icon_filenames]
+        previous_entry = previous_manifest['entries'].get(relative_item_dir_to_root_dir)
+        if previous_entry and previous_entry['signature'] == entry_signature:
+            item_data_entry = previous_entry['entry']
+        else:
+            entries_recomputed += 1
+            # Path relative to the directory containing root_dir (e.g., project root)
+            history_path_in_json = os.path.relpath(os.path.join(dirpath, history_filenames[-1]), output_base_dir).replace(os.sep, '/')
 
-                if item_detail and item_detail.get('icon_id') and item_detail.get('icon_downloaded') == 'True':
-                    icon_id_str = str(item_detail['icon_id'])
-                    icon_filename_sanitized = sanitize_for_path(icon_id_str) + ".png" # Sanitizing icon_id just in case
+            icon_path_in_json = "" # Default
+            if icon_filename_sanitized:
+                if icon_filename_sanitized in stored_icon_filenames:
+                    icon_file_disk_path = os.path.join(icons_dir_abs, icon_filename_sanitized)
+                else:
                     icon_file_disk_path = os.path.join(dirpath, icon_filename_sanitized)
 
-                    if os.path.exists(icon_file_disk_path):
-                        icon_path_in_json = os.path.relpath(icon_file_disk_path, output_base_dir).replace(os.sep, '/')
-                    else:
-                        print(f"Icon file not found at {icon_file_disk_path} though CSV indicated downloaded.")
-                
-                item_data_entry = {
-                    "history_path": history_path_in_json,
-                    "icon_path": icon_path_in_json
-                }
+                if icon_filename_sanitized in stored_icon_filenames or icon_filename_sanitized in listing['files']:
+                    icon_path_in_json = os.path.relpath(icon_file_disk_path, output_base_dir).replace(os.sep, '/')
+                else:
+                    print(f"Icon file not found at {icon_file_disk_path} though CSV indicated downloaded.")
+
+            item_data_entry = {
+                "history_path": history_path_in_json,
+                "icon_path": icon_path_in_json
+            }
+        entries[relative_item_dir_to_root_dir] = {'signature': entry_signature, 'entry': item_data_entry}
+
+        # Place item_data_entry into the main data_structure
+        # structure_parts_for_lookup is (sanitized_category, sanitized_group, sanitized_name)
+        current_level_dict = data_structure
+        for part in structure_parts_for_lookup[:-1]: # Navigate to parent dict
+            current_level_dict = current_level_dict.setdefault(part, {})
 
-                # Place item_data_entry into the main data_structure
-                # structure_parts_for_lookup is (sanitized_category, sanitized_group, sanitized_name)
-                current_level_dict = data_structure
-                for part in structure_parts_for_lookup[:-1]: # Navigate to parent dict
-                    current_level_dict = current_level_dict.setdefault(part, {})
+        item_name_key = structure_parts_for_lookup[-1] # Sanitized item name
+        current_level_dict[item_name_key] = item_data_entry
 
-                item_name_key = structure_parts_for_lookup[-1] # Sanitized item name
-                current_level_dict[item_name_key] = item_data_entry
+    print(f"Re-listed {directories_relisted} of {len(listings)} directories, recomputed {entries_recomputed} of {len(entries)} item entries.")
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data_structure, f, indent=4)
+    # json.dumps uses the C encoder for unindented output, unlike json.dump writing to a file.
+    # Written via a temp file so an interrupted run never leaves a truncated item_data.json.
+    temp_output_file = output_file + '.tmp'
+    with open(temp_output_file, 'w', encoding='utf-8') as f:
+        if compact:
+            f.write(json.dumps(data_structure, separators=(',', ':')))
+        else:
+            f.write(json.dumps(data_structure, indent=4))
+    os.replace(temp_output_file, output_file)
+
+    # The catalog only depends on the item entries and item_lists.csv (for the search index),
+    # so it is not rebuilt when neither changed since the previous build
+    catalog_signature = None
+    if catalog_dir:
+        item_lists_stat = os.stat(item_lists_csv_path) if item_lists_csv_path and os.path.exists(item_lists_csv_path) else None
+        catalog_signature = [os.path.abspath(catalog_dir), [item_lists_stat.st_size, item_lists_stat.st_mtime_ns] if item_lists_stat else None]
+        catalog_unchanged = (not directories_relisted and not entries_recomputed and previous_manifest.get('catalog') == catalog_signature
+                             and os.path.exists(os.path.join(catalog_dir, "manifest.json")))
+        if catalog_unchanged:
+            print(f"Catalog in {catalog_dir} is up to date.")
+        else:
+            write_catalog(data_structure, catalog_dir, item_lists_csv_path)
+
+    if manifest_path:
+        os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'root_dir': root_dir_abs, 'icons_dir': icons_dir_abs, 'listings': listings, 'entries': entries,
+                                'catalog': catalog_signature}))
+        os.replace(manifest_path + '.tmp', manifest_path)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate item_data.json from the item_histories tree.")
+    parser.add_argument('--compact', action='store_true', help="Write the JSON without indentation")
+    parser.add_argument('--full', action='store_true', help="Ignore the manifest from the previous build and rescan everything")
+    parser.add_argument('--report', default=GENERATE_REPORT_FILE, help="Where to write the JSON run report")
+    parser.add_argument('--profile', help="Run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+
     root_directory = "item_histories"  # This is the directory to scan
     output_json_file = "item_data.json"
     # Assuming item_lists.csv is in the same directory as this script,
@@ -100,5 +280,17 @@ if __name__ == "__main__":
     # For now, direct reference means it's expected to be in the CWD when script is run.
     # If generate_item_json.py is at project root with item_lists.csv, then "item_lists.csv" is fine.
     csv_path = "item_lists.csv"
-    generate_json_from_directory(root_directory, output_json_file, item_lists_csv_path=csv_path)
-    print(f"'{output_json_file}' generated successfully.")
+    with profiled(args.profile):
+        with run_metrics.phase('generate_json'):
+            generate_json_from_directory(root_directory, output_json_file, item_lists_csv_path=csv_path,
+                                         incremental=not args.full, compact=args.compact)
+        print(f"'{output_json_file}' generated successfully.")
+        # The frontend reads item_stats.json and the history bundles before the CSVs, so they are rebuilt with every item_data.json
+        if build_item_stats is not None:
+            with run_metrics.phase('item_stats'):
+                build_item_stats(output_json_file)
+            with run_metrics.phase('history_bundles'):
+                bundle_histories(output_json_file)
+        else:
+            print("NumPy is not installed; item_stats.json and history_bundles/ were not rebuilt and may be out of date.")
+    run_metrics.write_report(args.report)
@@ -0,0 +1,295 @@
+import os
+import re
+import csv
+import json
+import struct
+import threading
+import argparse
+from datetime import datetime, timezone
+
+# Configuration
+HISTORIES_BASE_DIR = "item_histories"
+HISTORY_STORE_DIR = "history_store"
+HISTORY_STORE_RECORDS_FILE = "records.bin"
+HISTORY_STORE_INDEX_FILE = "index.json"
+
+# One fixed-width little-endian record per history row:
+# row id, item_id, price, ISO week, ISO year, date_created and date_updated as epoch seconds.
+RECORD_STRUCT = struct.Struct('<qqdHHqq')
+RECORD_FIELDS = [('id', '<i8'), ('item_id', '<i8'), ('price', '<f8'), ('week', '<u2'), ('year', '<u2'),
+                 ('date_created', '<i8'), ('date_updated', '<i8')]
+HISTORY_CSV_HEADERS = ['id', 'item_id', 'price', 'week', 'year', 'date_created', 'date_updated']
+
+def sanitize_for_path(name_str):
+    """
+    Sanitizes a string to be safe for directory/file names.
+    Used by update_data.py to lay out item_histories/<category>/<group>/<name>/<id>_history.csv.
+    """
+    if not name_str:
+        name_str = "unknown"
+    name_str = name_str.replace(' ', '_')
+    name_str = re.sub(r'[^\w\-_]', '', name_str)
+    return name_str[:100]
+
+def iso_to_epoch(iso_date_string: str) -> int:
+    """
+    Converts an ISO 8601 timestamp to epoch seconds. Empty or unparsable values become 0.
+    """
+    if not iso_date_string:
+        return 0
+    try:
+        return int(datetime.fromisoformat(iso_date_string).timestamp())
+    except ValueError:
+        return 0
+
+def epoch_to_iso(epoch_seconds: int) -> str:
+    if not epoch_seconds:
+        return ""
+    return datetime.fromtimestamp(int(epoch_seconds), timezone.utc).isoformat()
+
+def _to_int(value, default=0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def history_row_to_record(row: dict) -> tuple:
+    """
+    Converts a history CSV row (dict of strings) to a record tuple matching RECORD_STRUCT.
+    """
+    try:
+        price = float(row.get('price') or 'nan')
+    except ValueError:
+        price = float('nan')
+    return (
+        _to_int(row.get('id')),
+        _to_int(row.get('item_id')),
+        price,
+        _to_int(row.get('week')),
+        _to_int(row.get('year')),
+        iso_to_epoch(row.get('date_created')),
+        iso_to_epoch(row.get('date_updated'))
+    )
+
+def record_to_history_row(record) -> dict:
+    """
+    Converts a record (tuple or NumPy structured row) back to a history CSV row.
+    """
+    row_id, item_id, price, week, year, date_created, date_updated = (record[i] for i in range(7))
+    return {
+        'id': str(int(row_id)),
+        'item_id': str(int(item_id)),
+        'price': f"{float(price):.2f}" if price == price else "",
+        'week': str(int(week)),
+        'year': str(int(year)),
+        'date_created': epoch_to_iso(date_created),
+        'date_updated': epoch_to_iso(date_updated)
+    }
+
+class HistoryStore:
+    """
+    Single-file store for every item's price history.
+
+    Records live in <store_dir>/records.bin. The JSON index maps each item_id to its
+    history CSV path and to the extents ([first record, record count]) holding its rows
+    in order. Appends add records at the end of the file and extend the item's last extent
+    when it is the tail of the file; replaced histories leave dead records behind until compact().
+    """
+    def __init__(self, store_dir: str = HISTORY_STORE_DIR):
+        self.store_dir = store_dir
+        self.records_path = os.path.join(store_dir, HISTORY_STORE_RECORDS_FILE)
+        self.index_path = os.path.join(store_dir, HISTORY_STORE_INDEX_FILE)
+        self._lock = threading.Lock()
+        self._records_view = None
+        self.items = {}
+        self.record_count = 0
+        os.makedirs(store_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.items = index.get('items', {})
+            self.record_count = index.get('records', 0)
+        # Drop records written after the last saved index (e.g. an interrupted run)
+        with open(self.records_path, 'ab') as f:
+            if f.tell() != self.record_count * RECORD_STRUCT.size:
+                f.truncate(self.record_count * RECORD_STRUCT.size)
+
+    @staticmethod
+    def exists(store_dir: str = HISTORY_STORE_DIR) -> bool:
+        return os.path.exists(os.path.join(store_dir, HISTORY_STORE_INDEX_FILE))
+
+    def _write_records(self, rows: list[dict]) -> int:
+        """Appends rows to the records file and returns the number of the first one. Caller holds the lock."""
+        first_record = self.record_count
+        with open(self.records_path, 'ab') as f:
+            f.write(b''.join(RECORD_STRUCT.pack(*history_row_to_record(row)) for row in rows))
+        self.record_count += len(rows)
+        self._records_view = None
+        return first_record
+
+    def append_rows(self, item_id: str, rows: list[dict], history_path: str = None):
+        """
+        Appends rows to the end of an item's history.
+        """
+        if not rows:
+            return
+        with self._lock:
+            first_record = self._write_records(rows)
+            entry = self.items.setdefault(str(item_id), {'path': history_path, 'extents': []})
+            if history_path:
+                entry['path'] = history_path
+            extents = entry['extents']
+            if extents and extents[-1][0] + extents[-1][1] == first_record:
+                extents[-1][1] += len(rows)
+            else:
+                extents.append([first_record, len(rows)])
+
+    def replace_item(self, item_id: str, rows: list[dict], history_path: str = None):
+        """
+        Replaces an item's whole history, e.g. after a full refetch.
+        """
+        with self._lock:
+            first_record = self._write_records(rows) if rows else self.record_count
+            previous_path = self.items.get(str(item_id), {}).get('path')
+            self.items[str(item_id)] = {'path': history_path or previous_path, 'extents': [[first_record, len(rows)]] if rows else []}
+
+    def remove_item(self, item_id: str):
+        with self._lock:
+            self.items.pop(str(item_id), None)
+
+    def save_index(self):
+        with self._lock:
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'records': self.record_count, 'items': self.items}, f)
+            os.replace(temp_path, self.index_path)
+
+    def records(self):
+        """
+        Returns every record in the file as a read-only, memory-mapped NumPy structured array.
+        """
+        import numpy as np
+        if self._records_view is None or len(self._records_view) != self.record_count:
+            if self.record_count == 0:
+                self._records_view = np.zeros(0, dtype=np.dtype(RECORD_FIELDS))
+            else:
+                self._records_view = np.memmap(self.records_path, dtype=np.dtype(RECORD_FIELDS), mode='r', shape=(self.record_count,))
+        return self._records_view
+
+    def read_item(self, item_id: str):
+        """
+        Returns an item's rows as a NumPy structured array. Items stored in a single
+        extent are returned as a view into the memory map without copying.
+        """
+        import numpy as np
+        records = self.records()
+        extents = self.items.get(str(item_id), {}).get('extents', [])
+        if len(extents) == 1:
+            start, count = extents[0]
+            return records[start:start + count]
+        if not extents:
+            return records[0:0]
+        return np.concatenate([records[start:start + count] for start, count in extents])
+
+    def read_item_rows(self, item_id: str) -> list[dict]:
+        """
+        Returns an item's rows as history CSV dicts, without needing NumPy.
+        """
+        rows = []
+        with open(self.records_path, 'rb') as f:
+            for start, count in self.items.get(str(item_id), {}).get('extents', []):
+                f.seek(start * RECORD_STRUCT.size)
+                data = f.read(count * RECORD_STRUCT.size)
+                rows.extend(record_to_history_row(record) for record in RECORD_STRUCT.iter_unpack(data))
+        return rows
+
+    def compact(self):
+        """
+        Rewrites the records file so each item's rows are contiguous (one extent per item)
+        and dead records from replaced histories are dropped.
+        """
+        with self._lock:
+            temp_path = self.records_path + '.tmp'
+            new_items = {}
+            new_record_count = 0
+            with open(self.records_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                for item_id in sorted(self.items, key=_to_int):
+                    entry = self.items[item_id]
+                    item_count = 0
+                    for start, count in entry['extents']:
+                        src.seek(start * RECORD_STRUCT.size)
+                        dst.write(src.read(count * RECORD_STRUCT.size))
+                        item_count += count
+                    new_items[item_id] = {'path': entry.get('path'), 'extents': [[new_record_count, item_count]] if item_count else []}
+                    new_record_count += item_count
+            os.replace(temp_path, self.records_path)
+            self.items = new_items
+            self.record_count = new_record_count
+            self._records_view = None
+        self.save_index()
+
+def read_history_csv(history_file_path: str) -> list[dict]:
+    with open(history_file_path, mode='r', encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+def build_store_from_csvs(histories_dir: str = HISTORIES_BASE_DIR, store_dir: str = HISTORY_STORE_DIR) -> HistoryStore:
+    """
+    (Re)builds the history store from every *_history.csv under histories_dir.
+    """
+    for filename in (HISTORY_STORE_RECORDS_FILE, HISTORY_STORE_INDEX_FILE):
+        if os.path.exists(os.path.join(store_dir, filename)):
+            os.remove(os.path.join(store_dir, filename))
+    store = HistoryStore(store_dir)
+    files_read = 0
+    for dirpath, dirnames, filenames in os.walk(histories_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith("_history.csv"):
+                continue
+            history_file_path = os.path.join(dirpath, filename)
+            item_id = filename[:-len("_history.csv")]
+            try:
+                rows = read_history_csv(history_file_path)
+            except (OSError, csv.Error) as e:
+                print(f"Error reading {history_file_path}: {e}. Skipping.")
+                continue
+            store.replace_item(item_id, rows, history_file_path.replace(os.sep, '/'))
+            files_read += 1
+    store.save_index()
+    print(f"Built history store in {store_dir}: {store.record_count} records from {files_read} history files.")
+    return store
+
+def export_csvs(store_dir: str = HISTORY_STORE_DIR, item_ids: list[str] = None):
+    """
+    Regenerates the per-item *_history.csv files from the store, at the paths recorded in its index.
+    """
+    store = HistoryStore(store_dir)
+    files_written = 0
+    for item_id in (item_ids if item_ids is not None else list(store.items)):
+        history_file_path = store.items.get(str(item_id), {}).get('path')
+        if not history_file_path:
+            print(f"No history path recorded for item {item_id}. Skipping export.")
+            continue
+        os.makedirs(os.path.dirname(history_file_path), exist_ok=True)
+        with open(history_file_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=HISTORY_CSV_HEADERS, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(store.read_item_rows(item_id))
+        files_written += 1
+    print(f"Exported {files_written} history CSV files from {store_dir}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the consolidated item history store.")
+    parser.add_argument('command', choices=['build', 'export', 'compact'],
+                        help="build: import all history CSVs; export: regenerate the CSVs; compact: drop dead records")
+    parser.add_argument('--store-dir', default=HISTORY_STORE_DIR)
+    parser.add_argument('--histories-dir', default=HISTORIES_BASE_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_store_from_csvs(args.histories_dir, args.store_dir)
+    elif args.command == 'export':
+        export_csvs(args.store_dir)
+    else:
+        HistoryStore(args.store_dir).compact()
+        print(f"Compacted history store in {args.store_dir}.")
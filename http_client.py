@@ -0,0 +1,309 @@
+import requests
+import time
+import os
+import json
+import random
+import hashlib
+import threading
+import atexit
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+from run_metrics import run_metrics
+from rate_control import RateController
+
+# Configuration
+HTTP_CACHE_DIR = os.path.join(".update_state", "http_cache")
+HTTP_CACHE_INDEX_FILE = os.path.join(HTTP_CACHE_DIR, "validators.json")
+REQUEST_TIMEOUT_SECONDS = 30
+POOL_MAXSIZE = 16 # Keep-alive connections kept per host
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 60
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_REQUESTS_PER_SECOND = 100 # Hard global cap across all threads (0 disables it); rate_controller adapts below it
+STREAM_CHUNK_BYTES = 64 * 1024 # Read size for streamed bodies
+
+class RequestRateLimiter:
+    """
+    Thread-safe limiter that spaces requests evenly to stay under a requests-per-second cap.
+    """
+    def __init__(self, max_per_second: float):
+        self.interval = 1.0 / max_per_second if max_per_second and max_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+request_rate_limiter = RequestRateLimiter(MAX_REQUESTS_PER_SECOND)
+rate_controller = RateController() # Per-endpoint AIMD budgets, see rate_control.py
+
+_session = None
+_session_lock = threading.Lock()
+_validators = None # cache key -> {'etag', 'last_modified', 'encoding', 'body_file'}
+_validators_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    Returns the shared requests.Session, whose connection pool keeps connections alive across calls.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+def _cache_key(url: str, params: dict | None) -> str:
+    return requests.Request('GET', url, params=params).prepare().url
+
+def _load_validators() -> dict:
+    global _validators
+    with _validators_lock:
+        if _validators is None:
+            _validators = {}
+            if os.path.exists(HTTP_CACHE_INDEX_FILE):
+                try:
+                    with open(HTTP_CACHE_INDEX_FILE, 'r', encoding='utf-8') as f:
+                        _validators = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Error reading HTTP cache index {HTTP_CACHE_INDEX_FILE}: {e}. Starting with an empty cache.")
+            atexit.register(save_validator_cache)
+        return _validators
+
+def save_validator_cache():
+    """
+    Persists the ETag/Last-Modified validators collected during this run.
+    """
+    with _validators_lock:
+        if _validators is None:
+            return
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        temp_path = HTTP_CACHE_INDEX_FILE + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(_validators, f)
+        os.replace(temp_path, HTTP_CACHE_INDEX_FILE)
+
+def _cached_entry(cache_key: str) -> dict | None:
+    entry = _load_validators().get(cache_key)
+    if entry and os.path.exists(os.path.join(HTTP_CACHE_DIR, entry['body_file'])):
+        return entry
+    return None
+
+def _store_in_cache(cache_key: str, response: requests.Response) -> dict | None:
+    """
+    Saves the response body and its validators in the cache, reading a streamed body chunk by chunk.
+    Returns the new cache entry, or None if the response has no validators or could not be saved.
+    """
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if not etag and not last_modified:
+        return None
+    body_file = hashlib.sha1(cache_key.encode('utf-8')).hexdigest() + '.body'
+    try:
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        with open(os.path.join(HTTP_CACHE_DIR, body_file), 'wb') as f:
+            for chunk in response.iter_content(STREAM_CHUNK_BYTES):
+                f.write(chunk)
+    except OSError as e:
+        print(f"Error caching response body for {cache_key}: {e}")
+        return None
+    entry = {
+        'etag': etag,
+        'last_modified': last_modified,
+        'encoding': response.encoding,
+        'body_file': body_file
+    }
+    validators = _load_validators()
+    with _validators_lock:
+        validators[cache_key] = entry
+    return entry
+
+def _attach_cached_body(response: requests.Response, entry: dict, stream: bool):
+    """
+    Makes response carry the cached body: read into memory, or with stream=True served from
+    the cache file as iter_content/iter_lines consume it.
+    """
+    body_path = os.path.join(HTTP_CACHE_DIR, entry['body_file'])
+    if stream:
+        response.raw = open(body_path, 'rb')
+        response._content = False
+        response._content_consumed = False
+    else:
+        with open(body_path, 'rb') as f:
+            response._content = f.read()
+        response._content_consumed = True
+    response.encoding = entry.get('encoding') or 'utf-8'
+
+def _fill_from_cache(response: requests.Response, entry: dict, stream: bool = False) -> requests.Response:
+    """
+    Turns a 304 Not Modified response into a 200 carrying the cached body.
+    """
+    _attach_cached_body(response, entry, stream)
+    response.status_code = 200
+    response.from_cache = True
+    return response
+
+class _TrackedBody:
+    """
+    Stands in for a streamed response's raw body: counts the bytes actually read and calls
+    on_done(bytes_read, failed) once, when the body is exhausted, fails or is closed.
+    Everything else is passed through to the wrapped urllib3 response.
+    """
+    def __init__(self, raw, on_done):
+        self._raw = raw
+        self._on_done = on_done
+        self._done = False
+        self.bytes_read = 0
+
+    def _finish(self, failed: bool = False):
+        if not self._done:
+            self._done = True
+            self._on_done(self.bytes_read, failed)
+
+    def stream(self, amt=STREAM_CHUNK_BYTES, decode_content=None):
+        failed = False
+        try:
+            for chunk in self._raw.stream(amt, decode_content=decode_content):
+                self.bytes_read += len(chunk)
+                yield chunk
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._finish(failed)
+
+    def read(self, *args, **kwargs):
+        try:
+            data = self._raw.read(*args, **kwargs)
+        except BaseException:
+            self._finish(failed=True)
+            raise
+        self.bytes_read += len(data)
+        if not data:
+            self._finish()
+        return data
+
+    def close(self):
+        try:
+            self._raw.close()
+        finally:
+            self._finish()
+
+    def release_conn(self):
+        try:
+            self._raw.release_conn()
+        finally:
+            self._finish()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+def _retry_delay(response: requests.Response | None, attempt: int) -> float:
+    """
+    Seconds to wait before the next attempt: the server's Retry-After if given,
+    otherwise exponential backoff with jitter.
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return min(max(retry_at.timestamp() - time.time(), 0.0), BACKOFF_MAX_SECONDS)
+            except (TypeError, ValueError):
+                pass
+    delay = BACKOFF_BASE_SECONDS * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), BACKOFF_MAX_SECONDS)
+
+def http_get(url: str, params: dict | None = None, headers: dict | None = None, conditional: bool = True,
+             timeout: float = REQUEST_TIMEOUT_SECONDS, stream: bool = False) -> requests.Response:
+    """
+    GETs url through the shared session, retrying connection errors, timeouts and
+    RETRY_STATUS_CODES with backoff.
+    With conditional=True the request carries the cached ETag/Last-Modified validators,
+    and a 304 answer is returned as a 200 response with the cached body (response.from_cache is True).
+    With stream=True the body is not read up front: consume it with iter_lines/iter_content
+    and close the response (use it as a context manager). Cacheable bodies are streamed into the
+    cache and read back from there.
+    Every attempt waits for its endpoint's budget in rate_controller, which speeds up while the
+    server is healthy and backs off on 429, 5xx, connection errors and timeouts. A streamed body
+    keeps its request's slot in the budget until it has been read or closed, so the budget bounds
+    transfers in flight and its latency samples include the body.
+    Raises requests.exceptions.RequestException once retries are exhausted.
+    """
+    session = get_session()
+    cache_key = _cache_key(url, params) if conditional else None
+    cached = _cached_entry(cache_key) if conditional else None
+
+    request_headers = dict(headers or {})
+    if cached:
+        if cached.get('etag'):
+            request_headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            request_headers['If-Modified-Since'] = cached['last_modified']
+
+    budget = rate_controller.budget_for(url)
+    attempt = 0
+    while True:
+        budget.acquire()
+        request_rate_limiter.wait()
+        attempt_start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, headers=request_headers, timeout=timeout, stream=stream)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            budget.release(None, time.perf_counter() - attempt_start)
+            run_metrics.record_attempt(url, time.perf_counter() - attempt_start, None, attempt < MAX_RETRIES)
+            if attempt >= MAX_RETRIES:
+                run_metrics.record_request(url, None)
+                raise
+            delay = _retry_delay(None, attempt)
+            print(f"Request to {url} failed ({e}). Retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})...")
+        except BaseException:
+            budget.abandon()
+            raise
+        else:
+            retrying = response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES
+            run_metrics.record_attempt(url, time.perf_counter() - attempt_start, response.status_code, retrying)
+            if not retrying:
+                break
+            budget.release(response.status_code, time.perf_counter() - attempt_start)
+            delay = _retry_delay(response, attempt)
+            print(f"Request to {url} returned status {response.status_code}. Retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})...")
+            response.close()
+        time.sleep(delay)
+        attempt += 1
+
+    response.from_cache = False
+    status_code = response.status_code
+    if status_code == 304 and cached:
+        budget.release(status_code, time.perf_counter() - attempt_start)
+        run_metrics.record_request(url, status_code, from_cache=True)
+        return _fill_from_cache(response, cached, stream)
+    if not stream:
+        budget.release(status_code, time.perf_counter() - attempt_start)
+        if conditional and status_code == 200:
+            _store_in_cache(cache_key, response)
+        run_metrics.record_request(url, status_code, len(response.content))
+        return response
+
+    def body_done(bytes_read: int, failed: bool):
+        budget.release(None if failed else status_code, time.perf_counter() - attempt_start)
+        run_metrics.record_request(url, None if failed else status_code, bytes_read)
+    response.raw = _TrackedBody(response.raw, body_done)
+    entry = _store_in_cache(cache_key, response) if conditional and status_code == 200 else None
+    if entry:
+        response.raw.close() # Fully read into the cache; serve it from there
+        _attach_cached_body(response, entry, stream)
+    return response
@@ -0,0 +1,271 @@
+import os
+import threading
+import argparse
+import numpy as np
+
+from history_store import HistoryStore, HISTORIES_BASE_DIR
+from build_item_stats import EPOCH_DATE
+from market_indicators import (
+    SMA_PERIODS_WEEKS, EMA_PERIODS_WEEKS, VOLATILITY_WINDOW_WEEKS, BOLLINGER_PERIOD_WEEKS, ZSCORE_WINDOW_WEEKS,
+    ITEMS_CSV_FILE, MARKET_SCREENER_CSV_FILE, week_number, find_history_files, load_weekly_matrix, forward_fill,
+    exponential_moving_average, compute_indicators, build_screener, load_item_names, write_screener_csv,
+    print_screener_summary
+)
+
+# Configuration
+INDICATOR_CACHE_FILE = os.path.join(".update_state", "indicator_cache.npz")
+# Weekly prices kept per item: enough for the longest rolling window, one extra week
+# for the first return of the volatility window and 4 weeks back for the screener's change column.
+TAIL_WEEKS = max(max(SMA_PERIODS_WEEKS), BOLLINGER_PERIOD_WEEKS, ZSCORE_WINDOW_WEEKS, VOLATILITY_WINDOW_WEEKS + 1, 5)
+EMA_ALPHAS = np.array([2.0 / (period + 1) for period in EMA_PERIODS_WEEKS])
+
+class IndicatorCache:
+    """
+    Per-item rolling indicator state, so the screener can be refreshed without reloading every history.
+
+    For each item the cache keeps the week of its last row, the forward-filled weekly prices of the
+    last TAIL_WEEKS weeks up to that week, and for each EMA period the EMA at that week and at the week
+    before (so a second row in the same week can replace the first). Appended rows update this state
+    in place; refetched histories are rebuilt from their files; items no longer in the catalog are evicted.
+    """
+    def __init__(self, cache_path: str = INDICATOR_CACHE_FILE):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self.item_ids = []
+        self.paths = []
+        self.rows_by_id = {}
+        self.last_weeks = np.zeros(0, dtype=np.int64)
+        self.tails = np.full((0, TAIL_WEEKS), np.nan)
+        self.emas = np.full((0, len(EMA_PERIODS_WEEKS)), np.nan)
+        self.previous_emas = np.full((0, len(EMA_PERIODS_WEEKS)), np.nan)
+        self.pending_rebuilds = {} # item_id -> history path
+        self.items_updated = 0
+        if os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as data:
+                if data['tails'].shape[1] == TAIL_WEEKS and data['emas'].shape[1] == len(EMA_PERIODS_WEEKS):
+                    self.item_ids = data['item_ids'].tolist()
+                    self.paths = data['paths'].tolist()
+                    self.last_weeks = data['last_weeks']
+                    self.tails = data['tails']
+                    self.emas = data['emas']
+                    self.previous_emas = data['previous_emas']
+                else:
+                    print(f"Indicator cache {cache_path} was built with different windows. It will be rebuilt.")
+                    self.pending_rebuilds = dict(zip(data['item_ids'].tolist(), data['paths'].tolist()))
+            self.rows_by_id = {item_id: row for row, item_id in enumerate(self.item_ids)}
+
+    @staticmethod
+    def exists(cache_path: str = INDICATOR_CACHE_FILE) -> bool:
+        return os.path.exists(cache_path)
+
+    def mark_for_rebuild(self, item_id: str, history_path: str):
+        """
+        Schedules an item's state to be rebuilt from its history file by refresh(),
+        e.g. after a full refetch rewrote it.
+        """
+        with self._lock:
+            self.pending_rebuilds[str(item_id)] = history_path
+
+    def record_append(self, item_id: str, rows: list[dict], history_path: str):
+        """
+        Rolls an item's state forward with rows appended to its history (dicts with 'price' and 'date_created').
+        Items not in the cache yet, or rows older than the item's last week, schedule a rebuild instead.
+        """
+        item_id = str(item_id)
+        with self._lock:
+            row = self.rows_by_id.get(item_id)
+            if row is None or item_id in self.pending_rebuilds:
+                self.pending_rebuilds[item_id] = history_path
+                return
+            for history_row in rows:
+                try:
+                    price = float(history_row.get('price'))
+                    day = (EPOCH_DATE.fromisoformat(str(history_row.get('date_created', ''))[:10]) - EPOCH_DATE).days
+                except (TypeError, ValueError):
+                    continue
+                if price != price:
+                    continue
+                if not self._roll_forward(row, int(week_number(day)), price):
+                    self.pending_rebuilds[item_id] = history_path
+                    return
+            self.items_updated += 1
+
+    def _roll_forward(self, row: int, week: int, price: float) -> bool:
+        """Applies one new weekly price to a row's state. Returns False if the week is older than the state. Caller holds the lock."""
+        gap = week - int(self.last_weeks[row])
+        if gap < 0:
+            return False
+        if gap == 0:
+            # Same week again: the new row replaces the last one
+            self.tails[row, -1] = price
+            self.emas[row] = np.where(np.isnan(self.previous_emas[row]), price,
+                                      EMA_ALPHAS * price + (1 - EMA_ALPHAS) * self.previous_emas[row])
+            return True
+        last_price = self.tails[row, -1]
+        # Weeks between the last row and this one carry the last price forward
+        filled_emas = last_price + (self.emas[row] - last_price) * (1 - EMA_ALPHAS) ** (gap - 1)
+        self.previous_emas[row] = filled_emas
+        self.emas[row] = EMA_ALPHAS * price + (1 - EMA_ALPHAS) * filled_emas
+        if gap >= TAIL_WEEKS:
+            new_tail = np.full(TAIL_WEEKS, last_price)
+        else:
+            new_tail = np.concatenate([self.tails[row, gap:], np.full(gap - 1, last_price)])
+            new_tail = np.append(new_tail, 0.0)
+        new_tail[-1] = price
+        self.tails[row] = new_tail
+        self.last_weeks[row] = week
+        return True
+
+    def rebuild(self, history_paths_by_id: dict, history_store: HistoryStore = None):
+        """
+        Recomputes the state of the given items (item_id -> history path) from their full histories,
+        all at once, adding items that are not cached yet.
+        """
+        if not history_paths_by_id:
+            return
+        item_ids = list(history_paths_by_id)
+        history_paths = [history_paths_by_id[item_id] for item_id in item_ids]
+        raw_prices, first_week = load_weekly_matrix(history_paths, history_store)
+        prices = forward_fill(raw_prices)
+        observed = ~np.isnan(raw_prices)
+        last_columns = prices.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+
+        # Tail columns end at each item's own last row; columns before the first week stay NaN
+        tail_columns = last_columns[:, None] - (TAIL_WEEKS - 1) + np.arange(TAIL_WEEKS)
+        tails = np.take_along_axis(prices, np.clip(tail_columns, 0, None), axis=1)
+        tails[tail_columns < 0] = np.nan
+        rows = np.arange(len(item_ids))
+        emas = np.full((len(item_ids), len(EMA_PERIODS_WEEKS)), np.nan)
+        previous_emas = np.full((len(item_ids), len(EMA_PERIODS_WEEKS)), np.nan)
+        for number, period in enumerate(EMA_PERIODS_WEEKS):
+            ema = exponential_moving_average(prices, period)
+            emas[:, number] = ema[rows, last_columns]
+            previous_emas[:, number] = np.where(last_columns > 0, ema[rows, np.maximum(last_columns - 1, 0)], np.nan)
+
+        with self._lock:
+            has_rows = observed.any(axis=1)
+            for new_row, item_id in enumerate(item_ids):
+                if not has_rows[new_row]:
+                    self._remove(item_id)
+                    continue
+                row = self.rows_by_id.get(item_id)
+                if row is None:
+                    row = len(self.item_ids)
+                    self.rows_by_id[item_id] = row
+                    self.item_ids.append(item_id)
+                    self.paths.append(history_paths[new_row])
+                    self.last_weeks = np.append(self.last_weeks, 0)
+                    self.tails = np.vstack([self.tails, np.full((1, TAIL_WEEKS), np.nan)])
+                    self.emas = np.vstack([self.emas, np.full((1, len(EMA_PERIODS_WEEKS)), np.nan)])
+                    self.previous_emas = np.vstack([self.previous_emas, np.full((1, len(EMA_PERIODS_WEEKS)), np.nan)])
+                self.paths[row] = history_paths[new_row]
+                self.last_weeks[row] = first_week + last_columns[new_row]
+                self.tails[row] = tails[new_row]
+                self.emas[row] = emas[new_row]
+                self.previous_emas[row] = previous_emas[new_row]
+                self.pending_rebuilds.pop(item_id, None)
+
+    def _remove(self, item_id: str):
+        """Drops one item's state. Caller holds the lock."""
+        self.pending_rebuilds.pop(item_id, None)
+        row = self.rows_by_id.pop(item_id, None)
+        if row is None:
+            return
+        keep = np.ones(len(self.item_ids), dtype=bool)
+        keep[row] = False
+        self._keep_rows(keep)
+
+    def _keep_rows(self, keep: np.ndarray):
+        self.item_ids = [item_id for item_id, kept in zip(self.item_ids, keep) if kept]
+        self.paths = [path for path, kept in zip(self.paths, keep) if kept]
+        self.last_weeks = self.last_weeks[keep]
+        self.tails = self.tails[keep]
+        self.emas = self.emas[keep]
+        self.previous_emas = self.previous_emas[keep]
+        self.rows_by_id = {item_id: row for row, item_id in enumerate(self.item_ids)}
+
+    def evict_missing(self, catalog_item_ids) -> int:
+        """
+        Drops the state of items that are no longer in the catalog. Returns the number evicted.
+        """
+        catalog_item_ids = {str(item_id) for item_id in catalog_item_ids}
+        with self._lock:
+            for item_id in [item_id for item_id in self.pending_rebuilds if item_id not in catalog_item_ids]:
+                del self.pending_rebuilds[item_id]
+            keep = np.array([item_id in catalog_item_ids for item_id in self.item_ids], dtype=bool)
+            evicted = int(len(keep) - keep.sum())
+            if evicted:
+                self._keep_rows(keep)
+        return evicted
+
+    def refresh(self, catalog_item_ids=None, history_store: HistoryStore = None):
+        """
+        Rebuilds the items marked during this run, evicts items missing from catalog_item_ids
+        (when given) and saves the cache.
+        """
+        rebuilt = len(self.pending_rebuilds)
+        self.rebuild(dict(self.pending_rebuilds), history_store)
+        evicted = self.evict_missing(catalog_item_ids) if catalog_item_ids is not None else 0
+        self.save()
+        print(f"Indicator cache: {self.items_updated} items rolled forward, {rebuilt} rebuilt, {evicted} evicted ({len(self.item_ids)} cached).")
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            temp_path = self.cache_path + '.tmp.npz'
+            np.savez(temp_path, item_ids=np.array(self.item_ids, dtype=str), paths=np.array(self.paths, dtype=str),
+                     last_weeks=self.last_weeks, tails=self.tails, emas=self.emas, previous_emas=self.previous_emas)
+            os.replace(temp_path, self.cache_path)
+
+    def current_indicators(self) -> tuple[dict, int]:
+        """
+        Returns (indicators, current week) for every cached item as of the latest week of any item,
+        in the same form as market_indicators.compute_indicators. Items whose last row is older
+        have their last price carried forward, as in the full computation.
+        """
+        current_week = int(self.last_weeks.max()) if len(self.last_weeks) else 0
+        gaps = current_week - self.last_weeks
+        # Window column j is week current_week - (TAIL_WEEKS - 1) + j, i.e. tail column j + gap (clipped to the last one)
+        window = np.take_along_axis(self.tails, np.minimum(gaps[:, None] + np.arange(TAIL_WEEKS), TAIL_WEEKS - 1), axis=1)
+        indicators = compute_indicators(window)
+        last_prices = self.tails[:, -1]
+        for number, period in enumerate(EMA_PERIODS_WEEKS):
+            ema_now = last_prices + (self.emas[:, number] - last_prices) * (1 - EMA_ALPHAS[number]) ** gaps
+            indicators[f'ema_{period}'] = np.full(window.shape, np.nan)
+            indicators[f'ema_{period}'][:, -1] = ema_now
+        return indicators, current_week
+
+    def write_screener(self, output_file: str = MARKET_SCREENER_CSV_FILE, items_csv_path: str = ITEMS_CSV_FILE):
+        indicators, current_week = self.current_indicators()
+        rows = build_screener(self.paths, self.last_weeks, current_week, indicators, load_item_names(items_csv_path))
+        write_screener_csv(rows, output_file)
+        print(f"Screener for {len(rows)} items written to {output_file} from the indicator cache.")
+        print_screener_summary(rows)
+
+def build_indicator_cache(histories_dir: str = HISTORIES_BASE_DIR, cache_path: str = INDICATOR_CACHE_FILE) -> IndicatorCache:
+    """
+    (Re)builds the indicator cache from every history.
+    """
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    history_store = HistoryStore() if HistoryStore.exists() else None
+    cache = IndicatorCache(cache_path)
+    history_paths = find_history_files(histories_dir, history_store)
+    cache.rebuild({os.path.basename(path)[:-len("_history.csv")]: path for path in history_paths}, history_store)
+    cache.save()
+    print(f"Built indicator cache {cache_path} for {len(cache.item_ids)} items.")
+    return cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the incremental indicator cache.")
+    parser.add_argument('command', choices=['build', 'screener'],
+                        help="build: compute the state of every item; screener: write the screener table from the cache")
+    parser.add_argument('--histories-dir', default=HISTORIES_BASE_DIR)
+    parser.add_argument('--output', default=MARKET_SCREENER_CSV_FILE)
+    parser.add_argument('--items-csv', default=ITEMS_CSV_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_indicator_cache(args.histories_dir)
+    else:
+        IndicatorCache().write_screener(args.output, args.items_csv)
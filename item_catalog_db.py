@@ -0,0 +1,113 @@
+import os
+import csv
+import sqlite3
+
+# Configuration
+CATALOG_DB_FILE = "item_catalog.sqlite3"
+CATALOG_COLUMNS = ['id', 'name', 'category_name', 'group_name', 'weekly_average_price', 'icon_id', 'date_created', 'date_updated', 'icon_url', 'icon_downloaded', 'needs_history_update']
+FLAG_COLUMNS = ('icon_downloaded', 'needs_history_update')
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    category_name TEXT,
+    group_name TEXT,
+    weekly_average_price TEXT,
+    icon_id TEXT,
+    date_created TEXT,
+    date_updated TEXT,
+    icon_url TEXT,
+    icon_downloaded INTEGER NOT NULL DEFAULT 0,
+    needs_history_update INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_items_category_group ON items (category_name, group_name);
+CREATE INDEX IF NOT EXISTS idx_items_date_updated ON items (date_updated);
+CREATE INDEX IF NOT EXISTS idx_items_needs_history_update ON items (id) WHERE needs_history_update = 1;
+CREATE INDEX IF NOT EXISTS idx_items_icon_missing ON items (id) WHERE icon_downloaded = 0;
+"""
+
+def open_catalog_db(db_path: str = CATALOG_DB_FILE) -> sqlite3.Connection:
+    """
+    Opens (creating if needed) the SQLite item catalog.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA_SQL)
+    return conn
+
+def _row_to_db_values(row: dict) -> tuple:
+    values = []
+    for column in CATALOG_COLUMNS:
+        value = row.get(column, '')
+        if column in FLAG_COLUMNS:
+            value = 1 if value in ('True', True, 1) else 0
+        elif column == 'id':
+            value = int(value)
+        values.append(value)
+    return tuple(values)
+
+def _db_row_to_item(db_row: sqlite3.Row) -> dict:
+    """
+    Converts a database row to the string form used in item_lists.csv.
+    """
+    item = {column: ('' if db_row[column] is None else str(db_row[column])) for column in CATALOG_COLUMNS}
+    for column in FLAG_COLUMNS:
+        item[column] = 'True' if db_row[column] else 'False'
+    return item
+
+def upsert_items(conn: sqlite3.Connection, rows, clear_history_update_flags: bool = False) -> int:
+    """
+    Inserts or updates the given item rows (dicts in item_lists.csv form) in one transaction.
+    With clear_history_update_flags, every other item's needs_history_update is reset in the same transaction.
+    Returns the number of rows written.
+    """
+    placeholders = ', '.join('?' for _ in CATALOG_COLUMNS)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in CATALOG_COLUMNS if column != 'id')
+    sql = f"INSERT INTO items ({', '.join(CATALOG_COLUMNS)}) VALUES ({placeholders}) ON CONFLICT(id) DO UPDATE SET {updates}"
+    values = [_row_to_db_values(row) for row in rows if str(row.get('id', '')).isdigit()]
+    with conn:
+        if clear_history_update_flags:
+            conn.execute("UPDATE items SET needs_history_update = 0 WHERE needs_history_update = 1")
+        conn.executemany(sql, values)
+    return len(values)
+
+def load_items(conn: sqlite3.Connection) -> dict:
+    """
+    Returns every catalog item keyed by ID (as a string), in item_lists.csv form.
+    """
+    return {str(db_row['id']): _db_row_to_item(db_row) for db_row in conn.execute("SELECT * FROM items ORDER BY id")}
+
+def item_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+def item_ids_needing_history_update(conn: sqlite3.Connection) -> list[str]:
+    return [str(db_row[0]) for db_row in conn.execute("SELECT id FROM items WHERE needs_history_update = 1 ORDER BY id")]
+
+def items_missing_icon(conn: sqlite3.Connection) -> list[dict]:
+    return [_db_row_to_item(db_row) for db_row in conn.execute("SELECT * FROM items WHERE icon_downloaded = 0 ORDER BY id")]
+
+def import_csv(conn: sqlite3.Connection, csv_path: str) -> int:
+    """
+    Loads an existing item_lists.csv into the catalog. Returns the number of rows imported.
+    """
+    with open(csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+        return upsert_items(conn, csv.DictReader(csvfile))
+
+def export_csv(conn: sqlite3.Connection, csv_path: str) -> int:
+    """
+    Writes the catalog to csv_path in item_lists.csv format, replacing the file only once it is complete.
+    Returns the number of rows written.
+    """
+    temp_path = csv_path + '.tmp'
+    rows_written = 0
+    with open(temp_path, mode='w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CATALOG_COLUMNS, lineterminator='\n') # LF, like ItemTable.write_csv
+        writer.writeheader()
+        for db_row in conn.execute("SELECT * FROM items ORDER BY id"):
+            writer.writerow(_db_row_to_item(db_row))
+            rows_written += 1
+    os.replace(temp_path, csv_path)
+    return rows_written
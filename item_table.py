@@ -0,0 +1,342 @@
+import os
+import csv
+import sys
+import math
+import argparse
+from array import array
+from functools import lru_cache
+from collections.abc import Mapping
+
+from history_store import iso_to_epoch, epoch_to_iso
+try:
+    import numpy as np # Only used to vectorize the flag filters
+except ImportError:
+    np = None
+
+# Configuration
+ITEM_COLUMNS = ['id', 'name', 'category_name', 'group_name', 'weekly_average_price', 'icon_id', 'date_created', 'date_updated', 'icon_url', 'icon_downloaded', 'needs_history_update']
+DEFAULT_ICON_URL_TEMPLATE = "https://echoes.mobi/public/icons/{icon_id}.png" # icon_url is only stored when it differs from this
+MISSING_ICON_ID = -1
+FLAG_COLUMNS = ('icon_downloaded', 'needs_history_update') # 'True'/'False'; default 'False' when a row has no value
+
+def _format_price(price: float) -> str:
+    return "" if math.isnan(price) else f"{price:.2f}"
+
+@lru_cache(maxsize=16384) # Most items share a handful of date_created/date_updated values
+def _parse_timestamp(text: str) -> tuple[int, bool]:
+    """Returns (epoch seconds, whether epoch_to_iso gives text back)."""
+    epoch_seconds = iso_to_epoch(text)
+    return epoch_seconds, _format_timestamp(epoch_seconds) == text
+
+@lru_cache(maxsize=16384)
+def _format_timestamp(epoch_seconds: int) -> str:
+    return epoch_to_iso(epoch_seconds)
+
+class ItemTable(Mapping):
+    """
+    The item list (item_lists.csv) held as typed columns, one array per column:
+    int64 ids and icon ids, float64 prices (NaN when missing), epoch-second timestamps (0 when missing)
+    and one byte per flag. Category and group names are interned, and icon_url is only stored when it
+    isn't the default URL for the item's icon_id.
+
+    Rows are addressed by position; index_of maps an item ID (int or str) to its row. As a Mapping the
+    table also reads like the old dict of rows: table['<id>'] is the row in item_lists.csv form.
+
+    Values that the typed form would not write back character for character (e.g. a price with more
+    than two decimals, or a flag other than 'True'/'False') keep their original text alongside, so
+    read_csv followed by write_csv reproduces the file exactly.
+    """
+    def __init__(self, icon_url_template: str = DEFAULT_ICON_URL_TEMPLATE):
+        self.icon_url_template = icon_url_template
+        self.ids = array('q')
+        self.names = []
+        self.category_names = []
+        self.group_names = []
+        self.prices = array('d')
+        self.icon_ids = array('q')
+        self.date_created = array('q')
+        self.date_updated = array('q')
+        self.icon_urls = [] # None when the URL is icon_url_template for the row's icon_id
+        self.icon_downloaded = bytearray()
+        self.needs_history_update = bytearray()
+        self.rows_by_id = {}
+        self._interned = {}
+        self._raw_text = {} # (column, row) -> original text the typed value doesn't reproduce
+
+    # Loading and saving
+
+    @classmethod
+    def from_rows(cls, rows, **options) -> 'ItemTable':
+        """Builds a table from item rows in item_lists.csv form (dicts of strings)."""
+        table = cls(**options)
+        for row in rows:
+            if table.index_of(row.get('id')) is None:
+                table.append(row)
+        return table
+
+    @classmethod
+    def read_csv(cls, csv_path: str, **options) -> 'ItemTable':
+        with open(csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+            return cls.from_rows(csv.DictReader(csvfile), **options)
+
+    def write_csv(self, csv_path: str) -> int:
+        """
+        Writes the table to csv_path in item_lists.csv format via a temp file, so an interrupted
+        write leaves the previous file intact. Returns the number of rows written.
+        """
+        temp_path = csv_path + '.tmp'
+        with open(temp_path, mode='w', encoding='utf-8', newline='') as csvfile:
+            writer = csv.writer(csvfile, lineterminator='\n') # LF line endings, as item_lists.csv is committed
+            writer.writerow(ITEM_COLUMNS)
+            writer.writerows(zip(*(self._column_texts(column) for column in ITEM_COLUMNS)))
+        os.replace(temp_path, csv_path)
+        return len(self.ids)
+
+    # Rows
+
+    def index_of(self, item_id) -> int | None:
+        """Returns the row of item_id (int or numeric string), or None if it isn't in the table."""
+        try:
+            return self.rows_by_id.get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+
+    def append(self, row: dict) -> int:
+        """
+        Adds an item from a dict in item_lists.csv (or API) form; missing columns are empty and
+        missing flags 'False'. Raises ValueError if the row has no integer id. Returns the new row.
+        """
+        item_id = int(row.get('id'))
+        index = len(self.ids)
+        self.ids.append(item_id)
+        for column_values in (self.names, self.category_names, self.group_names, self.icon_urls):
+            column_values.append(None)
+        for column_values in (self.prices, self.date_created, self.date_updated):
+            column_values.append(0)
+        self.icon_ids.append(MISSING_ICON_ID)
+        self.icon_downloaded.append(0)
+        self.needs_history_update.append(0)
+        self.rows_by_id[item_id] = index
+        for column, setter in _COLUMN_SETTERS.items():
+            text = row.get(column)
+            text = ('False' if column in FLAG_COLUMNS else '') if text is None else str(text)
+            if not setter(self, index, text):
+                self._raw_text[(column, index)] = text
+        return index
+
+    def update(self, index: int, row: dict):
+        """Sets the columns present in row (strings in item_lists.csv form) for the item at index."""
+        for column, text in row.items():
+            if column in _COLUMN_SETTERS:
+                self.set_text(column, index, text)
+
+    def set_text(self, column: str, index: int, text: str):
+        """Sets one column of the item at index from its item_lists.csv text."""
+        text = '' if text is None else str(text)
+        if self._raw_text:
+            self._raw_text.pop((column, index), None)
+        if not _COLUMN_SETTERS[column](self, index, text):
+            self._raw_text[(column, index)] = text
+
+    # Column setters: store text in typed form and return whether the typed form writes it back unchanged
+
+    def _set_name(self, index: int, text: str) -> bool:
+        self.names[index] = text
+        return True
+
+    def _set_category_name(self, index: int, text: str) -> bool:
+        self.category_names[index] = self._interned.setdefault(text, text)
+        return True
+
+    def _set_group_name(self, index: int, text: str) -> bool:
+        self.group_names[index] = self._interned.setdefault(text, text)
+        return True
+
+    def _set_price(self, index: int, text: str) -> bool:
+        try:
+            price = float(text) if text else math.nan
+        except ValueError:
+            price = math.nan
+        self.prices[index] = price
+        return _format_price(price) == text
+
+    def _set_icon_id(self, index: int, text: str) -> bool:
+        if self.icon_urls[index] is None:
+            self.icon_urls[index] = self._default_icon_url(index) # Keep the URL as it was until it is normalized below
+        try:
+            icon_id = int(text) if text else MISSING_ICON_ID
+        except ValueError:
+            icon_id = MISSING_ICON_ID
+        self.icon_ids[index] = icon_id
+        if self.icon_urls[index] == self._default_icon_url(index):
+            self.icon_urls[index] = None
+        return (str(icon_id) if icon_id != MISSING_ICON_ID else "") == text
+
+    def _set_date_created(self, index: int, text: str) -> bool:
+        self.date_created[index], exact = _parse_timestamp(text)
+        return exact
+
+    def _set_date_updated(self, index: int, text: str) -> bool:
+        self.date_updated[index], exact = _parse_timestamp(text)
+        return exact
+
+    def _set_icon_url(self, index: int, text: str) -> bool:
+        self.icon_urls[index] = None if text == self._default_icon_url(index) else text
+        return True
+
+    def _set_icon_downloaded(self, index: int, text: str) -> bool:
+        self.icon_downloaded[index] = text == 'True'
+        return text in ('True', 'False')
+
+    def _set_needs_history_update(self, index: int, text: str) -> bool:
+        self.needs_history_update[index] = text == 'True'
+        return text in ('True', 'False')
+
+    def _default_icon_url(self, index: int) -> str | None:
+        icon_id = self.icon_ids[index]
+        return self.icon_url_template.format(icon_id=icon_id) if icon_id != MISSING_ICON_ID else None
+
+    def _typed_text(self, column: str, index: int) -> str:
+        if column == 'id':
+            return str(self.ids[index])
+        if column == 'name':
+            return self.names[index]
+        if column == 'category_name':
+            return self.category_names[index]
+        if column == 'group_name':
+            return self.group_names[index]
+        if column == 'weekly_average_price':
+            return _format_price(self.prices[index])
+        if column == 'icon_id':
+            return str(self.icon_ids[index]) if self.icon_ids[index] != MISSING_ICON_ID else ""
+        if column == 'date_created':
+            return _format_timestamp(self.date_created[index])
+        if column == 'date_updated':
+            return _format_timestamp(self.date_updated[index])
+        if column == 'icon_url':
+            icon_url = self.icon_urls[index]
+            return icon_url if icon_url is not None else (self._default_icon_url(index) or "")
+        if column == 'icon_downloaded':
+            return 'True' if self.icon_downloaded[index] else 'False'
+        if column == 'needs_history_update':
+            return 'True' if self.needs_history_update[index] else 'False'
+        raise KeyError(column)
+
+    def _column_texts(self, column: str) -> list[str]:
+        """Returns a whole column as item_lists.csv text."""
+        if column == 'id':
+            texts = [str(item_id) for item_id in self.ids]
+        elif column in ('name', 'category_name', 'group_name'):
+            texts = list(self.names if column == 'name' else self.category_names if column == 'category_name' else self.group_names)
+        elif column == 'weekly_average_price':
+            texts = [_format_price(price) for price in self.prices]
+        elif column == 'icon_id':
+            texts = [str(icon_id) if icon_id != MISSING_ICON_ID else "" for icon_id in self.icon_ids]
+        elif column in ('date_created', 'date_updated'):
+            texts = [_format_timestamp(epoch_seconds) for epoch_seconds in (self.date_created if column == 'date_created' else self.date_updated)]
+        elif column == 'icon_url':
+            texts = [self._typed_text('icon_url', index) for index in range(len(self.ids))]
+        else:
+            texts = ['True' if flag else 'False' for flag in (self.icon_downloaded if column == 'icon_downloaded' else self.needs_history_update)]
+        for (raw_column, index), raw_text in self._raw_text.items():
+            if raw_column == column:
+                texts[index] = raw_text
+        return texts
+
+    def text(self, column: str, index: int) -> str:
+        """Returns the value of column for the item at index as it appears in item_lists.csv."""
+        raw_text = self._raw_text.get((column, index)) if self._raw_text else None
+        return raw_text if raw_text is not None else self._typed_text(column, index)
+
+    def row(self, index: int) -> dict:
+        """Returns the item at index in item_lists.csv form (a new dict of strings)."""
+        return {column: self.text(column, index) for column in ITEM_COLUMNS}
+
+    def set_flag(self, column: str, index: int, value: bool):
+        self._raw_text.pop((column, index), None)
+        (self.icon_downloaded if column == 'icon_downloaded' else self.needs_history_update)[index] = bool(value)
+
+    def clear_history_update_flags(self):
+        self.needs_history_update[:] = bytes(len(self.needs_history_update))
+        for key in [key for key in self._raw_text if key[0] == 'needs_history_update']:
+            del self._raw_text[key]
+
+    # Filters
+
+    def _flagged_rows(self, flags: bytearray, value: bool) -> list[int]:
+        if np is not None:
+            flag_values = np.frombuffer(flags, dtype=np.uint8) if flags else np.zeros(0, dtype=np.uint8)
+            return np.flatnonzero(flag_values if value else flag_values == 0).tolist()
+        return [index for index, flag in enumerate(flags) if bool(flag) == value]
+
+    def rows_needing_history_update(self) -> list[int]:
+        return self._flagged_rows(self.needs_history_update, True)
+
+    def rows_missing_icon(self) -> list[int]:
+        return self._flagged_rows(self.icon_downloaded, False)
+
+    def item_ids(self, rows=None) -> list[str]:
+        """Returns the IDs (as strings) of the given rows, or of every item."""
+        return [str(self.ids[index]) for index in (range(len(self.ids)) if rows is None else rows)]
+
+    def newest_date_updated(self) -> int | None:
+        """Returns the latest date_updated in epoch seconds, or None if no item has one."""
+        return max(self.date_updated, default=0) or None
+
+    # Mapping of item ID (str) -> row in item_lists.csv form
+
+    def __getitem__(self, item_id) -> dict:
+        index = self.index_of(item_id)
+        if index is None:
+            raise KeyError(item_id)
+        return self.row(index)
+
+    def __contains__(self, item_id) -> bool:
+        return self.index_of(item_id) is not None
+
+    def __iter__(self):
+        return iter(self.item_ids())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the table, including the strings it references."""
+        total = sum(values.buffer_info()[1] * values.itemsize for values in (self.ids, self.prices, self.icon_ids, self.date_created, self.date_updated))
+        total += len(self.icon_downloaded) + len(self.needs_history_update)
+        total += sum(sys.getsizeof(values) for values in (self.names, self.category_names, self.group_names, self.icon_urls, self.rows_by_id))
+        total += sum(sys.getsizeof(name) for name in self.names)
+        total += sum(sys.getsizeof(text) for text in self._interned)
+        total += sum(sys.getsizeof(icon_url) for icon_url in self.icon_urls if icon_url is not None)
+        return total
+
+_COLUMN_SETTERS = {
+    'name': ItemTable._set_name,
+    'category_name': ItemTable._set_category_name,
+    'group_name': ItemTable._set_group_name,
+    'weekly_average_price': ItemTable._set_price,
+    'icon_id': ItemTable._set_icon_id,
+    'date_created': ItemTable._set_date_created,
+    'date_updated': ItemTable._set_date_updated,
+    'icon_url': ItemTable._set_icon_url,
+    'icon_downloaded': ItemTable._set_icon_downloaded,
+    'needs_history_update': ItemTable._set_needs_history_update
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load item_lists.csv into an ItemTable and report its size, or check that it round-trips.")
+    parser.add_argument('csv_path', nargs='?', default="item_lists.csv")
+    parser.add_argument('--check', action='store_true', help="Write the table back to a temp file and compare it with the original")
+    args = parser.parse_args()
+
+    table = ItemTable.read_csv(args.csv_path)
+    print(f"{len(table)} items, about {table.nbytes() / 1e6:.2f} MB ({table.nbytes() / max(len(table), 1):.0f} bytes per item), "
+          f"{len(table._raw_text)} values kept as text")
+    print(f"{len(table.rows_needing_history_update())} items need a history update, {len(table.rows_missing_icon())} are missing an icon")
+    if args.check:
+        check_path = args.csv_path + '.check'
+        table.write_csv(check_path)
+        with open(args.csv_path, 'rb') as original, open(check_path, 'rb') as written:
+            identical = original.read() == written.read()
+        os.remove(check_path)
+        print("Round trip is lossless." if identical else "Round trip differs from the original file.")
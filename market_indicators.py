@@ -0,0 +1,271 @@
+import os
+import csv
+import time
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from history_store import HistoryStore, HISTORIES_BASE_DIR
+from build_item_stats import EPOCH_DATE, load_price_series
+
+# Configuration
+ITEMS_CSV_FILE = "item_lists.csv"
+MARKET_SCREENER_CSV_FILE = "market_screener.csv"
+SMA_PERIODS_WEEKS = (4, 12, 26)
+EMA_PERIODS_WEEKS = (4, 12)
+VOLATILITY_WINDOW_WEEKS = 8
+BOLLINGER_PERIOD_WEEKS = 20
+BOLLINGER_STDDEVS = 2.0
+ZSCORE_WINDOW_WEEKS = 12
+TOP_MOVERS_SHOWN = 10
+
+def week_number(days):
+    """
+    Consecutive Monday-based week numbers from days since epoch (1970-01-01 was a Thursday).
+    """
+    return (np.asarray(days) + 3) // 7
+
+def week_start_date(week: int) -> str:
+    return EPOCH_DATE.fromordinal(EPOCH_DATE.toordinal() + int(week) * 7 - 3).isoformat()
+
+def find_history_files(histories_dir: str = HISTORIES_BASE_DIR, history_store: HistoryStore = None) -> list[str]:
+    """
+    Lists one history path per item, as laid out by fetch_and_save_histories
+    (<histories_dir>/<category>/<group>/<item>/<item_id>_history.csv). The store's index is used when given.
+    Items present under several directories are only listed once (first in sorted order).
+    """
+    if history_store is not None:
+        paths = sorted(entry['path'] for entry in history_store.items.values() if entry.get('path'))
+    else:
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(histories_dir):
+            dirnames.sort()
+            paths.extend(os.path.join(dirpath, f).replace(os.sep, '/') for f in sorted(filenames) if f.endswith("_history.csv"))
+    seen_item_ids = set()
+    unique_paths = []
+    for path in paths:
+        item_id = os.path.basename(path)[:-len("_history.csv")]
+        if item_id not in seen_item_ids:
+            seen_item_ids.add(item_id)
+            unique_paths.append(path)
+    return unique_paths
+
+def load_weekly_matrix(history_paths: list[str], history_store: HistoryStore = None) -> tuple[np.ndarray, int]:
+    """
+    Loads every history into one (items x weeks) float64 matrix on a shared weekly calendar.
+    Column 0 is the earliest week seen in any history; when an item has several rows in a week
+    the last one wins. Weeks without a row are NaN. Returns (matrix, week number of column 0).
+    """
+    row_numbers = []
+    weeks = []
+    prices = []
+    for row, history_path in enumerate(history_paths):
+        days, series_prices = load_price_series(history_path, history_store)
+        has_price = ~np.isnan(series_prices)
+        weeks.append(week_number(days[has_price]))
+        prices.append(series_prices[has_price])
+        row_numbers.append(np.full(int(has_price.sum()), row))
+    if not history_paths:
+        return np.full((0, 1), np.nan), 0
+
+    row_numbers = np.concatenate(row_numbers).astype(np.int64)
+    weeks = np.concatenate(weeks).astype(np.int64)
+    prices = np.concatenate(prices)
+    first_week = int(weeks.min()) if len(weeks) else 0
+    week_count = int(weeks.max()) - first_week + 1 if len(weeks) else 1
+    columns = weeks - first_week
+
+    # Stable sort by cell keeps file order within a cell, so the last row of each cell is the latest
+    cells = row_numbers * week_count + columns
+    order = np.argsort(cells, kind='stable')
+    cells = cells[order]
+    is_last_in_cell = np.append(cells[1:] != cells[:-1], True)
+    matrix = np.full((len(history_paths), week_count), np.nan)
+    matrix.flat[cells[is_last_in_cell]] = prices[order][is_last_in_cell]
+    return matrix, first_week
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """
+    Carries each item's last known price forward over weeks without a row. Weeks before the
+    first row stay NaN.
+    """
+    valid = ~np.isnan(matrix)
+    last_valid_column = np.maximum.accumulate(np.where(valid, np.arange(matrix.shape[1]), 0), axis=1)
+    filled = matrix[np.arange(matrix.shape[0])[:, None], last_valid_column]
+    filled[np.cumsum(valid, axis=1) == 0] = np.nan
+    return filled
+
+def _rolling(matrix: np.ndarray, window: int, reducer) -> np.ndarray:
+    """
+    Applies reducer over trailing windows along the week axis; the first window-1 weeks
+    (and any window containing NaN) are NaN.
+    """
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] >= window:
+        result[:, window - 1:] = reducer(sliding_window_view(matrix, window, axis=1), axis=-1)
+    return result
+
+def rolling_mean(matrix: np.ndarray, window: int) -> np.ndarray:
+    return _rolling(matrix, window, np.mean)
+
+def rolling_std(matrix: np.ndarray, window: int) -> np.ndarray:
+    return _rolling(matrix, window, np.std)
+
+def exponential_moving_average(matrix: np.ndarray, period: int) -> np.ndarray:
+    """
+    EMA with alpha = 2 / (period + 1), seeded with each item's first price.
+    Iterates over weeks, with every item updated at once per week.
+    """
+    alpha = 2.0 / (period + 1)
+    ema = np.full(matrix.shape, np.nan)
+    previous = np.full(matrix.shape[0], np.nan)
+    for column in range(matrix.shape[1]):
+        current = matrix[:, column]
+        previous = np.where(np.isnan(previous), current, alpha * current + (1 - alpha) * previous)
+        previous = np.where(np.isnan(current), np.nan, previous)
+        ema[:, column] = previous
+    return ema
+
+def compute_indicators(prices: np.ndarray) -> dict:
+    """
+    Computes every indicator for all items at once from a forward-filled (items x weeks) price matrix.
+    Returns a dict of matrices with the same shape as prices.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        indicators = {'price': prices}
+        for period in SMA_PERIODS_WEEKS:
+            indicators[f'sma_{period}'] = rolling_mean(prices, period)
+        for period in EMA_PERIODS_WEEKS:
+            indicators[f'ema_{period}'] = exponential_moving_average(prices, period)
+
+        log_prices = np.log(np.where(prices > 0, prices, np.nan))
+        weekly_returns = np.full(prices.shape, np.nan)
+        weekly_returns[:, 1:] = np.diff(log_prices, axis=1)
+        indicators[f'volatility_{VOLATILITY_WINDOW_WEEKS}w'] = rolling_std(weekly_returns, VOLATILITY_WINDOW_WEEKS) * 100
+
+        middle = rolling_mean(prices, BOLLINGER_PERIOD_WEEKS)
+        deviation = rolling_std(prices, BOLLINGER_PERIOD_WEEKS)
+        indicators['bollinger_middle'] = middle
+        indicators['bollinger_upper'] = middle + BOLLINGER_STDDEVS * deviation
+        indicators['bollinger_lower'] = middle - BOLLINGER_STDDEVS * deviation
+        band_width = indicators['bollinger_upper'] - indicators['bollinger_lower']
+        indicators['percent_b'] = np.where(band_width > 0, (prices - indicators['bollinger_lower']) / band_width, np.nan)
+
+        zscore_mean = rolling_mean(prices, ZSCORE_WINDOW_WEEKS)
+        zscore_std = rolling_std(prices, ZSCORE_WINDOW_WEEKS)
+        indicators[f'zscore_{ZSCORE_WINDOW_WEEKS}w'] = np.where(zscore_std > 0, (prices - zscore_mean) / zscore_std, np.nan)
+    return indicators
+
+def _percent_change(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+
+def load_item_names(items_csv_path: str) -> dict:
+    names = {}
+    if os.path.exists(items_csv_path):
+        with open(items_csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                names[row.get('id', '')] = (row.get('name', ''), row.get('category_name', ''), row.get('group_name', ''))
+    return names
+
+def _format_number(value) -> str:
+    return "" if not np.isfinite(value) else f"{value:.4f}".rstrip('0').rstrip('.')
+
+def last_observed_weeks(raw_prices: np.ndarray, first_week: int) -> np.ndarray:
+    """
+    Week number of each item's last row (first_week - 1 for items without any).
+    """
+    observed = ~np.isnan(raw_prices)
+    last_column = raw_prices.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+    return np.where(observed.any(axis=1), first_week + last_column, first_week - 1)
+
+def build_screener(history_paths: list[str], last_weeks: np.ndarray, current_week: int, indicators: dict,
+                   item_names: dict) -> list[dict]:
+    """
+    One screener row per item with its indicator values as of current_week (the last column of
+    each indicator matrix), 1- and 4-week changes and a signal ('breakout_up' above the upper
+    Bollinger band, 'breakout_down' below the lower one). last_weeks holds the week of each
+    item's last row. Rows are sorted by the size of the 4-week move, largest first.
+    """
+    prices = indicators['price']
+    week_count = prices.shape[1]
+    latest = prices[:, -1]
+    change_1w = _percent_change(latest, prices[:, -2]) if week_count > 1 else np.full(len(latest), np.nan)
+    change_4w = _percent_change(latest, prices[:, -5]) if week_count > 4 else np.full(len(latest), np.nan)
+    signals = np.where(latest > indicators['bollinger_upper'][:, -1], 'breakout_up',
+                       np.where(latest < indicators['bollinger_lower'][:, -1], 'breakout_down', ''))
+
+    indicator_names = [name for name in indicators if name != 'price']
+    rows = []
+    for row, history_path in enumerate(history_paths):
+        if last_weeks[row] > current_week or np.isnan(latest[row]):
+            continue
+        item_id = os.path.basename(history_path)[:-len("_history.csv")]
+        path_parts = history_path.split('/')
+        name, category, group = item_names.get(item_id, (path_parts[-2] if len(path_parts) >= 2 else '',
+                                                         path_parts[1] if len(path_parts) >= 5 else '',
+                                                         path_parts[2] if len(path_parts) >= 5 else ''))
+        screener_row = {
+            'item_id': item_id,
+            'name': name,
+            'category_name': category,
+            'group_name': group,
+            'history_path': history_path,
+            'last_week': week_start_date(last_weeks[row]),
+            'weeks_since_update': int(current_week - last_weeks[row]),
+            'price': _format_number(latest[row]),
+            'change_1w_pct': _format_number(change_1w[row]),
+            'change_4w_pct': _format_number(change_4w[row]),
+            'signal': signals[row]
+        }
+        for name in indicator_names:
+            screener_row[name] = _format_number(indicators[name][row, -1])
+        rows.append((-abs(change_4w[row]) if np.isfinite(change_4w[row]) else 0.0, screener_row))
+    rows.sort(key=lambda entry: entry[0])
+    return [screener_row for _, screener_row in rows]
+
+def write_screener_csv(rows: list[dict], output_file: str):
+    if not rows:
+        print("No items to write to the screener.")
+        return
+    temp_path = output_file + '.tmp'
+    with open(temp_path, mode='w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, output_file)
+
+def run_market_indicators(histories_dir: str = HISTORIES_BASE_DIR, output_file: str = MARKET_SCREENER_CSV_FILE,
+                          items_csv_path: str = ITEMS_CSV_FILE):
+    """
+    Computes the indicators for every item's weekly series and writes the screener table.
+    """
+    start_time = time.monotonic()
+    history_store = HistoryStore() if HistoryStore.exists() else None
+    history_paths = find_history_files(histories_dir, history_store)
+    raw_prices, first_week = load_weekly_matrix(history_paths, history_store)
+    loaded_time = time.monotonic()
+    indicators = compute_indicators(forward_fill(raw_prices))
+    rows = build_screener(history_paths, last_observed_weeks(raw_prices, first_week), first_week + raw_prices.shape[1] - 1,
+                          indicators, load_item_names(items_csv_path))
+    write_screener_csv(rows, output_file)
+    end_time = time.monotonic()
+
+    print(f"Computed indicators for {raw_prices.shape[0]} items over {raw_prices.shape[1]} weeks "
+          f"(load {loaded_time - start_time:.2f}s, compute {end_time - loaded_time:.2f}s). Screener written to {output_file}.")
+    print_screener_summary(rows)
+
+def print_screener_summary(rows: list[dict]):
+    print(f"Breakouts: {sum(1 for row in rows if row['signal'] == 'breakout_up')} up, "
+          f"{sum(1 for row in rows if row['signal'] == 'breakout_down')} down.")
+    print("Top movers (4 weeks):")
+    for row in rows[:TOP_MOVERS_SHOWN]:
+        print(f"  {row['name']} ({row['category_name']}/{row['group_name']}): {row['change_4w_pct']}% to {row['price']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute market-wide indicators and write a screener table.")
+    parser.add_argument('--histories-dir', default=HISTORIES_BASE_DIR)
+    parser.add_argument('--output', default=MARKET_SCREENER_CSV_FILE)
+    parser.add_argument('--items-csv', default=ITEMS_CSV_FILE)
+    args = parser.parse_args()
+    run_market_indicators(args.histories_dir, args.output, args.items_csv)
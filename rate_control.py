@@ -0,0 +1,150 @@
+import time
+import threading
+from collections import deque
+
+from run_metrics import endpoint_name
+
+# Configuration
+ENDPOINT_BUDGETS = { # Endpoint path (see run_metrics.endpoint_name) -> budget; other endpoints share 'default'
+    '/api/items': 'items',
+    '/api/v2/item_prices': 'items',
+    '/public/icons': 'icons',
+    '/api/item_weekly_average_prices': 'histories'
+}
+INITIAL_REQUESTS_PER_SECOND = 10.0
+MIN_REQUESTS_PER_SECOND = 0.5
+MAX_BUDGET_REQUESTS_PER_SECOND = 50.0 # Per budget; http_client's global cap still applies on top
+INITIAL_CONCURRENCY = 4.0
+MAX_CONCURRENCY = 16 # Matches http_client.POOL_MAXSIZE
+ADDITIVE_INCREASE = 2.0 # Added to the rate (req/s) and the concurrency limit per window of healthy requests
+MULTIPLICATIVE_DECREASE = 0.5 # Applied to both on congestion
+DECREASE_COOLDOWN_SECONDS = 1.0 # One decrease per burst of failures, not one per failed request
+RECENT_OUTCOMES = 20 # Attempts over which the 5xx/timeout share is measured
+CONGESTION_ERROR_SHARE = 0.1 # 5xx/timeouts count as congestion once they reach this share of recent attempts; 429 always does
+LATENCY_TOLERANCE = 3.0 # Successes slower than this multiple of the best smoothed latency hold the budget steady
+LATENCY_SLACK_SECONDS = 0.05 # Absolute slack so jitter on very fast responses doesn't count as slow
+LATENCY_SMOOTHING = 0.2
+
+class AimdBudget:
+    """
+    Additive-increase/multiplicative-decrease budget for one group of endpoints: a request rate,
+    enforced by spacing requests evenly, and a limit on requests in flight.
+    Healthy responses grow both by about ADDITIVE_INCREASE per window (one window being as many
+    requests as the current rate or limit). Both are cut by MULTIPLICATIVE_DECREASE on a 429, or
+    once 5xx, connection errors and timeouts make up CONGESTION_ERROR_SHARE of the recent attempts,
+    so an isolated server error doesn't throttle a healthy run.
+    Thread-safe: call acquire() before each attempt and release() with its outcome afterwards.
+    """
+    def __init__(self, name: str, initial_rate: float = INITIAL_REQUESTS_PER_SECOND, initial_concurrency: float = INITIAL_CONCURRENCY,
+                 max_rate: float = MAX_BUDGET_REQUESTS_PER_SECOND, max_concurrency: int = MAX_CONCURRENCY):
+        self.name = name
+        self.rate = initial_rate
+        self.concurrency = initial_concurrency
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._next_slot = 0.0
+        self._last_decrease = 0.0
+        self._smoothed_latency = None
+        self._best_latency = None
+        self._recent_errors = deque(maxlen=RECENT_OUTCOMES)
+        self.requests = 0
+        self.congestion_signals = 0
+        self.decreases = 0
+        self.peak_rate = self.rate
+        self.peak_concurrency = self.concurrency
+        self.peak_in_flight = 0
+
+    def acquire(self):
+        """Waits for a free slot within the concurrency limit and the next opening in the rate."""
+        with self._condition:
+            while self.in_flight >= max(int(self.concurrency), 1):
+                self._condition.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def release(self, status_code: int | None, latency_seconds: float):
+        """
+        Frees the slot taken by acquire() and adapts the budget to the attempt's outcome.
+        status_code is None for connection errors and timeouts.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+            server_error = status_code is None or status_code >= 500
+            self._recent_errors.append(server_error)
+            if status_code == 429 or server_error:
+                self.congestion_signals += 1
+                now = time.monotonic()
+                congested = status_code == 429 or sum(self._recent_errors) >= CONGESTION_ERROR_SHARE * RECENT_OUTCOMES
+                if congested and now - self._last_decrease >= DECREASE_COOLDOWN_SECONDS:
+                    self._last_decrease = now
+                    self.decreases += 1
+                    self.rate = max(MIN_REQUESTS_PER_SECOND, self.rate * MULTIPLICATIVE_DECREASE)
+                    self.concurrency = max(1.0, self.concurrency * MULTIPLICATIVE_DECREASE)
+            elif status_code < 400 or status_code == 404:
+                if self._smoothed_latency is None:
+                    self._smoothed_latency = latency_seconds
+                else:
+                    self._smoothed_latency += LATENCY_SMOOTHING * (latency_seconds - self._smoothed_latency)
+                self._best_latency = min(self._best_latency or self._smoothed_latency, self._smoothed_latency)
+                if latency_seconds <= self._best_latency * LATENCY_TOLERANCE + LATENCY_SLACK_SECONDS:
+                    self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE / self.rate)
+                    self.concurrency = min(float(self.max_concurrency), self.concurrency + ADDITIVE_INCREASE / self.concurrency)
+                    self.peak_rate = max(self.peak_rate, self.rate)
+                    self.peak_concurrency = max(self.peak_concurrency, self.concurrency)
+            self._condition.notify_all()
+
+    def abandon(self):
+        """Frees the slot taken by acquire() for an attempt that failed before reaching the server."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def report(self) -> dict:
+        with self._condition:
+            return {
+                'requests': self.requests,
+                'congestion_signals': self.congestion_signals,
+                'decreases': self.decreases,
+                'settled_requests_per_second': round(self.rate, 2),
+                'settled_concurrency': int(self.concurrency),
+                'peak_requests_per_second': round(self.peak_rate, 2),
+                'peak_concurrency': int(self.peak_concurrency),
+                'peak_in_flight': self.peak_in_flight,
+                'smoothed_latency_ms': round(self._smoothed_latency * 1000, 2) if self._smoothed_latency is not None else None
+            }
+
+class RateController:
+    """
+    Hands out one AimdBudget per endpoint group (ENDPOINT_BUDGETS), so a struggling endpoint
+    slows down without holding back the others.
+    """
+    def __init__(self, **budget_options):
+        self._budget_options = budget_options
+        self._lock = threading.Lock()
+        self.budgets = {}
+
+    def budget_for(self, url: str) -> AimdBudget:
+        name = ENDPOINT_BUDGETS.get(endpoint_name(url), 'default')
+        with self._lock:
+            if name not in self.budgets:
+                self.budgets[name] = AimdBudget(name, **self._budget_options)
+            return self.budgets[name]
+
+    def report(self) -> dict:
+        with self._lock:
+            budgets = dict(self.budgets)
+        return {name: budget.report() for name, budget in sorted(budgets.items())}
+
+    def print_summary(self):
+        for name, budget in self.report().items():
+            print(f"Rate control {name}: settled at {budget['settled_requests_per_second']} req/s and "
+                  f"{budget['settled_concurrency']} in flight (peak {budget['peak_requests_per_second']} req/s), "
+                  f"{budget['decreases']} backoffs from {budget['congestion_signals']} 429/5xx/timeouts over {budget['requests']} requests")
@@ -0,0 +1,226 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# Configuration
+RUN_REPORT_FILE = os.path.join(".update_state", "run_report.json")
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000, 10000) # Upper bounds; slower requests go in a final overflow bucket
+PROFILE_TOP_FUNCTIONS = 25
+VERBOSE_ITEM_LOGGING = False # Print a line for every item processed; off by default so console I/O stays out of the way
+
+def endpoint_name(url: str) -> str:
+    """
+    Groups request URLs by endpoint: the URL path, with the file name dropped for static
+    files such as icons (https://echoes.mobi/public/icons/123.png -> /public/icons).
+    """
+    path = urlsplit(url).path or '/'
+    if os.path.splitext(path)[1]:
+        path = os.path.dirname(path)
+    return path
+
+class _LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def add(self, latency_ms: float):
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.counts[bucket] += 1
+        self.total_ms += latency_ms
+        self.min_ms = latency_ms if self.min_ms is None else min(self.min_ms, latency_ms)
+        self.max_ms = latency_ms if self.max_ms is None else max(self.max_ms, latency_ms)
+
+    def quantile_ms(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (the maximum for the overflow bucket)."""
+        total = sum(self.counts)
+        if not total:
+            return None
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * total:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        total = sum(self.counts)
+        return {
+            'buckets_ms': list(LATENCY_BUCKETS_MS) + ['inf'],
+            'counts': self.counts,
+            'mean_ms': round(self.total_ms / total, 2) if total else None,
+            'min_ms': round(self.min_ms, 2) if self.min_ms is not None else None,
+            'max_ms': round(self.max_ms, 2) if self.max_ms is not None else None,
+            'p50_ms': self.quantile_ms(0.5),
+            'p90_ms': self.quantile_ms(0.9),
+            'p99_ms': self.quantile_ms(0.99)
+        }
+
+class RunMetrics:
+    """
+    Thread-safe collector for one update run: wall time per phase, and per endpoint the
+    request count, latency histogram of every attempt, retries, errors, status codes and
+    bytes received. Counters such as the outcome summaries of each phase can be added by name.
+    A trace hook, if set, is called with a dict for every phase and request event.
+    Per-item progress goes through log_item, which is silent unless verbose_items is set.
+    """
+    def __init__(self, verbose_items: bool = VERBOSE_ITEM_LOGGING):
+        self._lock = threading.Lock()
+        self.verbose_items = verbose_items
+        self.trace_hook = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._start = time.perf_counter()
+            self.phases = []
+            self.endpoints = {}
+            self.counters = {}
+            self.sections = {}
+
+    def _endpoint(self, url: str) -> dict:
+        name = endpoint_name(url)
+        if name not in self.endpoints:
+            self.endpoints[name] = {'requests': 0, 'attempts': 0, 'retries': 0, 'errors': 0, 'from_cache': 0,
+                                    'bytes_received': 0, 'status_codes': {}, 'latency': _LatencyHistogram()}
+        return self.endpoints[name]
+
+    def _trace(self, event: dict):
+        hook = self.trace_hook
+        if hook is not None:
+            hook(event)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the enclosed block as a phase of the run."""
+        start = time.perf_counter()
+        self._trace({'event': 'phase_start', 'phase': name})
+        try:
+            yield
+        finally:
+            wall_seconds = time.perf_counter() - start
+            with self._lock:
+                self.phases.append({'name': name, 'start_seconds': round(start - self._start, 3), 'wall_seconds': round(wall_seconds, 3)})
+            self._trace({'event': 'phase_end', 'phase': name, 'wall_seconds': wall_seconds})
+
+    def record_attempt(self, url: str, latency_seconds: float, status_code: int | None, retrying: bool):
+        """
+        Records one HTTP attempt. status_code is None for connection errors and timeouts;
+        retrying tells whether the client will try the request again.
+        """
+        with self._lock:
+            endpoint = self._endpoint(url)
+            endpoint['attempts'] += 1
+            endpoint['latency'].add(latency_seconds * 1000)
+            status_key = str(status_code) if status_code is not None else 'connection_error'
+            endpoint['status_codes'][status_key] = endpoint['status_codes'].get(status_key, 0) + 1
+            if retrying:
+                endpoint['retries'] += 1
+        self._trace({'event': 'attempt', 'endpoint': endpoint_name(url), 'latency_seconds': latency_seconds,
+                     'status_code': status_code, 'retrying': retrying})
+
+    def record_request(self, url: str, status_code: int | None, bytes_received: int = 0, from_cache: bool = False):
+        """
+        Records the final outcome of a request after retries. Requests that raised or ended
+        in a status other than 2xx/304 count as errors.
+        """
+        with self._lock:
+            endpoint = self._endpoint(url)
+            endpoint['requests'] += 1
+            endpoint['bytes_received'] += bytes_received
+            if from_cache:
+                endpoint['from_cache'] += 1
+            if status_code is None or not (200 <= status_code < 300 or status_code == 304):
+                endpoint['errors'] += 1
+
+    def log_item(self, message: str):
+        """Prints a per-item progress message, only when verbose_items is on."""
+        if self.verbose_items:
+            print(message)
+
+    def add_counts(self, prefix: str, counts: dict):
+        """Adds counts (e.g. a phase's outcome Counter) under prefix.name."""
+        with self._lock:
+            for name, count in counts.items():
+                key = f"{prefix}.{name}"
+                self.counters[key] = self.counters.get(key, 0) + count
+
+    def set_section(self, name: str, data: dict):
+        """Adds a named block (e.g. the rate controller's report) to the run report."""
+        with self._lock:
+            self.sections[name] = data
+
+    def report(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for name, endpoint in sorted(self.endpoints.items()):
+                endpoints[name] = {key: value for key, value in endpoint.items() if key not in ('latency', 'status_codes')}
+                endpoints[name]['status_codes'] = dict(endpoint['status_codes'])
+                endpoints[name]['latency'] = endpoint['latency'].to_dict()
+            return {
+                'started_at': self.started_at.isoformat(),
+                'wall_seconds': round(time.perf_counter() - self._start, 3),
+                'phases': list(self.phases),
+                'endpoints': endpoints,
+                'totals': {
+                    'requests': sum(e['requests'] for e in self.endpoints.values()),
+                    'retries': sum(e['retries'] for e in self.endpoints.values()),
+                    'errors': sum(e['errors'] for e in self.endpoints.values()),
+                    'bytes_received': sum(e['bytes_received'] for e in self.endpoints.values())
+                },
+                'counters': dict(sorted(self.counters.items())),
+                **self.sections
+            }
+
+    def write_report(self, report_path: str = RUN_REPORT_FILE):
+        """Writes the report as JSON (via a temp file)."""
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        temp_path = report_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(temp_path, report_path)
+
+    def print_summary(self):
+        report = self.report()
+        print("\n--- Run Metrics ---")
+        for phase in report['phases']:
+            print(f"Phase {phase['name']}: {phase['wall_seconds']:.2f}s")
+        for name, endpoint in report['endpoints'].items():
+            latency = endpoint['latency']
+            print(f"{name}: {endpoint['requests']} requests, {endpoint['retries']} retries, {endpoint['errors']} errors, "
+                  f"{endpoint['bytes_received'] / 1e6:.2f} MB, p50 <= {latency['p50_ms']}ms, p99 <= {latency['p99_ms']}ms")
+        print(f"Total: {report['wall_seconds']:.2f}s")
+        print("-------------------")
+
+run_metrics = RunMetrics()
+
+@contextmanager
+def profiled(profile_path: str | None):
+    """
+    Runs the enclosed block under cProfile when profile_path is given, saving the stats there
+    (readable with pstats or snakeviz) and printing the top functions by cumulative time.
+    """
+    if not profile_path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(profile_path) or '.', exist_ok=True)
+        profiler.dump_stats(profile_path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        print(summary.getvalue())
+        print(f"Profile written to {profile_path}")
@@ -30,8 +30,7 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentItemIconPath = null; // Added for icon path
     let priceChart = null;
     let activeTimeframe = "All"; // "30D", "3M", "6M", "1Y", "All", "Custom"
-    let originalPriceData = [];
-    let originalLabels = [];
+    let originalSeries = { labels: [], prices: [], resolutions: [] }; // Loaded history, see loadHistorySeries
     let activeSMAPeriods = [7]; // Initialize with a default array *first*.
     console.log('Initial activeSMAPeriods:', JSON.stringify(activeSMAPeriods));
 
@@ -293,6 +292,254 @@ function createFormattedStatHTML(label, value, percentChange, baseValueForColori
     return `<strong>${label}:</strong> ${valueHtml}${percentageHtml}`;
 }
 
+// Per-category/group history bundles (built by bundle_histories.py). The index maps each
+// history_path to [shard number, offset]; shards are fetched once and shared by their items.
+const HISTORY_BUNDLES_DIR = 'history_bundles';
+const HISTORY_BUNDLE_FORMAT_VERSION = 2; // Same as BUNDLE_FORMAT_VERSION in bundle_histories.py
+let historyBundleIndexPromise = null;
+const historyBundleShardPromises = new Map();
+
+function loadHistoryBundleIndex() {
+    if (!historyBundleIndexPromise) {
+        historyBundleIndexPromise = fetch(`${HISTORY_BUNDLES_DIR}/index.json`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status} for ${HISTORY_BUNDLES_DIR}/index.json`);
+                }
+                return response.json();
+            })
+            .catch(error => {
+                console.warn('History bundles unavailable, falling back to per-item CSVs:', error);
+                return null;
+            });
+    }
+    return historyBundleIndexPromise;
+}
+
+function loadHistoryBundleShard(shardFile) {
+    if (!historyBundleShardPromises.has(shardFile)) {
+        const shardPromise = fetch(`${HISTORY_BUNDLES_DIR}/${shardFile}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status} for ${shardFile}`);
+                }
+                return response.json();
+            })
+            .catch(error => {
+                historyBundleShardPromises.delete(shardFile); // Allow a retry on the next request
+                throw error;
+            });
+        historyBundleShardPromises.set(shardFile, shardPromise);
+    }
+    return historyBundleShardPromises.get(shardFile);
+}
+
+// Most points handed to Chart.js; same as CHART_POINT_BUDGET in bundle_histories.py
+const CHART_POINT_BUDGET = 200;
+const MS_PER_DAY = 86400000;
+const TIMEFRAME_MONTHS = { "3M": 3, "6M": 6, "1Y": 12 };
+
+function dayToLabel(day) {
+    return new Date(day * MS_PER_DAY).toISOString().substring(0, 10);
+}
+
+function labelToDay(label) {
+    return Math.floor(Date.parse(label.substring(0, 10) + "T00:00:00Z") / MS_PER_DAY);
+}
+
+// Expands a first day since epoch and the day gaps that follow it into day numbers
+function decodeDays(firstDay, dayGaps, count) {
+    const days = new Array(count);
+    let day = firstDay;
+    for (let i = 0; i < count; i++) {
+        if (i > 0) {
+            day += dayGaps[i - 1];
+        }
+        days[i] = day;
+    }
+    return days;
+}
+
+// Index of the first day >= targetDay in a sorted array of day numbers
+function lowerBound(days, targetDay) {
+    let low = 0;
+    let high = days.length;
+    while (low < high) {
+        const mid = (low + high) >> 1;
+        if (days[mid] < targetDay) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return low;
+}
+
+// First day shown by a timeframe button for a series ending on lastDay (same as bundle_histories.timeframe_start_day)
+function timeframeStartDay(lastDay, timeframe) {
+    if (timeframe === "30D") {
+        return lastDay - 30;
+    }
+    const startDate = new Date(lastDay * MS_PER_DAY);
+    startDate.setUTCMonth(startDate.getUTCMonth() - TIMEFRAME_MONTHS[timeframe]);
+    return Math.floor(startDate.getTime() / MS_PER_DAY);
+}
+
+function computeTimeframeOffsets(days) {
+    const offsets = {};
+    if (days.length > 0) {
+        ["30D", "3M", "6M", "1Y"].forEach(timeframe => {
+            offsets[timeframe] = lowerBound(days, timeframeStartDay(days[days.length - 1], timeframe));
+        });
+    }
+    return offsets;
+}
+
+// One chart resolution of a history: day numbers, labels, prices and the index where each timeframe starts
+function makeResolution(name, days, prices, offsets, labels) {
+    return {
+        name,
+        days,
+        labels: labels || days.map(dayToLabel),
+        prices,
+        offsets: offsets || computeTimeframeOffsets(days)
+    };
+}
+
+// Expands a bundled series (see bundle_histories.encode_multi_resolution) into its chart resolutions:
+// weekly points, then for long histories monthly closes and an LTTB downsampling, finest first.
+// Version 1 shards carry the weekly points only; unknown versions throw so the caller falls back to the CSV.
+function decodeBundledSeries(series, version) {
+    if (version !== 1 && version !== HISTORY_BUNDLE_FORMAT_VERSION) {
+        throw new Error(`Unsupported history bundle version ${version}`);
+    }
+    if (!series || series.d0 === null) {
+        return { labels: [], prices: [], resolutions: [] };
+    }
+    const weekly = makeResolution('weekly', decodeDays(series.d0, series.dd, series.p.length), series.p, version >= 2 ? series.tf : null);
+    const resolutions = [weekly];
+    if (version >= 2 && series.m && series.m.d0 !== null) {
+        resolutions.push(makeResolution('monthly', decodeDays(series.m.d0, series.m.dd, series.m.c.length), series.m.c, series.m.tf));
+    }
+    if (version >= 2 && series.l && series.l.d0 !== null) {
+        resolutions.push(makeResolution('downsampled', decodeDays(series.l.d0, series.l.dd, series.l.p.length), series.l.p, series.l.tf));
+    }
+    return { labels: weekly.labels, prices: weekly.prices, resolutions };
+}
+
+function parseHistoryCsv(csvData) {
+    const labels = [];
+    const prices = [];
+    const lines = csvData.trim().split(/\r?\n/);
+    const priceIndex = 2;
+    const dateCreatedIndex = 5;
+
+    lines.slice(1).forEach(row => {
+        const columns = row.split(',');
+        if (columns.length > Math.max(priceIndex, dateCreatedIndex)) {
+            const rawDate = columns[dateCreatedIndex];
+            labels.push(rawDate.substring(0, 10));
+            const price = parseFloat(columns[priceIndex]);
+            prices.push(isNaN(price) ? null : price);
+        }
+    });
+    return { labels, prices };
+}
+
+function fetchHistoryCsv(csvPath) {
+    return fetch(csvPath)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status} for ${csvPath}`);
+            }
+            return response.text();
+        })
+        .then(parseHistoryCsv)
+        .then(({ labels, prices }) => ({
+            labels,
+            prices,
+            resolutions: labels.length ? [makeResolution('weekly', labels.map(labelToDay), prices, null, labels)] : []
+        }));
+}
+
+// Resolves to { labels, prices, resolutions } for a history, from its bundle when available, else from the CSV
+function loadHistorySeries(csvPath) {
+    return loadHistoryBundleIndex().then(index => {
+        const location = index && index.items[csvPath];
+        if (!location) {
+            return fetchHistoryCsv(csvPath);
+        }
+        return loadHistoryBundleShard(index.shards[location[0]])
+            .then(shard => decodeBundledSeries(shard.series[location[1]], shard.version))
+            .catch(error => {
+                console.warn('Failed to load history bundle for', csvPath, '- falling back to CSV:', error);
+                return fetchHistoryCsv(csvPath);
+            });
+    });
+}
+
+// Precomputed per-item stats (built by build_item_stats.py), fetched once and shared by every card
+let itemStatsPromise = null;
+
+function loadItemStats() {
+    if (!itemStatsPromise) {
+        itemStatsPromise = fetch('item_stats.json')
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status} for item_stats.json`);
+                }
+                return response.json();
+            })
+            .catch(error => {
+                console.warn('[StatsDebug] item_stats.json unavailable, falling back to per-item CSVs:', error);
+                return {};
+            });
+    }
+    return itemStatsPromise;
+}
+
+// Renders the Recent/High/Low summary of an item into its initial-view placeholder
+function renderInitialViewStats(placeholderElement, itemPath, recentPrice, highestPrice, lowestPrice, firstPrice) {
+    console.log('[StatsFormatDebug] Raw values for item', itemPath, '- Recent:', recentPrice, 'High:', highestPrice, 'Low:', lowestPrice);
+
+    let recentPricePercentChange = 'N/A';
+    let highestPricePercentChange = 'N/A';
+    let lowestPricePercentChange = 'N/A';
+
+    if (firstPrice !== null && firstPrice !== 0) {
+        if (recentPrice !== null) {
+            recentPricePercentChange = (((recentPrice - firstPrice) / firstPrice) * 100);
+        }
+        if (highestPrice !== null) {
+            highestPricePercentChange = (((highestPrice - firstPrice) / firstPrice) * 100);
+        }
+        if (lowestPrice !== null) {
+            lowestPricePercentChange = (((lowestPrice - firstPrice) / firstPrice) * 100);
+        }
+    } else if (firstPrice === null) {
+        console.log('[StatsFormatDebug] firstPrice is null for', itemPath, '- percentages will be N/A.');
+    } else if (firstPrice === 0) {
+        console.log('[StatsFormatDebug] firstPrice is 0 for', itemPath, '- percentages will be N/A to avoid division by zero.');
+    }
+
+    console.log('[StatsFormatDebug] Calculated Percent Changes for item', itemPath, '- Recent%:', recentPricePercentChange, 'High%:', highestPricePercentChange, 'Low%:', lowestPricePercentChange, 'based on firstPrice:', firstPrice);
+
+    let statsHTMLparts = [];
+    // For "Recent", baseValueForColoring is firstPrice.
+    statsHTMLparts.push(createFormattedStatHTML("Recent", recentPrice, recentPricePercentChange, firstPrice));
+    // For "High", baseValueForColoring is firstPrice (or recentPrice, depending on desired comparison). Let's use firstPrice for consistency here.
+    statsHTMLparts.push(createFormattedStatHTML("High", highestPrice, highestPricePercentChange, firstPrice));
+    // For "Low", baseValueForColoring is firstPrice.
+    statsHTMLparts.push(createFormattedStatHTML("Low", lowestPrice, lowestPricePercentChange, firstPrice));
+
+    const finalStatsHTML = statsHTMLparts.join('<br>');
+    console.log('[StatsFormatDebug] Final statsHTML for item', itemPath, ':', finalStatsHTML);
+
+    placeholderElement.innerHTML = finalStatsHTML;
+    console.log('[StatsDebug] Successfully set innerHTML for', itemPath);
+    // Add a class for styling if needed, e.g., placeholderElement.classList.add('item-stats-loaded');
+}
+
 // New function to fetch and display item stats for the initial view
 function fetchAndDisplayItemStatsForInitialView(itemPath, placeholderElement) {
     console.log('[StatsDebug] fetchAndDisplayItemStatsForInitialView called with path:', itemPath, 'and placeholder:', placeholderElement);
@@ -311,6 +558,18 @@ function fetchAndDisplayItemStatsForInitialView(itemPath, placeholderElement) {
         return;
     }
 
+    loadItemStats().then(itemStats => {
+        const stats = itemStats[itemPath];
+        if (stats && stats.latest !== null) {
+            renderInitialViewStats(placeholderElement, itemPath, stats.latest, stats.high, stats.low, stats.first);
+        } else {
+            fetchInitialViewStatsFromCsv(itemPath, placeholderElement);
+        }
+    });
+}
+
+// Fallback for items missing from item_stats.json: computes the stats from the item's history CSV
+function fetchInitialViewStatsFromCsv(itemPath, placeholderElement) {
     fetch(itemPath)
         .then(response => {
             console.log('[StatsDebug] Fetched response for', itemPath, 'Status:', response.status);
@@ -350,49 +609,8 @@ function fetchAndDisplayItemStatsForInitialView(itemPath, placeholderElement) {
                 return;
             }
 
-            const recentPrice = pricesArray[pricesArray.length - 1];
-            const highestPrice = Math.max(...pricesArray);
-            const lowestPrice = Math.min(...pricesArray);
-
-            console.log('[StatsFormatDebug] Raw values for item', itemPath, '- Recent:', recentPrice, 'High:', highestPrice, 'Low:', lowestPrice);
-
-            const firstPrice = pricesArray.length > 0 ? pricesArray[0] : null;
-            let recentPricePercentChange = 'N/A';
-            let highestPricePercentChange = 'N/A';
-            let lowestPricePercentChange = 'N/A';
-
-            if (firstPrice !== null && firstPrice !== 0) {
-                if (recentPrice !== null) {
-                    recentPricePercentChange = (((recentPrice - firstPrice) / firstPrice) * 100);
-                }
-                if (highestPrice !== null) {
-                    highestPricePercentChange = (((highestPrice - firstPrice) / firstPrice) * 100);
-                }
-                if (lowestPrice !== null) {
-                    lowestPricePercentChange = (((lowestPrice - firstPrice) / firstPrice) * 100);
-                }
-            } else if (firstPrice === null) {
-                console.log('[StatsFormatDebug] firstPrice is null for', itemPath, '- percentages will be N/A.');
-            } else if (firstPrice === 0) {
-                console.log('[StatsFormatDebug] firstPrice is 0 for', itemPath, '- percentages will be N/A to avoid division by zero.');
-            }
-
-            console.log('[StatsFormatDebug] Calculated Percent Changes for item', itemPath, '- Recent%:', recentPricePercentChange, 'High%:', highestPricePercentChange, 'Low%:', lowestPricePercentChange, 'based on firstPrice:', firstPrice);
-
-            let statsHTMLparts = [];
-            // For "Recent", baseValueForColoring is firstPrice.
-            statsHTMLparts.push(createFormattedStatHTML("Recent", recentPrice, recentPricePercentChange, firstPrice));
-            // For "High", baseValueForColoring is firstPrice (or recentPrice, depending on desired comparison). Let's use firstPrice for consistency here.
-            statsHTMLparts.push(createFormattedStatHTML("High", highestPrice, highestPricePercentChange, firstPrice));
-            // For "Low", baseValueForColoring is firstPrice.
-            statsHTMLparts.push(createFormattedStatHTML("Low", lowestPrice, lowestPricePercentChange, firstPrice));
-
-            const finalStatsHTML = statsHTMLparts.join('<br>');
-            console.log('[StatsFormatDebug] Final statsHTML for item', itemPath, ':', finalStatsHTML);
-
-            placeholderElement.innerHTML = finalStatsHTML;
-            console.log('[StatsDebug] Successfully set innerHTML for', itemPath);
-            // Add a class for styling if needed, e.g., placeholderElement.classList.add('item-stats-loaded');
+            renderInitialViewStats(placeholderElement, itemPath,
+                pricesArray[pricesArray.length - 1], Math.max(...pricesArray), Math.min(...pricesArray), pricesArray[0]);
         })
         .catch(error => {
             console.error('[StatsDebug] Fetch error for', itemPath, ':', error);
@@ -428,17 +646,17 @@ function toggleFavoriteOnItem(itemToToggle) {
         let iconPathToStore = itemToToggle.icon_path; // Directly use from input first
 
         // If crucial info is missing from itemToToggle, attempt a lookup.
-        if (!pathToStore && nameToStore && window.globalItemData) {
+        if (!pathToStore && nameToStore) {
             console.warn(`[toggleFavoriteOnItem] Path is missing for new favorite '${nameToStore}'. Attempting lookup by name.`);
-            const details = findItemDetailsInGlobalData(nameToStore, true); // true: searchByName
+            const details = findItemDetails(nameToStore, true); // true: searchByName
             if (details) {
-                pathToStore = details.path; // This is history_path from findItemDetailsInGlobalData
+                pathToStore = details.path; // This is history_path from findItemDetails
                 iconPathToStore = iconPathToStore !== undefined ? iconPathToStore : details.icon_path; // Prioritize existing icon_path if any
                 nameToStore = details.name || nameToStore; // Update name if lookup provided a more canonical one
             }
-        } else if (pathToStore && (iconPathToStore === undefined || iconPathToStore === null || (typeof iconPathToStore === 'string' && iconPathToStore.trim() === '')) && window.globalItemData) {
+        } else if (pathToStore && (iconPathToStore === undefined || iconPathToStore === null || (typeof iconPathToStore === 'string' && iconPathToStore.trim() === ''))) {
             console.warn(`[toggleFavoriteOnItem] icon_path is missing or empty in itemToToggle for '${nameToStore}'. Attempting lookup by path: ${pathToStore}.`);
-            const details = findItemDetailsInGlobalData(pathToStore, false); // false: searchByPath (history_path)
+            const details = findItemDetails(pathToStore, false); // false: searchByPath (history_path)
             if (details) {
                 iconPathToStore = details.icon_path;
                 nameToStore = details.name || nameToStore; // Update name if lookup provided a more canonical one
@@ -488,65 +706,93 @@ function refreshInitialViewLists() {
     }
 }
 
-    function filterDataByTimeframe(labels, prices, timeframe, startDateStr, endDateStr) {
-        if (!labels || !prices || labels.length === 0 || prices.length === 0) {
-            return { filteredLabels: [], filteredPrices: [] };
-        }
-
-        if (timeframe === "All") {
-            return { filteredLabels: labels.slice(), filteredPrices: prices.slice() };
+    // Slices a loaded history to a timeframe without parsing any dates: predefined timeframes start at the
+    // precomputed offsets, custom ranges are found by binary search over day numbers. Plots the finest
+    // resolution whose slice fits CHART_POINT_BUDGET (the coarsest one if none does), and also returns the
+    // weekly slice of the same range, from which period statistics and SMAs are computed.
+    function filterDataByTimeframe(series, timeframe, startDateStr, endDateStr) {
+        const resolutions = (series && series.resolutions) || [];
+        if (resolutions.length === 0) {
+            return { filteredLabels: [], filteredPrices: [], filteredDays: [], resolution: null, weeklyLabels: [], weeklyPrices: [], weeklyDays: [] };
         }
 
-        const filteredLabels = [];
-        const filteredPrices = [];
-
-        // Ensure dates are sorted (originalLabels are assumed to be sorted)
-        // Convert latest date string to Date object for calculation
-        const latestDataDate = new Date(labels[labels.length - 1] + "T00:00:00Z"); // Use Z for UTC to be safe with date-only strings
-
-        let startDate;
-        let endDate = latestDataDate; // Default end date is the latest available date
-
+        let startDay = null;
+        let endDay = null;
         if (timeframe === "Custom") {
             if (!startDateStr || !endDateStr) { // Should be validated before calling
-                return { filteredLabels: labels.slice(), filteredPrices: prices.slice() }; // Or handle error
-            }
-            startDate = new Date(startDateStr + "T00:00:00Z");
-            endDate = new Date(endDateStr + "T23:59:59Z"); // Inclusive end date
-        } else {
-            startDate = new Date(latestDataDate);
-            switch (timeframe) {
-                case "30D":
-                    startDate.setDate(startDate.getDate() - 30);
-                    break;
-                case "3M":
-                    startDate.setMonth(startDate.getMonth() - 3);
-                    break;
-                case "6M":
-                    startDate.setMonth(startDate.getMonth() - 6);
-                    break;
-                case "1Y":
-                    startDate.setFullYear(startDate.getFullYear() - 1);
-                    break;
-                default: // Should not happen if logic is correct
-                    return { filteredLabels: labels.slice(), filteredPrices: prices.slice() };
+                timeframe = "All";
+            } else {
+                startDay = labelToDay(startDateStr);
+                endDay = labelToDay(endDateStr); // Inclusive end date
             }
         }
-        // Normalize startDate to the beginning of its day for comparison
-        startDate.setHours(0, 0, 0, 0);
 
+        const sliceOf = resolution => {
+            let start = 0;
+            let end = resolution.days.length;
+            if (timeframe === "Custom") {
+                start = lowerBound(resolution.days, startDay);
+                end = lowerBound(resolution.days, endDay + 1);
+            } else if (timeframe !== "All") {
+                start = resolution.offsets[timeframe] || 0;
+            }
+            return { resolution, start, end };
+        };
 
-        for (let i = 0; i < labels.length; i++) {
-            const currentDate = new Date(labels[i] + "T00:00:00Z"); // Use Z for UTC
-            if (currentDate >= startDate && currentDate <= endDate) {
-                filteredLabels.push(labels[i]);
-                filteredPrices.push(prices[i]);
+        let chosen = null;
+        for (const resolution of resolutions) {
+            chosen = sliceOf(resolution);
+            if (chosen.end - chosen.start <= CHART_POINT_BUDGET) {
+                break;
             }
         }
-        return { filteredLabels, filteredPrices };
+        const weekly = chosen.resolution === resolutions[0] ? chosen : sliceOf(resolutions[0]);
+        return {
+            filteredLabels: chosen.resolution.labels.slice(chosen.start, chosen.end),
+            filteredPrices: chosen.resolution.prices.slice(chosen.start, chosen.end),
+            filteredDays: chosen.resolution.days.slice(chosen.start, chosen.end),
+            resolution: chosen.resolution.name,
+            weeklyLabels: weekly.resolution.labels.slice(weekly.start, weekly.end),
+            weeklyPrices: weekly.resolution.prices.slice(weekly.start, weekly.end),
+            weeklyDays: weekly.resolution.days.slice(weekly.start, weekly.end)
+        };
+    }
+
+    // Picks, for each plotted day, the value computed for the last weekly point on or before it
+    // (monthly closes and downsampled points are weekly points, so this is an exact match)
+    function alignToPlottedDays(weeklyValues, weeklyDays, plottedDays) {
+        if (plottedDays.length === weeklyDays.length) {
+            return weeklyValues;
+        }
+        return plottedDays.map(day => {
+            const index = lowerBound(weeklyDays, day + 1) - 1;
+            return index >= 0 ? weeklyValues[index] : null;
+        });
     }
 
+    // Loaders for categories whose items are fetched on first expand, keyed by category name
+    const lazyCategoryLoaders = new Map();
+
     function fetchItemData() {
+        loadItemLookup(); // Fetched in the background; only needed once an item is opened
+        fetch('item_catalog/manifest.json')
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(manifest => {
+                itemSelectorContainer.innerHTML = '';
+                buildCategorySidebar(manifest, itemSelectorContainer);
+            })
+            .catch(error => {
+                console.warn('Error fetching item_catalog/manifest.json, loading item_data.json instead:', error);
+                fetchFullItemData();
+            });
+    }
+
+    function fetchFullItemData() {
         fetch('item_data.json')
             .then(response => {
                 if (!response.ok) {
@@ -565,49 +811,105 @@ function refreshInitialViewLists() {
             });
     }
 
-// Helper function to find item details (including icon_path) in the globalItemData
-// Recursively searches through the nested structure.
-function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode = window.globalItemData) {
-    if (!dataNode) return null;
+    // Builds the top level of the sidebar from the catalog manifest; each category's items
+    // are fetched from its own file the first time it is expanded (or searched).
+    function buildCategorySidebar(manifest, parentElement) {
+        parentElement.innerHTML = '';
+        lazyCategoryLoaders.clear();
+
+        const ul = document.createElement('ul');
+        ul.className = 'list-level-0';
+        ul.style.listStyleType = 'none';
+        ul.style.paddingLeft = '0';
+
+        manifest.categories.forEach(category => {
+            const listItem = createCategoryListItem(category.name, childListContainer => {
+                childListContainer.textContent = 'Loading...';
+                return fetch(`item_catalog/${category.file}`)
+                    .then(response => {
+                        if (!response.ok) {
+                            throw new Error(`HTTP error! status: ${response.status} for ${category.file}`);
+                        }
+                        return response.json();
+                    })
+                    .then(subtree => buildSidebarNavigation(subtree, childListContainer, 1))
+                    .catch(error => {
+                        console.error('Error fetching category', category.name, ':', error);
+                        childListContainer.textContent = 'Error loading items.';
+                    });
+            }, true);
+            lazyCategoryLoaders.set(category.name, () => listItem.loadChildren());
+            ul.appendChild(listItem);
+        });
+        parentElement.appendChild(ul);
+    }
+
+    function loadAllCategories() {
+        return Promise.all(Array.from(lazyCategoryLoaders.values(), loadCategory => loadCategory()));
+    }
+
+// Flat item lookup, filled from item_catalog/lookup.json (or from item_data.json when the
+// catalog is missing). Replaces the recursive search through the whole item tree.
+const itemLookupByName = new Map();
+const itemLookupByPath = new Map();
+let itemLookupRows = []; // Details by lookup.json row, referenced by the search index
+let itemLookupPromise = null;
+
+function addItemToLookup(name, historyPath, iconPath) {
+    const details = { name: name, path: historyPath, icon_path: iconPath || '' };
+    // Keep the first item for duplicate names, like the depth-first tree search did
+    if (!itemLookupByName.has(name)) {
+        itemLookupByName.set(name, details);
+    }
+    if (!itemLookupByPath.has(historyPath)) {
+        itemLookupByPath.set(historyPath, details);
+    }
+}
 
+function addItemTreeToLookup(dataNode) {
     for (const key in dataNode) {
         const currentNode = dataNode[key];
-
         if (typeof currentNode === 'string') { // Leaf node (old format, path only)
-            let foundItemDetails = null;
-            if (searchByName && key === identifier) {
-                foundItemDetails = { name: key, path: currentNode, icon_path: '' };
-            } else if (!searchByName && currentNode === identifier) {
-                foundItemDetails = { name: key, path: currentNode, icon_path: '' };
-            }
-            if (foundItemDetails) {
-                // console.log('[findItemDetailsInGlobalData] Found item (old format):', JSON.stringify(foundItemDetails));
-                return foundItemDetails;
-            }
+            addItemToLookup(key, currentNode, '');
         } else if (typeof currentNode === 'object' && currentNode !== null) {
-            // Check if currentNode itself is a leaf item (new format with history_path)
             if (currentNode.history_path) {
-                let foundItemDetails = null;
-                if (searchByName && key === identifier) {
-                    foundItemDetails = { name: key, path: currentNode.history_path, icon_path: currentNode.icon_path || '' };
-                } else if (!searchByName && currentNode.history_path === identifier) {
-                    foundItemDetails = { name: key, path: currentNode.history_path, icon_path: currentNode.icon_path || '' };
-                }
-                if (foundItemDetails) {
-                    console.log('[findItemDetailsInGlobalData] Found item (new format):', JSON.stringify(foundItemDetails));
-                    return foundItemDetails;
-                }
+                addItemToLookup(key, currentNode.history_path, currentNode.icon_path);
             } else {
-                // It's a category, so recurse
-                const foundInChildren = findItemDetailsInGlobalData(identifier, searchByName, currentNode);
-                if (foundInChildren) {
-                    // console.log('[findItemDetailsInGlobalData] Found item in children:', JSON.stringify(foundInChildren));
-                    return foundInChildren;
-                }
+                addItemTreeToLookup(currentNode);
             }
         }
     }
-    return null; // Not found
+}
+
+function loadItemLookup() {
+    if (!itemLookupPromise) {
+        itemLookupPromise = fetch('item_catalog/lookup.json')
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status} for item_catalog/lookup.json`);
+                }
+                return response.json();
+            })
+            .then(lookup => {
+                const nameIndex = lookup.columns.indexOf('name');
+                const pathIndex = lookup.columns.indexOf('history_path');
+                const iconIndex = lookup.columns.indexOf('icon_path');
+                lookup.rows.forEach(row => addItemToLookup(row[nameIndex], row[pathIndex], row[iconIndex]));
+                itemLookupRows = lookup.rows.map(row => ({ name: row[nameIndex], path: row[pathIndex], icon_path: row[iconIndex] || '' }));
+            })
+            .catch(error => {
+                console.warn('Item lookup table unavailable, building it from item_data.json:', error);
+                return (window.globalItemData ? Promise.resolve(window.globalItemData) : fetch('item_data.json').then(response => response.json()))
+                    .then(addItemTreeToLookup)
+                    .catch(fallbackError => console.error('Error building item lookup:', fallbackError));
+            });
+    }
+    return itemLookupPromise;
+}
+
+// Returns { name, path, icon_path } for an item name or history_path, or null if unknown
+function findItemDetails(identifier, searchByName = true) {
+    return (searchByName ? itemLookupByName : itemLookupByPath).get(identifier) || null;
 }
 
     function buildSidebarNavigation(data, parentElement, level = 0) {
@@ -619,6 +921,12 @@ function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode =
         ul.style.paddingLeft = level > 0 ? '20px' : '0';
 
         for (const key in data) {
+            if (typeof data[key] === 'object' && data[key] !== null && !data[key].history_path) { // Category node
+                // Build the subtree immediately
+                ul.appendChild(createCategoryListItem(key, childListContainer => buildSidebarNavigation(data[key], childListContainer, level + 1)));
+                continue;
+            }
+
             const listItem = document.createElement('li');
             listItem.className = 'nav-item';
 
@@ -663,35 +971,58 @@ function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode =
                     }
                     listItem.classList.add('selected-leaf');
                 });
-            } else if (typeof data[key] === 'object' && data[key] !== null) { // Category node
-                listItem.classList.add('item-category');
-                textElement.textContent = '► ' + key;
-                listItem.appendChild(textElement); // Append text span for category
-
-                const childListContainer = document.createElement('div');
-                childListContainer.className = 'child-list-container';
-                childListContainer.style.display = 'none'; // Keep it initially collapsed
-
-                // Build the subtree immediately
-                buildSidebarNavigation(data[key], childListContainer, level + 1);
-
-                listItem.appendChild(childListContainer);
+            }
+            ul.appendChild(listItem);
+        }
+        parentElement.appendChild(ul);
+    }
 
-                textElement.addEventListener('click', function(event) {
-                    const isCurrentlyCollapsed = childListContainer.style.display === 'none';
-                    if (isCurrentlyCollapsed) {
-                        childListContainer.style.display = 'block';
-                        textElement.textContent = '▼ ' + key;
-                    } else {
-                        childListContainer.style.display = 'none';
-                        textElement.textContent = '► ' + key;
+    // Creates a collapsible category entry. buildChildren fills the child container; with lazy=true
+    // it runs on the first expand instead of immediately and may return a promise.
+    function createCategoryListItem(key, buildChildren, lazy = false) {
+        const listItem = document.createElement('li');
+        listItem.className = 'nav-item';
+        listItem.classList.add('item-category');
+
+        const textElement = document.createElement('span');
+        textElement.style.cursor = 'pointer';
+        textElement.textContent = '► ' + key;
+        listItem.appendChild(textElement); // Append text span for category
+
+        const childListContainer = document.createElement('div');
+        childListContainer.className = 'child-list-container';
+        childListContainer.style.display = 'none'; // Keep it initially collapsed
+
+        let childrenBuilt = null;
+        listItem.loadChildren = function() {
+            if (!childrenBuilt) {
+                childrenBuilt = Promise.resolve(buildChildren(childListContainer)).then(() => {
+                    if (!childListContainer.querySelector('ul')) {
+                        childrenBuilt = null; // Failed lazy load, retry on the next expand
                     }
-                    event.stopPropagation();
                 });
             }
-            ul.appendChild(listItem);
+            return childrenBuilt;
+        };
+        if (!lazy) {
+            listItem.loadChildren();
         }
-        parentElement.appendChild(ul);
+
+        listItem.appendChild(childListContainer);
+
+        textElement.addEventListener('click', function(event) {
+            const isCurrentlyCollapsed = childListContainer.style.display === 'none';
+            if (isCurrentlyCollapsed) {
+                listItem.loadChildren();
+                childListContainer.style.display = 'block';
+                textElement.textContent = '▼ ' + key;
+            } else {
+                childListContainer.style.display = 'none';
+                textElement.textContent = '► ' + key;
+            }
+            event.stopPropagation();
+        });
+        return listItem;
     }
 
     function updateActiveTimeframeButton(selectedButton) {
@@ -708,17 +1039,22 @@ function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode =
     }
 
 
+    // Item details (icon path) come from the lookup table, which may still be loading on first use
     function loadItemData(csvPath, itemName) {
+        loadItemLookup().then(() => displayItemData(csvPath, itemName));
+    }
+
+    function displayItemData(csvPath, itemName) {
         currentItemPath = csvPath;
         currentItemName = itemName;
 
-        // Find item details including icon_path from globalItemData
-        const itemDetails = findItemDetailsInGlobalData(itemName, true) || findItemDetailsInGlobalData(csvPath, false);
+        // Find item details including icon_path from the item lookup
+        const itemDetails = findItemDetails(itemName, true) || findItemDetails(csvPath, false);
         if (itemDetails) {
             currentItemIconPath = itemDetails.icon_path;
         } else {
             currentItemIconPath = ''; // Default if not found
-            // console.warn(`Icon path not found for ${itemName} or ${csvPath} in globalItemData.`);
+            // console.warn(`Icon path not found for ${itemName} or ${csvPath} in the item lookup.`);
         }
         console.log("Loading data for:", csvPath, "Item Name:", itemName, "Icon Path:", currentItemIconPath);
         console.log(`[loadItemData] For item ${currentItemName}, currentItemIconPath is: ${currentItemIconPath}`); // Added log
@@ -760,37 +1096,11 @@ function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode =
         if (customDateControls) customDateControls.style.display = 'none';
         updateActiveTimeframeButton(btnAll);
 
-        fetch(csvPath)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status} for ${csvPath}`);
-                }
-                return response.text();
-            })
-            .then(csvData => {
-                const lines = csvData.trim().split(/\r?\n/);
-                if (lines.length <= 1) {
-                    console.warn("CSV data has no data rows for", csvPath);
-                    originalLabels = [];
-                    originalPriceData = [];
-                } else {
-                    const dataRows = lines.slice(1);
-                    const tempLabels = [];
-                    const tempPriceData = [];
-                    const priceIndex = 2;
-                    const dateCreatedIndex = 5;
-
-                    dataRows.forEach(row => {
-                        const columns = row.split(',');
-                        if (columns.length > Math.max(priceIndex, dateCreatedIndex)) {
-                            const rawDate = columns[dateCreatedIndex];
-                            tempLabels.push(rawDate.substring(0, 10));
-                            const price = parseFloat(columns[priceIndex]);
-                            tempPriceData.push(isNaN(price) ? null : price);
-                        }
-                    });
-                    originalLabels = tempLabels;
-                    originalPriceData = tempPriceData;
+        loadHistorySeries(csvPath)
+            .then(series => {
+                originalSeries = series;
+                if (originalSeries.labels.length === 0) {
+                    console.warn("History has no data rows for", csvPath);
                 }
 
                 const chartDisplayTitleTextElement = document.getElementById('chartDisplayTitleText');
@@ -800,7 +1110,7 @@ function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode =
                     chartDisplayTitleTextElement.textContent = 'Item Analysis'; // Or a more generic title if itemName is missing
                 }
                 console.log('Loading item data. Current activeSMAPeriods before updateChartWithIndicators:', JSON.stringify(activeSMAPeriods));
-                if (originalLabels.length === 0 && originalPriceData.length === 0) {
+                if (originalSeries.labels.length === 0 && originalSeries.prices.length === 0) {
                     console.warn("No data parsed from CSV:", csvPath, "Clearing chart.");
                     if (priceChart) {
                         priceChart.data.labels = [];
@@ -842,8 +1152,7 @@ function findItemDetailsInGlobalData(identifier, searchByName = true, dataNode =
                 if (chartDisplayTitleTextElement) {
                     chartDisplayTitleTextElement.textContent = 'Failed to Load Item Data';
                 }
-                 originalLabels = [];
-                 originalPriceData = [];
+                 originalSeries = { labels: [], prices: [], resolutions: [] };
                  if (priceChart) {
                     priceChart.data.labels = [];
                     priceChart.data.datasets = [];
@@ -1095,9 +1404,8 @@ function calculateAndDisplayPriceStatistics(labels, prices) {
         const customStart = (activeTimeframe === 'Custom' && customStartDateInput) ? customStartDateInput.value : null;
         const customEnd = (activeTimeframe === 'Custom' && customEndDateInput) ? customEndDateInput.value : null;
 
-        const { filteredLabels, filteredPrices } = filterDataByTimeframe(
-            originalLabels,
-            originalPriceData,
+        const { filteredLabels, filteredPrices, filteredDays, resolution, weeklyLabels, weeklyPrices, weeklyDays } = filterDataByTimeframe(
+            originalSeries,
             activeTimeframe,
             customStart,
             customEnd
@@ -1108,7 +1416,7 @@ function calculateAndDisplayPriceStatistics(labels, prices) {
 
         if (filteredPrices.length > 0) {
             datasets.push({
-              label: 'Item Price',
+              label: resolution === 'monthly' ? 'Item Price (monthly close)' : resolution === 'downsampled' ? 'Item Price (downsampled)' : 'Item Price',
               data: filteredPrices, // Use filteredPrices
               borderColor: 'rgb(0, 0, 0)',
               backgroundColor: 'rgba(0, 0, 0, 0.1)',
@@ -1120,8 +1428,8 @@ function calculateAndDisplayPriceStatistics(labels, prices) {
             });
 
             activeSMAPeriods.forEach((period, index) => {
-                // Pass filteredLabels and filteredPrices to calculateSMA
-                const smaData = calculateSMA(filteredLabels, filteredPrices, period);
+                // Day windows over the weekly points, then picked for the plotted (possibly downsampled) points
+                const smaData = alignToPlottedDays(calculateSMA(weeklyLabels, weeklyPrices, period), weeklyDays, filteredDays);
                 const color = smaColors[index % smaColors.length];
 
                 datasets.push({
@@ -1146,7 +1454,8 @@ function calculateAndDisplayPriceStatistics(labels, prices) {
 
         priceChart.data.datasets = datasets;
         priceChart.update();
-        calculateAndDisplayPriceStatistics(filteredLabels, filteredPrices);
+        // From the weekly points, so downsampling never hides the period's real extremes
+        calculateAndDisplayPriceStatistics(weeklyLabels, weeklyPrices);
     }
 
     // Initial calls
@@ -1303,8 +1612,7 @@ function calculateAndDisplayPriceStatistics(labels, prices) {
         }
     }
 
-    function filterSidebar(searchTerm) {
-        const term = searchTerm.toLowerCase();
+    function filterSidebarTree(term) {
         const rootList = itemSelectorContainer.querySelector('ul.list-level-0');
 
         if (!rootList) {
@@ -1316,7 +1624,227 @@ function calculateAndDisplayPriceStatistics(labels, prices) {
             resetFilters();
             return;
         }
-        recursiveFilter(rootList, term);
+        // Categories not expanded yet have no items in the DOM; load them before filtering
+        loadAllCategories().then(() => {
+            if (sidebarSearchInput && sidebarSearchInput.value.toLowerCase() !== term) {
+                return; // A newer search has started
+            }
+            recursiveFilter(rootList, term);
+        });
+    }
+
+    // Prebuilt name search (item_catalog/search_index.json, built by generate_item_json.py).
+    // Queries are answered from prefix/n-gram postings; the DOM tree filter above is the fallback.
+    const searchResultsContainer = document.getElementById('search-results-container');
+    const MAX_SEARCH_RESULTS = 50;
+    let searchIndexPromise = null;
+    let activeSearchFacet = null; // Category number the results are restricted to, or null
+
+    function normalizeSearchText(text) {
+        // Same rules as normalize_name in search_index.py
+        return text.normalize('NFKD').replace(/\p{M}/gu, '').toLowerCase().replace(/[^\p{L}\p{N}]+/gu, ' ').trim();
+    }
+
+    function loadSearchIndex() {
+        if (!searchIndexPromise) {
+            searchIndexPromise = Promise.all([
+                fetch('item_catalog/search_index.json').then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status} for item_catalog/search_index.json`);
+                    }
+                    return response.json();
+                }),
+                loadItemLookup()
+            ])
+                .then(([index]) => {
+                    if (itemLookupRows.length === 0) {
+                        throw new Error('Item lookup table not loaded');
+                    }
+                    index.decodedPostings = new Map(); // Postings are delta-encoded; decoded on first use
+                    return index;
+                })
+                .catch(error => {
+                    console.warn('Search index unavailable, filtering the sidebar tree instead:', error);
+                    return null;
+                });
+        }
+        return searchIndexPromise;
+    }
+
+    function getPostings(index, table, key) {
+        const cacheKey = table + ':' + key;
+        if (!index.decodedPostings.has(cacheKey)) {
+            const deltas = index[table][key] || [];
+            let itemNumber = 0;
+            index.decodedPostings.set(cacheKey, deltas.map(delta => (itemNumber += delta)));
+        }
+        return index.decodedPostings.get(cacheKey);
+    }
+
+    function intersectPostings(lists) {
+        if (lists.length === 0) return [];
+        lists.sort((a, b) => a.length - b.length);
+        let result = lists[0];
+        for (let i = 1; i < lists.length && result.length > 0; i++) {
+            const other = lists[i];
+            const next = [];
+            let j = 0;
+            for (const itemNumber of result) {
+                while (j < other.length && other[j] < itemNumber) j++;
+                if (j < other.length && other[j] === itemNumber) next.push(itemNumber);
+            }
+            result = next;
+        }
+        return result;
+    }
+
+    // Returns [{ itemNumber, rank }] for a normalized query, best first. Ranks: 0 exact name,
+    // 1 name starts with the query, 2 every query word starts a word of the name,
+    // 3 query appears inside the name, 4 the item's category or group matches.
+    function searchItems(index, query) {
+        const queryTokens = query.split(' ');
+        const maxPrefixLength = Math.max(...index.prefix_lengths);
+        const ranks = new Map();
+        const rankItem = (itemNumber, rank) => {
+            if (!ranks.has(itemNumber) || ranks.get(itemNumber) > rank) ranks.set(itemNumber, rank);
+        };
+
+        const prefixCandidates = intersectPostings(queryTokens.map(token => getPostings(index, 'prefixes', token.substring(0, maxPrefixLength))));
+        for (const itemNumber of prefixCandidates) {
+            const normalized = index.items[itemNumber][1];
+            const nameTokens = normalized.split(' ');
+            if (normalized === query) {
+                rankItem(itemNumber, 0);
+            } else if (normalized.startsWith(query)) {
+                rankItem(itemNumber, 1);
+            } else if (queryTokens.every(token => nameTokens.some(nameToken => nameToken.startsWith(token)))) {
+                rankItem(itemNumber, 2);
+            }
+        }
+
+        if (query.length >= index.ngram_length) {
+            const ngrams = new Set();
+            for (let i = 0; i + index.ngram_length <= query.length; i++) {
+                ngrams.add(query.substring(i, i + index.ngram_length));
+            }
+            const ngramCandidates = intersectPostings(Array.from(ngrams, ngram => getPostings(index, 'ngrams', ngram)));
+            for (const itemNumber of ngramCandidates) {
+                if (index.items[itemNumber][1].includes(query)) rankItem(itemNumber, 3);
+            }
+        }
+
+        const matchingFacets = facet => new Set(index.facets[facet].names
+            .map((name, number) => (normalizeSearchText(name).includes(query) ? number : -1))
+            .filter(number => number >= 0));
+        const matchingCategories = matchingFacets('category');
+        const matchingGroups = matchingFacets('group');
+        if (matchingCategories.size > 0 || matchingGroups.size > 0) {
+            index.items.forEach((item, itemNumber) => {
+                if (matchingCategories.has(item[2]) || matchingGroups.has(item[3])) rankItem(itemNumber, 4);
+            });
+        }
+
+        // Items are stored shortest name first, so item number breaks ties
+        return Array.from(ranks, ([itemNumber, rank]) => ({ itemNumber, rank }))
+            .sort((a, b) => a.rank - b.rank || a.itemNumber - b.itemNumber);
+    }
+
+    function renderSearchResults(index, results) {
+        searchResultsContainer.innerHTML = '';
+
+        // Category facets over all matches, most frequent first
+        const facetCounts = new Map();
+        results.forEach(({ itemNumber }) => {
+            const category = index.items[itemNumber][2];
+            facetCounts.set(category, (facetCounts.get(category) || 0) + 1);
+        });
+        if (activeSearchFacet !== null && !facetCounts.has(activeSearchFacet)) {
+            activeSearchFacet = null;
+        }
+        if (facetCounts.size > 1 || activeSearchFacet !== null) {
+            const facetsDiv = document.createElement('div');
+            facetsDiv.className = 'search-facets';
+            Array.from(facetCounts).sort((a, b) => b[1] - a[1]).forEach(([category, count]) => {
+                const chip = document.createElement('span');
+                chip.className = 'search-facet' + (category === activeSearchFacet ? ' active' : '');
+                chip.textContent = `${index.facets.category.names[category]} (${count})`;
+                chip.addEventListener('click', () => {
+                    activeSearchFacet = category === activeSearchFacet ? null : category;
+                    renderSearchResults(index, results);
+                });
+                facetsDiv.appendChild(chip);
+            });
+            searchResultsContainer.appendChild(facetsDiv);
+        }
+
+        const shownResults = activeSearchFacet === null
+            ? results
+            : results.filter(({ itemNumber }) => index.items[itemNumber][2] === activeSearchFacet);
+        const summary = document.createElement('p');
+        summary.className = 'search-summary';
+        summary.textContent = shownResults.length > MAX_SEARCH_RESULTS
+            ? `Showing ${MAX_SEARCH_RESULTS} of ${shownResults.length} matches`
+            : `${shownResults.length} match${shownResults.length === 1 ? '' : 'es'}`;
+        searchResultsContainer.appendChild(summary);
+
+        const ul = document.createElement('ul');
+        shownResults.slice(0, MAX_SEARCH_RESULTS).forEach(({ itemNumber }) => {
+            const item = index.items[itemNumber];
+            const details = itemLookupRows[item[4]];
+            const listItem = document.createElement('li');
+            listItem.className = 'nav-item item-leaf';
+            listItem.dataset.csvPath = details.path;
+            if (details.icon_path) {
+                const img = document.createElement('img');
+                img.src = details.icon_path;
+                img.alt = item[0];
+                img.classList.add('sidebar-item-icon');
+                listItem.appendChild(img);
+            }
+            const textElement = document.createElement('span');
+            textElement.textContent = item[0];
+            const categoryElement = document.createElement('span');
+            categoryElement.className = 'search-result-category';
+            categoryElement.textContent = `${index.facets.category.names[item[2]]} / ${index.facets.group.names[item[3]]}`;
+            textElement.appendChild(categoryElement);
+            textElement.addEventListener('click', function() {
+                loadItemData(details.path, details.name);
+                const currentlySelected = searchResultsContainer.querySelector('.nav-item.selected-leaf');
+                if (currentlySelected) {
+                    currentlySelected.classList.remove('selected-leaf');
+                }
+                listItem.classList.add('selected-leaf');
+            });
+            listItem.appendChild(textElement);
+            ul.appendChild(listItem);
+        });
+        searchResultsContainer.appendChild(ul);
+    }
+
+    function filterSidebar(searchTerm) {
+        const term = searchTerm.toLowerCase();
+        if (term.trim() === "") {
+            searchResultsContainer.style.display = 'none';
+            searchResultsContainer.innerHTML = '';
+            itemSelectorContainer.style.display = '';
+            filterSidebarTree("");
+            return;
+        }
+
+        loadSearchIndex().then(index => {
+            if (sidebarSearchInput && sidebarSearchInput.value.toLowerCase() !== term) {
+                return; // A newer search has started
+            }
+            if (!index) {
+                filterSidebarTree(term);
+                return;
+            }
+            const query = normalizeSearchText(term);
+            const results = query ? searchItems(index, query) : [];
+            itemSelectorContainer.style.display = 'none';
+            searchResultsContainer.style.display = '';
+            renderSearchResults(index, results);
+        });
     }
 
     if (sidebarSearchInput) {
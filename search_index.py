@@ -0,0 +1,101 @@
+import csv
+import re
+import unicodedata
+
+# Configuration
+SEARCH_INDEX_VERSION = 1
+PREFIX_LENGTHS = (1, 2, 3) # Token prefixes indexed; longer query tokens are verified against the names
+NGRAM_LENGTH = 3
+
+def normalize_name(name: str) -> str:
+    """
+    Lowercases name, strips accents and collapses everything but letters and digits to single spaces.
+    The frontend's normalizeSearchText applies the same rules to queries.
+    """
+    decomposed = unicodedata.normalize('NFKD', str(name or ''))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return re.sub(r'[\W_]+', ' ', stripped.lower()).strip()
+
+def _sanitized_path_part(name_str) -> str:
+    # Same rules as sanitize_for_path in generate_item_json.py
+    if not name_str:
+        name_str = "unknown"
+    name_str = str(name_str).replace(' ', '_')
+    return re.sub(r'[^\w\-_.]', '', name_str)[:100]
+
+def _delta_encode(postings: list[int]) -> list[int]:
+    return [postings[0]] + [current - previous for previous, current in zip(postings, postings[1:])]
+
+def build_search_index(item_lists_csv_path: str, lookup_rows: list[list]) -> dict:
+    """
+    Builds the search index for the frontend from item_lists.csv, keeping only items that have a
+    history in the catalog (lookup_rows as written to lookup.json: id, name, history_path, icon_path).
+
+    The result holds one row per item ([display name, normalized name, category, group, lookup row],
+    category/group as facet numbers and the lookup row pointing into lookup.json for the name and
+    paths), the category and group facet names with item counts, and postings for token prefixes and
+    character n-grams of the normalized names. Postings are ascending item numbers, delta-encoded.
+    """
+    lookup_by_id = {}
+    for lookup_row, (item_id, _, history_path, _) in enumerate(lookup_rows):
+        lookup_by_id.setdefault(item_id, []).append((lookup_row, history_path))
+
+    categories = []
+    groups = []
+    category_numbers = {}
+    group_numbers = {}
+    category_counts = []
+    group_counts = []
+    items = []
+    with open(item_lists_csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            matches = lookup_by_id.get(row.get('id', ''))
+            if not matches:
+                continue
+            # Items present in several trees: prefer the one under the CSV's category/group
+            expected_dir = f"/{_sanitized_path_part(row.get('category_name'))}/{_sanitized_path_part(row.get('group_name'))}/"
+            lookup_row = next((match for match in matches if expected_dir in match[1]), matches[0])[0]
+
+            category = row.get('category_name', '')
+            group = row.get('group_name', '')
+            if category not in category_numbers:
+                category_numbers[category] = len(categories)
+                categories.append(category)
+                category_counts.append(0)
+            if group not in group_numbers:
+                group_numbers[group] = len(groups)
+                groups.append(group)
+                group_counts.append(0)
+            category_counts[category_numbers[category]] += 1
+            group_counts[group_numbers[group]] += 1
+            items.append([row.get('name', ''), normalize_name(row.get('name', '')), category_numbers[category],
+                          group_numbers[group], lookup_row])
+
+    # Most relevant first among equally ranked results: shorter names, then alphabetical
+    items.sort(key=lambda item: (len(item[1]), item[1]))
+
+    prefix_postings = {}
+    ngram_postings = {}
+    for item_number, item in enumerate(items):
+        normalized = item[1]
+        prefixes = set()
+        for token in normalized.split():
+            prefixes.update(token[:length] for length in PREFIX_LENGTHS if len(token) >= length)
+        for prefix in prefixes:
+            prefix_postings.setdefault(prefix, []).append(item_number)
+        for ngram in {normalized[i:i + NGRAM_LENGTH] for i in range(len(normalized) - NGRAM_LENGTH + 1)}:
+            ngram_postings.setdefault(ngram, []).append(item_number)
+
+    return {
+        'version': SEARCH_INDEX_VERSION,
+        'prefix_lengths': list(PREFIX_LENGTHS),
+        'ngram_length': NGRAM_LENGTH,
+        'columns': ['name', 'normalized', 'category', 'group', 'lookup_row'],
+        'items': items,
+        'facets': {
+            'category': {'names': categories, 'counts': category_counts},
+            'group': {'names': groups, 'counts': group_counts}
+        },
+        'prefixes': {key: _delta_encode(postings) for key, postings in sorted(prefix_postings.items())},
+        'ngrams': {key: _delta_encode(postings) for key, postings in sorted(ngram_postings.items())}
+    }
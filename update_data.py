@@ -1,246 +1,599 @@
 import requests
-import time
 import os
 import csv
-import re
-from datetime import datetime, timezone # Ensure timezone is imported
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone # Ensure timezone is imported
+import http_client
+from http_client import http_get, STREAM_CHUNK_BYTES
+from history_store import HistoryStore, sanitize_for_path
+from run_metrics import run_metrics, profiled, RUN_REPORT_FILE
+try:
+    from indicator_cache import IndicatorCache # Needs NumPy; the indicator cache is optional
+except ImportError:
+    IndicatorCache = None
+import item_catalog_db
+from item_table import ItemTable
 
 # Configuration
 API_BASE_URL_ITEMS = "https://echoes.mobi/api/items"
 API_BASE_URL_HISTORY = "https://echoes.mobi/api/item_weekly_average_prices?page=1&itemId="
 ITEMS_OUTPUT_CSV_FILE = "item_lists.csv"
+USE_SQLITE_CATALOG = False # Keep the catalog in item_catalog_db.CATALOG_DB_FILE and export item_lists.csv from it
 HISTORIES_BASE_DIR = "item_histories"
-REQUEST_DELAY_SECONDS = 0.05
-FINAL_CSV_HEADERS = ['id', 'name', 'category_name', 'group_name', 'weekly_average_price', 'icon_id', 'date_created', 'date_updated', 'icon_url', 'icon_downloaded', 'needs_history_update']
+HISTORY_TAIL_MANIFEST_FILE = os.path.join(".update_state", "history_tail_manifest.json")
+ICONS_BASE_DIR = "item_icons" # Shared icon store, one <icon_id>.png per icon
+ITEM_DATA_JSON_FILE = "item_data.json" # Written by generate_item_json.py; its icon paths decide which legacy icon copies can go
+HISTORY_FETCH_WORKERS = 16 # Upper bound on items processed concurrently by fetch_and_save_histories; http_client's rate controller decides how many requests are in flight
+BACKFILL_STATE_FILE = os.path.join(".update_state", "backfill_state.json")
+RUN_JOURNAL_FILE = os.path.join(".update_state", "run_journal.jsonl") # Checkpoint of the history work of the last run
+ICON_DOWNLOAD_WORKERS = 16 # Upper bound on unique icons downloaded concurrently by download_item_icons
+ITEM_PAGES_IN_FLIGHT = 4 # /api/items pages requested ahead by fetch_and_save_items
+ITEM_SYNC_STATE_FILE = os.path.join(".update_state", "item_sync_state.json") # date_updated watermark and page digests of the last item sync
+FULL_ITEM_SCAN_INTERVAL_DAYS = 7 # Delta syncs only see items whose date_updated moved; rescan every page at least this often
 
-def sanitize_for_path(name_str):
+class RunJournal:
     """
-    Sanitizes a string to be safe for directory/file names.
+    Append-only checkpoint of a run's history work, so an interrupted run can be resumed.
+    The journal starts with the IDs of every item whose history must be updated and gets one line
+    per item completed. needs_history_update is not kept in item_lists.csv across runs, so the
+    journal is what remembers unfinished items; it is removed once nothing is left.
+    A torn last line (from a crash mid-write) is ignored when loading.
     """
-    if not name_str:
-        name_str = "unknown"
-    name_str = name_str.replace(' ', '_')
-    name_str = re.sub(r'[^\w\-_]', '', name_str)
-    return name_str[:100]
+    def __init__(self, journal_path: str = RUN_JOURNAL_FILE):
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self._file = None
+        self.pending = [] # Item IDs of the journaled run, in order
+        self.done = set()
+        if os.path.exists(journal_path):
+            try:
+                with open(journal_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if record.get('event') == 'start':
+                            self.pending = record.get('item_ids', [])
+                            self.done = set()
+                        elif record.get('event') == 'done':
+                            self.done.add(record.get('item_id'))
+            except OSError as e:
+                print(f"Error reading {journal_path}: {e}. Starting without a journal.")
+
+    def remaining_item_ids(self) -> list[str]:
+        return [item_id for item_id in self.pending if item_id not in self.done]
+
+    def start(self, item_ids: list[str]) -> list[str]:
+        """
+        Journals a new run for item_ids, carrying over the items an interrupted previous run left unfinished.
+        Returns the combined list of item IDs to process.
+        """
+        carried_over = self.remaining_item_ids()
+        if carried_over:
+            print(f"Carrying over {len(carried_over)} items left unfinished by an interrupted run.")
+        combined = list(dict.fromkeys(list(item_ids) + carried_over))
+        with self._lock:
+            self.close()
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            temp_path = self.journal_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'event': 'start', 'started_at': datetime.now(timezone.utc).isoformat(), 'item_ids': combined}) + '\n')
+            os.replace(temp_path, self.journal_path)
+            self.pending = combined
+            self.done = set()
+        return combined
+
+    def mark_done(self, item_id: str):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_path, 'a', encoding='utf-8')
+            self._file.write(json.dumps({'event': 'done', 'item_id': item_id}) + '\n')
+            self._file.flush()
+            self.done.add(item_id)
 
-def fetch_and_save_items():
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """Closes the journal, removing it if every journaled item was completed."""
+        with self._lock:
+            self.close()
+            if not self.remaining_item_ids() and os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+def _iter_csv_lines(response: requests.Response):
     """
-    Fetches item data from the paginated API, merges with existing data, and saves to a CSV file.
-    Returns a list of item IDs that need their history updated.
+    Yields the non-empty lines of a streamed CSV response as they arrive, decoded as UTF-8
+    unless the server declared a charset.
     """
-    all_items_data = {} # Keyed by item ID
-    items_needing_history_update = []
+    if 'charset' not in response.headers.get('Content-Type', '').lower():
+        response.encoding = 'utf-8'
+    for line in response.iter_lines(chunk_size=STREAM_CHUNK_BYTES, decode_unicode=True):
+        if line.strip():
+            yield line
 
-    # Load existing data from item_lists.csv if it exists
-    if os.path.exists(ITEMS_OUTPUT_CSV_FILE):
-        print(f"Loading existing data from {ITEMS_OUTPUT_CSV_FILE}...")
-        try:
-            with open(ITEMS_OUTPUT_CSV_FILE, mode='r', encoding='utf-8', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    item_id = row.get('id')
-                    if item_id:
-                        # Ensure icon_downloaded exists, default to 'False' if not
-                        if 'icon_downloaded' not in row:
-                            row['icon_downloaded'] = 'False'
-                        # Initialize needs_history_update to 'False' for existing items
-                        row['needs_history_update'] = 'False'
-                        all_items_data[item_id] = row
-                print(f"Loaded {len(all_items_data)} items from CSV.")
-        except Exception as e:
-            print(f"Error reading {ITEMS_OUTPUT_CSV_FILE}: {e}. Starting with an empty dataset.")
-            all_items_data = {} # Reset if error
+def _parse_api_timestamp(value: str | None) -> datetime | None:
+    """Parses an API ISO 8601 timestamp (e.g. date_updated) as an aware datetime, or None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
 
-    current_page = 1
-    headers = {'accept': 'text/csv'}
-    print("Starting to fetch item data from API...")
+class ItemSyncState:
+    """
+    Persistent state of the last completed item sync: the newest date_updated in the catalog
+    (the watermark a delta sync pages down to), when every page was last scanned, the catalog
+    size then, and a digest of each page of the full listing so unchanged pages are not merged again.
+    """
+    def __init__(self, state_path: str = ITEM_SYNC_STATE_FILE):
+        self.state_path = state_path
+        self.watermark = None
+        self.last_full_scan = None
+        self.item_count = None
+        self.page_digests = {}
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self.watermark = state.get('watermark')
+                self.last_full_scan = state.get('last_full_scan')
+                self.item_count = state.get('item_count')
+                self.page_digests = state.get('page_digests') or {}
+            except (OSError, ValueError) as e:
+                print(f"Error reading {state_path}: {e}. Falling back to a full item scan.")
 
-    api_data_processed = False
+    def full_scan_reason(self, local_item_count: int) -> str | None:
+        """Returns why a delta sync can't be trusted against the local catalog, or None if it can."""
+        if not local_item_count:
+            return "no local item list"
+        watermark = _parse_api_timestamp(self.watermark)
+        last_full_scan = _parse_api_timestamp(self.last_full_scan)
+        if watermark is None or last_full_scan is None:
+            return "no sync watermark"
+        if self.item_count != local_item_count:
+            return f"local item list has {local_item_count} items, {self.item_count} at the last sync"
+        if datetime.now(timezone.utc) - last_full_scan >= timedelta(days=FULL_ITEM_SCAN_INTERVAL_DAYS):
+            return f"last full scan is older than {FULL_ITEM_SCAN_INTERVAL_DAYS} days"
+        return None
 
-    while True:
+    def save(self, newest_date_updated: int | None, item_count: int, full_scan: bool, page_digests: dict | None = None):
+        """
+        Records a completed sync: the new watermark (newest_date_updated in epoch seconds) and catalog size,
+        and for a full scan its time and page digests.
+        """
+        if newest_date_updated is not None:
+            self.watermark = datetime.fromtimestamp(newest_date_updated, timezone.utc).isoformat()
+        self.item_count = item_count
+        if full_scan:
+            self.last_full_scan = datetime.now(timezone.utc).isoformat()
+            self.page_digests = page_digests or {}
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'watermark': self.watermark, 'last_full_scan': self.last_full_scan,
+                       'item_count': self.item_count, 'page_digests': self.page_digests}, f)
+        os.replace(temp_path, self.state_path)
+
+def _page_digest(rows: list[dict]) -> str:
+    return hashlib.sha1(json.dumps(rows, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _fetch_items_page(page_number: int, newest_first: bool = False) -> tuple[list[dict], str]:
+    """
+    Fetches and parses a single page of the /api/items CSV listing, in name order or,
+    with newest_first, by date_updated descending.
+    Returns (rows, error_message). An empty row list with no error marks the end of pagination.
+    """
+    if newest_first:
         params = {
-            'page': current_page,
+            'page': page_number,
+            'order[dateUpdated]': 'desc',
+            'exists[weekly_average_price]': 'true'
+        }
+    else:
+        params = {
+            'page': page_number,
             'order[name]': 'asc',
             'order[categoryName]': 'asc',
             'order[groupName]': 'asc',
             'exists[weekly_average_price]': 'true' # This filter might be too restrictive if we want all items
         }
-        
-        try:
-            print(f"Fetching API item list page {current_page}...")
-            response = requests.get(API_BASE_URL_ITEMS, headers=headers, params=params, timeout=30)
+    headers = {'accept': 'text/csv'}
 
-            if response.status_code == 200:
-                response_text_stripped = response.text.strip()
-
-                if not response_text_stripped:
-                    print(f"API Page {current_page} is effectively empty. Assuming no more item data.")
-                    break
-
-                reader = csv.DictReader(response_text_stripped.splitlines())
-                api_items_on_page = list(reader)
-
-                if not api_items_on_page: # Handles header-only response or empty after parsing
-                    print(f"No data items on API page {current_page} (only header or empty). Ending pagination.")
-                    break
-                
-                api_data_processed = True # Mark that we have processed at least one page with data
-
-                for api_item in api_items_on_page:
-                    item_id = api_item.get('id')
-                    if not item_id:
-                        print(f"Skipping API item due to missing ID: {api_item.get('name', 'Unknown Name')}")
-                        continue
-
-                    date_updated_api = api_item.get('date_updated')
-
-                    if item_id in all_items_data:
-                        # Item exists, check for updates
-                        existing_item = all_items_data[item_id]
-                        date_updated_local = existing_item.get('date_updated')
-                        icon_downloaded_status = existing_item.get('icon_downloaded', 'False') # Preserve existing
-
-                        if date_updated_api and date_updated_local and date_updated_api > date_updated_local:
-                            print(f"Updating item {item_id} ('{api_item.get('name')}') as API data is newer.")
-                            # Update all fields from API, preserve icon_downloaded
-                            for key, value in api_item.items():
-                                existing_item[key] = value
-                            existing_item['icon_downloaded'] = icon_downloaded_status
-                            existing_item['needs_history_update'] = 'True'
-
-                        all_items_data[item_id] = existing_item # Ensure reference is updated if dict was copied
-                    else:
-                        # New item
-                        print(f"Adding new item {item_id} ('{api_item.get('name')}').")
-                        new_item_entry = {header: '' for header in FINAL_CSV_HEADERS} # Initialize with all headers
-                        new_item_entry.update(api_item) # Populate with API data
-                        new_item_entry['icon_downloaded'] = 'False'
-                        new_item_entry['needs_history_update'] = 'True'
-                        all_items_data[item_id] = new_item_entry
-            else:
-                print(f"Error fetching API item list page {current_page}: Status code {response.status_code}")
-                print(f"Response content: {response.text[:200]}")
-                break # Stop on error
-        
-        except requests.exceptions.RequestException as e:
-            print(f"Request for API item list failed on page {current_page}: {e}")
-            break # Stop on error
+    run_metrics.log_item(f"Fetching API item list page {page_number}...")
+    try:
+        response = http_get(API_BASE_URL_ITEMS, headers=headers, params=params, stream=True)
+    except requests.exceptions.RequestException as e:
+        return [], f"Request for API item list failed on page {page_number}: {e}"
+
+    with response:
+        if response.status_code != 200:
+            return [], f"Error fetching API item list page {page_number}: Status code {response.status_code}\nResponse content: {response.text[:200]}"
+
+        try:
+            rows = list(csv.DictReader(_iter_csv_lines(response)))
         except csv.Error as e:
-            print(f"CSV parsing error on API page {current_page}: {e}. Response text: {response.text[:500]}")
+            return [], f"CSV parsing error on API page {page_number}: {e}"
+        except requests.exceptions.RequestException as e:
+            return [], f"Reading API item list page {page_number} failed: {e}"
+    if not rows:
+        run_metrics.log_item(f"API Page {page_number} is effectively empty. Assuming no more item data.")
+    return rows, ""
+
+def _merge_api_items(all_items_data: ItemTable, api_items_on_page: list[dict], sync_counts: Counter) -> list[str]:
+    """
+    Merges one page of API items into the all_items_data table, flagging new
+    and updated items for a history update. Items without an integer ID can't be held
+    by the table; they are reported and counted in sync_counts['rejected_items'].
+    Returns the IDs of the items that were added or updated.
+    """
+    changed_item_ids = []
+    for api_item in api_items_on_page:
+        item_id = api_item.get('id')
+        if not item_id or not item_id.isdigit():
+            print(f"Rejecting API item '{api_item.get('name', 'Unknown Name')}': ID {item_id!r} is missing or not an integer.")
+            sync_counts['rejected_items'] += 1
+            continue
+
+        date_updated_api = _parse_api_timestamp(api_item.get('date_updated'))
+        index = all_items_data.index_of(item_id)
+
+        if index is not None:
+            # Item exists, check for updates
+            date_updated_local = all_items_data.date_updated[index]
+
+            if date_updated_api and date_updated_local and int(date_updated_api.timestamp()) > date_updated_local:
+                run_metrics.log_item(f"Updating item {item_id} ('{api_item.get('name')}') as API data is newer.")
+                # Update all fields from API; icon_downloaded is not an API field and is kept
+                all_items_data.update(index, api_item)
+                all_items_data.set_flag('needs_history_update', index, True)
+                changed_item_ids.append(item_id)
+        else:
+            # New item
+            run_metrics.log_item(f"Adding new item {item_id} ('{api_item.get('name')}').")
+            index = all_items_data.append(api_item)
+            all_items_data.set_flag('icon_downloaded', index, False)
+            all_items_data.set_flag('needs_history_update', index, True)
+            changed_item_ids.append(item_id)
+    return changed_item_ids
+
+def _iter_item_pages(pages_in_flight: int, newest_first: bool = False):
+    """
+    Yields (page_number, rows, error_message) for the /api/items listing in page order, keeping
+    up to pages_in_flight pages requested ahead. Stops after the first empty page or error;
+    pages still in flight when the caller stops early are discarded.
+    """
+    with ThreadPoolExecutor(max_workers=pages_in_flight) as executor:
+        pending_pages = {}
+        next_page_to_request = 1
+        current_page = 1
+        try:
+            while True:
+                while len(pending_pages) < pages_in_flight:
+                    pending_pages[next_page_to_request] = executor.submit(_fetch_items_page, next_page_to_request, newest_first)
+                    next_page_to_request += 1
+                rows, error_message = pending_pages.pop(current_page).result()
+                yield current_page, rows, error_message
+                if error_message or not rows:
+                    return
+                current_page += 1
+        finally:
+            for future in pending_pages.values():
+                future.cancel()
+
+def _sync_items_full(all_items_data: ItemTable, changed_item_ids: set, pages_in_flight: int, page_digests: dict, sync_counts: Counter) -> dict | None:
+    """
+    Merges every page of the listing into all_items_data. Pages whose digest matches page_digests
+    (from the last full scan) are not merged again.
+    Returns the digests of this scan, or None if pagination stopped on an error.
+    """
+    new_page_digests = {}
+    for page_number, api_items_on_page, error_message in _iter_item_pages(pages_in_flight):
+        if error_message:
+            print(error_message)
+            return None
+        if not api_items_on_page:
+            print(f"No data items on API page {page_number} (only header or empty). Ending pagination.")
             break
+        sync_counts['pages_fetched'] += 1
+        digest = _page_digest(api_items_on_page)
+        new_page_digests[str(page_number)] = digest
+        if page_digests.get(str(page_number)) == digest:
+            sync_counts['pages_unchanged'] += 1
+            continue
+        changed_item_ids.update(_merge_api_items(all_items_data, api_items_on_page, sync_counts))
+    return new_page_digests
 
-        current_page += 1
-        time.sleep(REQUEST_DELAY_SECONDS)
+def _sync_items_delta(all_items_data: ItemTable, changed_item_ids: set, watermark: datetime, sync_counts: Counter) -> bool:
+    """
+    Merges pages of the listing ordered by date_updated descending until reaching an item last
+    updated at or before watermark; items past it can't be newer than the local copy, so merging
+    them would change nothing (new items among them are picked up by the next full scan).
+    Returns False if the result can't be trusted (a fetch error, or rows missing date_updated or
+    not in descending order, i.e. the server ignored the ordering) and a full scan is needed.
+    """
+    previous_timestamp = None
+    for page_number, api_items_on_page, error_message in _iter_item_pages(1, newest_first=True):
+        if error_message:
+            print(error_message)
+            return False
+        if not api_items_on_page:
+            return True # Reached the end of the listing
+        sync_counts['pages_fetched'] += 1
+        timestamps = [_parse_api_timestamp(api_item.get('date_updated')) for api_item in api_items_on_page]
+        for timestamp in timestamps:
+            if timestamp is None or (previous_timestamp is not None and timestamp > previous_timestamp):
+                print(f"API page {page_number} is not ordered by date_updated. Falling back to a full item scan.")
+                return False
+            previous_timestamp = timestamp
+        changed_item_ids.update(_merge_api_items(all_items_data, api_items_on_page, sync_counts))
+        if previous_timestamp <= watermark:
+            run_metrics.log_item(f"API page {page_number} reaches items last updated by {watermark.isoformat()}. Ending delta sync.")
+            return True
 
-    # After loop, ensure items loaded from CSV but not in API have needs_history_update='False'
-    # This is implicitly handled by the logic: initial load is 'False', and only API interaction changes it.
-    # If an item from CSV was never found in API, its 'needs_history_update' remains 'False'.
+def fetch_and_save_items(pages_in_flight: int = ITEM_PAGES_IN_FLIGHT, catalog_db=None, journal: RunJournal = None,
+                         full_scan: bool = False, sync_state_path: str = ITEM_SYNC_STATE_FILE):
+    """
+    Fetches item data from the paginated API, merges with existing data, and saves to a CSV file.
+    Unless full_scan is set, a delta sync only pages through the items updated since the watermark in
+    sync_state_path (newest first); it falls back to scanning every page when there is no watermark,
+    the local item list doesn't match the last sync, the last full scan is FULL_ITEM_SCAN_INTERVAL_DAYS
+    old (deleted items are only noticed then), or the API's answer can't be trusted (see _sync_items_delta).
+    A full scan requests up to pages_in_flight pages concurrently and merges them in page order,
+    skipping pages identical to the last full scan while the local item list is the one that scan left.
+    With a catalog_db connection (see item_catalog_db.py), existing data is loaded from the database
+    and only new or updated rows are upserted in one transaction; item_lists.csv is not written here.
+    With a journal, the items needing a history update are journaled (together with any left over by
+    an interrupted run) before the item list is saved, so none are lost if the run is interrupted.
+    Returns a list of item IDs that need their history updated, and the item list as an ItemTable.
+    """
+    all_items_data = ItemTable()
+    changed_item_ids = set()
 
-    # Write all_items_data to CSV
-    print(f"\nWriting {len(all_items_data)} items to {ITEMS_OUTPUT_CSV_FILE}...")
-    try:
-        with open(ITEMS_OUTPUT_CSV_FILE, mode='w', encoding='utf-8', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=FINAL_CSV_HEADERS)
-            writer.writeheader()
-            for item_id, item_data in all_items_data.items():
-                # Ensure all keys in FINAL_CSV_HEADERS are present, default to empty string if missing
-                row_to_write = {header: item_data.get(header, '') for header in FINAL_CSV_HEADERS}
-                writer.writerow(row_to_write)
-        print(f"Successfully wrote items to {ITEMS_OUTPUT_CSV_FILE}.")
-    except Exception as e:
-        print(f"Error writing to {ITEMS_OUTPUT_CSV_FILE}: {e}")
-        # Decide if we should return empty or raise, based on requirements for atomicity
-        return [] # Return empty list on write failure
+    if catalog_db is not None:
+        if item_catalog_db.item_count(catalog_db) == 0 and os.path.exists(ITEMS_OUTPUT_CSV_FILE):
+            print(f"Importing {ITEMS_OUTPUT_CSV_FILE} into the SQLite catalog...")
+            item_catalog_db.import_csv(catalog_db, ITEMS_OUTPUT_CSV_FILE)
+        all_items_data = ItemTable.from_rows(item_catalog_db.load_items(catalog_db).values())
+        print(f"Loaded {len(all_items_data)} items from the SQLite catalog.")
+    # Load existing data from item_lists.csv if it exists (missing icon_downloaded flags read as 'False')
+    elif os.path.exists(ITEMS_OUTPUT_CSV_FILE):
+        print(f"Loading existing data from {ITEMS_OUTPUT_CSV_FILE}...")
+        try:
+            all_items_data = ItemTable.read_csv(ITEMS_OUTPUT_CSV_FILE)
+            print(f"Loaded {len(all_items_data)} items from CSV.")
+        except Exception as e:
+            print(f"Error reading {ITEMS_OUTPUT_CSV_FILE}: {e}. Starting with an empty dataset.")
+            all_items_data = ItemTable() # Reset if error
+    # Existing items only need a history update if the API has newer data for them
+    all_items_data.clear_history_update_flags()
 
-    # Collect IDs for history update
-    for item_id, data in all_items_data.items():
-        if data.get('needs_history_update') == 'True':
-            items_needing_history_update.append(item_id)
+    sync_state = ItemSyncState(sync_state_path)
+    sync_counts = Counter()
+    full_scan_reason = "requested" if full_scan else sync_state.full_scan_reason(len(all_items_data))
+    sync_completed = False
+    if full_scan_reason is None:
+        print(f"Starting delta sync of item data updated since {sync_state.watermark}...")
+        sync_completed = _sync_items_delta(all_items_data, changed_item_ids, _parse_api_timestamp(sync_state.watermark), sync_counts)
+        if sync_completed:
+            sync_counts['delta_syncs'] += 1
+        else:
+            full_scan_reason = "delta sync could not be trusted"
+    if full_scan_reason is not None:
+        print(f"Starting full scan of item data from API ({full_scan_reason}; {pages_in_flight} pages in flight)...")
+        # Page digests only stand for the local data while it is the catalog the last sync left behind
+        trusted_page_digests = sync_state.page_digests if not full_scan and all_items_data and sync_state.item_count == len(all_items_data) else {}
+        page_digests = _sync_items_full(all_items_data, changed_item_ids, pages_in_flight, trusted_page_digests, sync_counts)
+        sync_completed = page_digests is not None
+        if sync_completed:
+            sync_counts['full_scans'] += 1
+
+    # Collect IDs for history update; items from CSV that the API didn't update keep the cleared flag
+    items_needing_history_update = all_items_data.item_ids(all_items_data.rows_needing_history_update())
+    if journal is not None:
+        items_needing_history_update = journal.start(items_needing_history_update)
+
+    if catalog_db is not None:
+        print(f"\nUpserting {len(changed_item_ids)} new or updated items into {item_catalog_db.CATALOG_DB_FILE}...")
+        try:
+            item_catalog_db.upsert_items(catalog_db, (all_items_data[item_id] for item_id in changed_item_ids), clear_history_update_flags=True)
+        except Exception as e:
+            print(f"Error updating {item_catalog_db.CATALOG_DB_FILE}: {e}")
+            return [], ItemTable()
+    else:
+        # Write all_items_data to CSV
+        print(f"\nWriting {len(all_items_data)} items to {ITEMS_OUTPUT_CSV_FILE}...")
+        try:
+            all_items_data.write_csv(ITEMS_OUTPUT_CSV_FILE)
+            print(f"Successfully wrote items to {ITEMS_OUTPUT_CSV_FILE}.")
+        except Exception as e:
+            print(f"Error writing to {ITEMS_OUTPUT_CSV_FILE}: {e}")
+            # Decide if we should return empty or raise, based on requirements for atomicity
+            return [], ItemTable() # Return nothing on write failure
+
+    if sync_completed:
+        # Only a sync that saw every changed page moves the watermark
+        try:
+            sync_state.save(all_items_data.newest_date_updated(), len(all_items_data), full_scan_reason is not None, page_digests if full_scan_reason is not None else None)
+        except OSError as e:
+            print(f"Error writing {sync_state.state_path}: {e}. The next run will scan every page.")
 
-    print(f"Found {len(items_needing_history_update)} items needing history update.")
-    return items_needing_history_update, list(all_items_data.values())
+    print(f"Found {len(items_needing_history_update)} items needing history update "
+          f"({sync_counts['pages_fetched']} pages fetched, {sync_counts['pages_unchanged']} unchanged).")
+    if sync_counts['rejected_items']:
+        print(f"Warning: {sync_counts['rejected_items']} API items were rejected for a missing or non-integer ID (see above).")
+    run_metrics.add_counts('items', {'total': len(all_items_data), 'changed': len(changed_item_ids),
+                                     'needing_history_update': len(items_needing_history_update), **sync_counts})
+    return items_needing_history_update, all_items_data
 
 
-def download_item_icons(all_items_data: list[dict]) -> list[dict]:
+def icon_store_path(icon_id) -> str:
     """
-    Downloads icons for items in the all_items_data list.
-    Updates the 'icon_downloaded' status in each item's dictionary.
+    Returns the path of an icon in the shared icon store, or "" if icon_id is unusable as a filename.
+    """
+    sanitized_icon_id = sanitize_for_path(str(icon_id)) if icon_id else ""
+    if not sanitized_icon_id:
+        return ""
+    return os.path.join(ICONS_BASE_DIR, f"{sanitized_icon_id}.png")
+
+def _download_icon(icon_url: str, local_icon_path: str) -> str:
+    """
+    Downloads a single icon into the icon store. Returns an error message, or "" on success.
+    """
+    try:
+        with http_get(icon_url, conditional=False, stream=True) as response:
+            if response.status_code != 200:
+                return f"Status {response.status_code}, Content-Length {response.headers.get('Content-Length', 'N/A')}"
+            temp_path = local_icon_path + '.part'
+            bytes_written = 0
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(STREAM_CHUNK_BYTES):
+                    f.write(chunk)
+                    bytes_written += len(chunk)
+        if not bytes_written: # Ensure content is not empty
+            os.remove(temp_path)
+            return "Status 200, empty body"
+        os.replace(temp_path, local_icon_path)
+        return ""
+    except requests.exceptions.RequestException as e:
+        return f"Request failed: {e}"
+    except IOError as e:
+        return f"IOError saving icon: {e}"
+
+def _referenced_icon_paths(item_data_json_file: str = ITEM_DATA_JSON_FILE) -> set[str] | None:
+    """
+    Returns the icon paths (relative to the project root) used by item_data.json,
+    or None if it cannot be read, in which case no icon file should be considered unused.
+    """
+    try:
+        with open(item_data_json_file, 'r', encoding='utf-8') as f:
+            pending = [json.load(f)]
+    except FileNotFoundError:
+        return set()
+    except (OSError, ValueError) as e:
+        print(f"Error reading {item_data_json_file}: {e}. Keeping every icon copy in item directories.")
+        return None
+    icon_paths = set()
+    while pending:
+        node = pending.pop()
+        for value in node.values():
+            if isinstance(value, dict):
+                if 'history_path' in value:
+                    if value.get('icon_path'):
+                        icon_paths.add(value['icon_path'])
+                else:
+                    pending.append(value)
+    return icon_paths
+
+def _migrate_legacy_icons(stored_icon_paths: set[str]) -> tuple[int, int]:
+    """
+    Moves icons that older runs saved in every item directory (<item dir>/<icon_id>.png) into the icon store.
+    Each icon is copied into the store once; every legacy copy is then deleted as soon as item_data.json no
+    longer points at it, i.e. once generate_item_json.py has rerun and picked up the store copy.
+    Adds copied icons to stored_icon_paths. Returns (icons copied into the store, legacy copies deleted).
+    """
+    referenced_icon_paths = _referenced_icon_paths()
+    icons_copied = 0
+    copies_deleted = 0
+    for dirpath, _, filenames in os.walk(HISTORIES_BASE_DIR):
+        for filename in filenames:
+            if not filename.endswith('.png'):
+                continue
+            legacy_icon_path = os.path.join(dirpath, filename)
+            local_icon_path = os.path.join(ICONS_BASE_DIR, filename)
+            if local_icon_path not in stored_icon_paths:
+                temp_path = local_icon_path + '.part'
+                shutil.copyfile(legacy_icon_path, temp_path)
+                os.replace(temp_path, local_icon_path)
+                stored_icon_paths.add(local_icon_path)
+                icons_copied += 1
+            if referenced_icon_paths is not None and legacy_icon_path.replace(os.sep, '/') not in referenced_icon_paths:
+                os.remove(legacy_icon_path)
+                copies_deleted += 1
+    return icons_copied, copies_deleted
+
+def download_item_icons(all_items_data: ItemTable, max_workers: int = ICON_DOWNLOAD_WORKERS) -> ItemTable:
+    """
+    Downloads icons for items in the all_items_data table into the shared icon store
+    (ICONS_BASE_DIR/<icon_id>.png). Each icon_id is downloaded once, however many items use it,
+    and up to max_workers icons are downloaded concurrently.
+    Icons left in item directories by older runs are moved into the store (see _migrate_legacy_icons).
+    Updates the icon_downloaded flag of each item in the table.
     """
     print(f"\nStarting to process icons for {len(all_items_data)} items...")
     icons_found_locally = 0
-    icons_downloaded_successfully = 0
     icons_skipped_no_info = 0
-    icons_failed_download = 0
 
-    for item_data in all_items_data:
-        item_id_str = item_data.get('id', 'Unknown ID') # For logging
-        item_name_str = item_data.get('name', 'Unknown Name') # For logging
-
-        icon_url = item_data.get('icon_url')
-        icon_id_val = item_data.get('icon_id')
-        category_name = item_data.get('category_name', 'UnknownCategory')
-        group_name = item_data.get('group_name', 'UnknownGroup')
-        name = item_data.get('name', f'UnknownItem_{item_id_str}') # For path
-
-        # Construct paths first
-        item_dir = os.path.join(HISTORIES_BASE_DIR, sanitize_for_path(category_name), sanitize_for_path(group_name), sanitize_for_path(name))
-        # Icon ID must be valid for filename
-        local_icon_path = ""
-        if icon_id_val: # Ensure icon_id_val is not empty before sanitizing for path
-            sanitized_icon_id = sanitize_for_path(str(icon_id_val))
-            if sanitized_icon_id: # Ensure sanitized_icon_id is not empty
-                 local_icon_path = os.path.join(item_dir, f"{sanitized_icon_id}.png")
-
-        # Primary Check: If local icon path is valid and file exists
-        if local_icon_path and os.path.exists(local_icon_path):
-            if item_data.get('icon_downloaded') != 'True':
-                print(f"Icon for {item_id_str} ('{item_name_str}') found locally at {local_icon_path}. Updating flag.")
-            item_data['icon_downloaded'] = 'True'
+    os.makedirs(ICONS_BASE_DIR, exist_ok=True)
+    stored_icon_paths = {os.path.join(ICONS_BASE_DIR, f) for f in os.listdir(ICONS_BASE_DIR) if f.endswith('.png')}
+    icons_migrated_from_item_dirs, legacy_icon_copies_deleted = _migrate_legacy_icons(stored_icon_paths)
+    icons_to_download = {} # local_icon_path -> (icon_url, [row, ...])
+
+    for row in range(len(all_items_data)):
+        item_id_str = all_items_data.ids[row] # For logging
+        item_name_str = all_items_data.names[row] or 'Unknown Name' # For logging
+        icon_url = all_items_data.text('icon_url', row)
+        icon_id_val = all_items_data.text('icon_id', row)
+        local_icon_path = icon_store_path(icon_id_val)
+
+        # Primary Check: If the icon is already in the store
+        if local_icon_path in stored_icon_paths:
+            if not all_items_data.icon_downloaded[row]:
+                run_metrics.log_item(f"Icon for {item_id_str} ('{item_name_str}') found locally at {local_icon_path}. Updating flag.")
+            all_items_data.set_flag('icon_downloaded', row, True)
             icons_found_locally += 1
             continue
 
-        # If local icon does not exist, proceed to download attempt
-        os.makedirs(item_dir, exist_ok=True) # Ensure directory exists before download attempt if icon wasn't local
-
         if not icon_url or not icon_id_val or not local_icon_path: # Check all necessary components for download
-            # print(f"Skipping icon download for item {item_id_str} ('{item_name_str}') due to missing icon_url, icon_id, or invalid path.")
-            item_data['icon_downloaded'] = 'False'
+            all_items_data.set_flag('icon_downloaded', row, False)
             icons_skipped_no_info += 1
             continue
 
-        print(f"Downloading icon for item {item_id_str} ('{item_name_str}') from {icon_url} to {local_icon_path}")
-        download_attempted = False
-        try:
-            download_attempted = True
-            response = requests.get(icon_url, stream=True, timeout=30)
-            if response.status_code == 200 and response.content: # Ensure content is not empty
-                with open(local_icon_path, 'wb') as f:
-                    f.write(response.content)
-                item_data['icon_downloaded'] = 'True'
-                icons_downloaded_successfully += 1
-                # print(f"Successfully downloaded icon for item {item_id_str} ('{item_name_str}').")
-            else:
-                print(f"Error downloading icon for {item_id_str} ('{item_name_str}'): Status {response.status_code}, Content-Length {response.headers.get('Content-Length', 'N/A')}")
-                item_data['icon_downloaded'] = 'False'
-                icons_failed_download += 1
+        icons_to_download.setdefault(local_icon_path, (icon_url, []))[1].append(row)
 
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed for icon download {item_id_str} ('{item_name_str}'): {e}")
-            item_data['icon_downloaded'] = 'False'
-            icons_failed_download += 1
-        except IOError as e:
-            print(f"IOError saving icon for item {item_id_str} ('{item_name_str}'): {e}")
-            item_data['icon_downloaded'] = 'False'
-            icons_failed_download += 1
-
-        if download_attempted: # Only sleep if an actual download attempt was made
-            time.sleep(REQUEST_DELAY_SECONDS)
+    icons_downloaded_successfully = 0
+    icons_failed_download = 0
+    if icons_to_download:
+        print(f"Downloading {len(icons_to_download)} unique icons with {max_workers} workers...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_download_icon, icon_url, local_icon_path): local_icon_path
+                for local_icon_path, (icon_url, _) in icons_to_download.items()
+            }
+            for future in as_completed(futures):
+                local_icon_path = futures[future]
+                icon_url, items_using_icon = icons_to_download[local_icon_path]
+                error_message = future.result()
+                if error_message:
+                    print(f"Error downloading icon {icon_url} (used by {len(items_using_icon)} items): {error_message}")
+                    icons_failed_download += 1
+                else:
+                    icons_downloaded_successfully += 1
+                for row in items_using_icon:
+                    all_items_data.set_flag('icon_downloaded', row, not error_message)
 
+    run_metrics.add_counts('icons', {'found_locally': icons_found_locally, 'migrated_from_item_dirs': icons_migrated_from_item_dirs,
+                                     'legacy_copies_deleted': legacy_icon_copies_deleted,
+                                     'downloaded': icons_downloaded_successfully, 'skipped_no_info': icons_skipped_no_info,
+                                     'failed': icons_failed_download})
     print("\n--- Icon Download Summary ---")
     print(f"Icons found locally (flag updated if needed): {icons_found_locally}")
-    print(f"Icons downloaded successfully: {icons_downloaded_successfully}")
+    print(f"Icons moved from item directories into {ICONS_BASE_DIR}: {icons_migrated_from_item_dirs}")
+    print(f"Icon copies deleted from item directories (no longer used by {ITEM_DATA_JSON_FILE}): {legacy_icon_copies_deleted}")
+    print(f"Unique icons downloaded successfully: {icons_downloaded_successfully}")
     print(f"Skipped (missing URL/ID or invalid path): {icons_skipped_no_info}")
-    print(f"Failed to download/save: {icons_failed_download}")
+    print(f"Unique icons failed to download/save: {icons_failed_download}")
     print("-----------------------------")
     return all_items_data
 
@@ -249,6 +602,7 @@ API_V2_ITEM_PRICES_URL = "https://echoes.mobi/api/v2/item_prices"
 def load_all_current_prices() -> dict:
     """
     Fetches all current item prices from the v2 API endpoint.
+    The response is parsed row by row as it streams in, so only the resulting map is held in memory.
     Returns a dictionary mapping item_id to its price data.
     """
     print(f"\nFetching all current item prices from {API_V2_ITEM_PRICES_URL}...")
@@ -256,30 +610,29 @@ def load_all_current_prices() -> dict:
     headers = {'accept': 'text/csv'}
 
     try:
-        response = requests.get(API_V2_ITEM_PRICES_URL, headers=headers, timeout=30)
-        if response.status_code == 200:
-            response_text_stripped = response.text.strip()
-            if not response_text_stripped:
-                print("API response for current prices was empty.")
-                return current_prices_map
-
-            reader = csv.DictReader(response_text_stripped.splitlines())
-            # Expected headers: id,name,estimated_price,date_updated,category_name,group_name,icon_id
-            for row in reader:
-                item_id = row.get('id')
-                if item_id:
-                    current_prices_map[item_id] = {
-                        'estimated_price': row.get('estimated_price'),
-                        'date_updated': row.get('date_updated')
-                    }
-            print(f"Successfully loaded {len(current_prices_map)} current item prices.")
-        else:
-            print(f"Error fetching current prices: Status code {response.status_code}")
-            print(f"Response content: {response.text[:200]}")
+        with http_get(API_V2_ITEM_PRICES_URL, headers=headers, stream=True) as response:
+            if response.status_code == 200:
+                reader = csv.DictReader(_iter_csv_lines(response))
+                # Expected headers: id,name,estimated_price,date_updated,category_name,group_name,icon_id
+                for row in reader:
+                    item_id = row.get('id')
+                    if item_id:
+                        current_prices_map[item_id] = {
+                            'estimated_price': row.get('estimated_price'),
+                            'date_updated': row.get('date_updated')
+                        }
+                if reader.fieldnames is None:
+                    print("API response for current prices was empty.")
+                    return current_prices_map
+                print(f"Successfully loaded {len(current_prices_map)} current item prices.")
+                run_metrics.add_counts('prices', {'loaded': len(current_prices_map)})
+            else:
+                print(f"Error fetching current prices: Status code {response.status_code}")
+                print(f"Response content: {response.text[:200]}")
     except requests.exceptions.RequestException as e:
         print(f"Request failed for current prices: {e}")
     except csv.Error as e:
-        print(f"CSV parsing error for current prices: {e}. Response text: {response.text[:500]}")
+        print(f"CSV parsing error for current prices: {e}. Keeping the {len(current_prices_map)} prices read before the error.")
     except Exception as e:
         print(f"An unexpected error occurred while loading current prices: {e}")
 
@@ -315,11 +668,271 @@ def get_week_year_from_isodate(iso_date_string: str) -> tuple[str, str]:
 
 HISTORY_CSV_HEADERS = ['id', 'item_id', 'price', 'week', 'year', 'date_created', 'date_updated']
 
-def fetch_and_save_histories(item_ids_to_update: list[str], all_current_prices_map: dict):
+def _read_last_line(f, file_size: int) -> bytes:
+    """
+    Returns the last non-empty line of an open binary file by reading backwards from the end.
+    """
+    block_size = 4096
+    while True:
+        start = max(0, file_size - block_size)
+        f.seek(start)
+        data = f.read(file_size - start).rstrip(b'\r\n')
+        newline_pos = data.rfind(b'\n')
+        if newline_pos != -1 or start == 0:
+            return data[newline_pos + 1:]
+        block_size *= 2
+
+def _repair_torn_last_line(history_file_path: str, header_length: int = len(HISTORY_CSV_HEADERS)) -> bool:
+    """
+    Makes sure a history file ends with a complete line before rows are appended to it.
+    A last line without a newline is kept (newline added) if it has every column,
+    otherwise it is the remains of an interrupted write and is cut off. Returns True if the file changed.
+    """
+    with open(history_file_path, 'rb+') as f:
+        file_size = f.seek(0, os.SEEK_END)
+        if not file_size:
+            return False
+        f.seek(file_size - 1)
+        if f.read(1) == b'\n':
+            return False
+        last_line = _read_last_line(f, file_size)
+        if len(next(csv.reader([last_line.decode('utf-8', errors='replace')]), [])) == header_length:
+            f.seek(0, os.SEEK_END)
+            f.write(b'\n')
+        else:
+            f.truncate(file_size - len(last_line))
+    return True
+
+def _scan_history_tail(history_file_path: str, file_stat: os.stat_result, previous_entry: dict | None) -> dict:
+    """
+    Builds a tail manifest entry by reading the header and the last line of a history file.
+    If the file only grew since previous_entry, only the new bytes are read to update the row count.
+    """
+    with open(history_file_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]), [])
+        if previous_entry and previous_entry.get('rows') is not None and 0 < previous_entry['size'] <= file_stat.st_size:
+            f.seek(previous_entry['size'])
+            row_count = previous_entry['rows'] + f.read().count(b'\n')
+        else:
+            row_count = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 16), b''))
+        last_line = _read_last_line(f, file_stat.st_size)
+        f.seek(max(file_stat.st_size - 1, 0))
+        if file_stat.st_size and f.read(1) != b'\n':
+            row_count += 1 # Last row has no trailing newline
+
+    last_row = dict(zip(header, next(csv.reader([last_line.decode('utf-8')]), [])))
+    if row_count <= 0 or last_row.get('id') == 'id':
+        return {'last_id': None, 'last_date_updated': None, 'rows': 0,
+                'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns}
+    return {'last_id': last_row.get('id'), 'last_date_updated': last_row.get('date_updated'), 'rows': row_count,
+            'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns}
+
+class HistoryTailManifest:
+    """
+    Persistent per-file record of each history CSV's last row id, last date_updated,
+    row count, size and mtime. Entries are trusted only while size and mtime still match
+    the file; otherwise the tail is re-read from the end of the file.
+    """
+    def __init__(self, manifest_path: str = HISTORY_TAIL_MANIFEST_FILE):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading {manifest_path}: {e}. History tails will be re-read from the files.")
+
+    def get_tail(self, history_file_path: str) -> dict:
+        file_stat = os.stat(history_file_path)
+        with self._lock:
+            entry = self.entries.get(history_file_path)
+        if entry and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns:
+            return entry
+        entry = _scan_history_tail(history_file_path, file_stat, entry)
+        with self._lock:
+            self.entries[history_file_path] = entry
+        return entry
+
+    def _set_entry(self, history_file_path: str, last_row: dict | None, row_count: int):
+        file_stat = os.stat(history_file_path)
+        with self._lock:
+            self.entries[history_file_path] = {
+                'last_id': last_row.get('id') if last_row else None,
+                'last_date_updated': last_row.get('date_updated') if last_row else None,
+                'rows': row_count,
+                'size': file_stat.st_size,
+                'mtime_ns': file_stat.st_mtime_ns
+            }
+
+    def record_append(self, history_file_path: str, appended_row: dict):
+        with self._lock:
+            previous_rows = self.entries.get(history_file_path, {}).get('rows') or 0
+        self._set_entry(history_file_path, appended_row, previous_rows + 1)
+
+    def record_rewrite(self, history_file_path: str, last_row: dict | None, row_count: int):
+        self._set_entry(history_file_path, last_row, row_count)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        with self._lock:
+            temp_path = self.manifest_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self.manifest_path)
+
+def _process_item_history(item_id: str, item_detail_for_path: dict, all_current_prices_map: dict,
+                          tail_manifest: HistoryTailManifest, history_store: HistoryStore = None,
+                          indicator_cache=None) -> str:
+    """
+    Fetches the full history or appends the latest price for a single item.
+    The last row of an existing history comes from tail_manifest rather than re-reading the file.
+    Rows written to the history CSV are mirrored into history_store when one is given.
+    When an indicator_cache is given, appended rows roll the item's indicator state forward
+    and full fetches schedule it for a rebuild.
+    Returns the outcome key used for the summary counters in fetch_and_save_histories.
+    Each item writes only to its own history file, so this is safe to run from worker threads.
+    """
+    if not item_detail_for_path:
+        print(f"Skipping history for item ID {item_id}: Path details not found in {ITEMS_OUTPUT_CSV_FILE}.")
+        return 'skipped_no_detail_for_path'
+
+    category = item_detail_for_path.get('category_name', 'UnknownCategory')
+    group = item_detail_for_path.get('group_name', 'UnknownGroup')
+    name = item_detail_for_path.get('name', f'UnknownItem_{item_id}')
+
+    sanitized_item_id_for_filename = sanitize_for_path(item_id)
+    sanitized_category = sanitize_for_path(category)
+    sanitized_group = sanitize_for_path(group)
+    sanitized_name = sanitize_for_path(name)
+
+    item_dir = os.path.join(HISTORIES_BASE_DIR, sanitized_category, sanitized_group, sanitized_name)
+    os.makedirs(item_dir, exist_ok=True)
+    history_file_path = os.path.join(item_dir, f"{sanitized_item_id_for_filename}_history.csv")
+
+    if os.path.exists(history_file_path):
+        current_price_data = all_current_prices_map.get(item_id)
+        if not current_price_data or current_price_data.get('estimated_price') is None or current_price_data.get('estimated_price') == '':
+            # Item not in v2 prices or price is empty
+            print(f"Could not find current price in v2 API for item {item_id} to append. Skipping append for this item.")
+            return 'failed_append'
+
+        estimated_price = current_price_data['estimated_price']
+        api_date_updated = current_price_data['date_updated']
+
+        last_row_id_int = 0
+        last_date_updated_in_file = None
+        try:
+            if _repair_torn_last_line(history_file_path):
+                print(f"Repaired an incomplete last line in {history_file_path}.")
+            history_tail = tail_manifest.get_tail(history_file_path)
+            if history_tail['rows']:
+                last_date_updated_in_file = history_tail['last_date_updated']
+                try:
+                    last_row_id_int = int(history_tail['last_id'] or 0)
+                except ValueError:
+                    print(f"Warning: Could not parse last row ID for {item_id} in {history_file_path}. Defaulting to 0.")
+                    last_row_id_int = 0 # Or the row count if IDs are sequential and 1-based
+            can_append = True
+        except Exception as e:
+            # Fall back to a full fetch if append preparation fails badly.
+            print(f"Error reading existing history for {item_id} from {history_file_path}: {e}. Attempting full fetch as fallback.")
+            can_append = False
+
+        if can_append:
+            if api_date_updated == last_date_updated_in_file:
+                run_metrics.log_item(f"Latest price for item {item_id} (date: {api_date_updated}) already in history. Skipping append.")
+                return 'skipped_already_latest'
+
+            new_unique_row_id = last_row_id_int + 1
+            derived_week, derived_year = get_week_year_from_isodate(api_date_updated)
+            new_row_dict = {
+                'id': str(new_unique_row_id),
+                'item_id': str(item_id),
+                'price': str(estimated_price),
+                'week': str(derived_week),
+                'year': str(derived_year),
+                'date_created': api_date_updated,
+                'date_updated': api_date_updated
+            }
+            try:
+                with open(history_file_path, mode='a', encoding='utf-8', newline='') as hf_append:
+                    writer = csv.DictWriter(hf_append, fieldnames=HISTORY_CSV_HEADERS)
+                    # Header is not written when appending
+                    writer.writerow(new_row_dict)
+                tail_manifest.record_append(history_file_path, new_row_dict)
+                if history_store:
+                    history_store.append_rows(item_id, [new_row_dict], history_file_path)
+                if indicator_cache:
+                    indicator_cache.record_append(item_id, [new_row_dict], history_file_path.replace(os.sep, '/'))
+                run_metrics.log_item(f"Appended latest price for item {item_id} to {history_file_path}")
+                return 'appended'
+            except Exception as e:
+                print(f"Error appending to history for {item_id} at {history_file_path}: {e}")
+                return 'failed_append'
+
+    # History file does not exist yet, or the existing one could not be read
+    history_api_url = f"{API_BASE_URL_HISTORY}{item_id}"
+    headers = {'accept': 'text/csv'}
+    run_metrics.log_item(f"Fetching full history for new item ID {item_id} ('{name}')...")
+    temp_path = history_file_path + '.part'
+    try:
+        # The saved history file is the cache here, so no conditional request is needed.
+        with http_get(history_api_url, headers=headers, conditional=False, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Error fetching full history for {item_id} ('{name}'): Status {response.status_code}")
+                return 'failed_fetch'
+            # Stream the body straight into a temp file, parsing rows on the way for the tail manifest
+            new_history_rows = [] if history_store else None
+            last_row = None
+            row_count = 0
+            with open(temp_path, 'w', encoding='utf-8', newline='') as hf:
+                def written_lines():
+                    for line in _iter_csv_lines(response):
+                        hf.write(line + '\n')
+                        yield line
+                for row in csv.DictReader(written_lines()):
+                    last_row = row
+                    row_count += 1
+                    if new_history_rows is not None:
+                        new_history_rows.append(row)
+        if not row_count:
+            os.remove(temp_path)
+            print(f"No actual history data (or only header) for new item {item_id} ('{name}'). Skipping file write.")
+            return 'skipped_no_data_from_api'
+        os.replace(temp_path, history_file_path)
+        tail_manifest.record_rewrite(history_file_path, last_row, row_count)
+        if history_store:
+            history_store.replace_item(item_id, new_history_rows, history_file_path)
+        if indicator_cache:
+            indicator_cache.mark_for_rebuild(item_id, history_file_path.replace(os.sep, '/'))
+        run_metrics.log_item(f"Successfully saved new history for item {item_id} to {history_file_path}")
+        return 'fetched'
+    except Exception as e:
+        # A request error mid-stream, a malformed body or a failed write: never leave the partial file behind
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if isinstance(e, requests.exceptions.RequestException):
+            print(f"Request failed for full history {item_id} ('{name}'): {e}")
+        else:
+            print(f"Error saving full history for {item_id} ('{name}') to {history_file_path}: {e}")
+        return 'failed_fetch'
+
+def fetch_and_save_histories(item_ids_to_update: list[str], all_current_prices_map: dict, max_workers: int = HISTORY_FETCH_WORKERS,
+                             items_by_id: dict = None, journal: RunJournal = None):
     """
     Fetches full item history or appends latest price for specified item IDs.
     - item_ids_to_update: List of item IDs whose history needs to be processed.
     - all_current_prices_map: Dictionary with current price data from /v2/item_prices.
+    - max_workers: Number of items processed concurrently. 1 processes items sequentially.
+      Requests are additionally paced by http_client's adaptive rate controller.
+    - items_by_id: Item rows keyed by ID (a dict or an ItemTable), used for path details instead of re-reading item_lists.csv.
+    - journal: RunJournal in which each completed item is checkpointed; items whose fetch failed
+      stay unfinished and are retried by the next run.
+    If the consolidated history store has been built (see history_store.py), it is updated alongside the CSVs.
+    If the indicator cache has been built (see indicator_cache.py), only the items changed in this run
+    are updated in it, items missing from items_by_id are evicted, and the screener is rewritten.
     """
     print(f"\nStarting to process histories for {len(item_ids_to_update)} items...")
     if not item_ids_to_update:
@@ -327,7 +940,10 @@ def fetch_and_save_histories(item_ids_to_update: list[str], all_current_prices_m
         return
 
     all_items_details_for_paths = {} # To store category/group/name for path creation
-    if os.path.exists(ITEMS_OUTPUT_CSV_FILE):
+    item_ids_to_update_set = set(item_ids_to_update)
+    if items_by_id is not None:
+        all_items_details_for_paths = {item_id: items_by_id[item_id] for item_id in item_ids_to_update_set if item_id in items_by_id}
+    elif os.path.exists(ITEMS_OUTPUT_CSV_FILE):
         try:
             with open(ITEMS_OUTPUT_CSV_FILE, mode='r', encoding='utf-8', newline='') as csvfile:
                 reader = csv.DictReader(csvfile)
@@ -337,7 +953,7 @@ def fetch_and_save_histories(item_ids_to_update: list[str], all_current_prices_m
                     print(f"Error: {ITEMS_OUTPUT_CSV_FILE} is missing required columns for path creation: {', '.join(missing_cols)}.")
                     return
                 for row in reader:
-                    if row.get('id') in item_ids_to_update:
+                    if row.get('id') in item_ids_to_update_set:
                         all_items_details_for_paths[row['id']] = row
             if not all_items_details_for_paths and item_ids_to_update:
                 print(f"Warning: No details found in {ITEMS_OUTPUT_CSV_FILE} for the item IDs to update.")
@@ -346,161 +962,330 @@ def fetch_and_save_histories(item_ids_to_update: list[str], all_current_prices_m
             return # Cannot proceed without path details
 
     os.makedirs(HISTORIES_BASE_DIR, exist_ok=True)
-    headers = {'accept': 'text/csv'}
+    tail_manifest = HistoryTailManifest()
+    history_store = HistoryStore() if HistoryStore.exists() else None
+    indicator_cache = IndicatorCache() if IndicatorCache is not None and IndicatorCache.exists() else None
 
-    new_histories_fetched_count = 0
-    histories_appended_count = 0
-    histories_failed_append_count = 0
-    histories_skipped_no_data_from_api = 0 # For full fetch
-    histories_failed_fetch_count = 0 # For full fetch
-    histories_skipped_no_detail_for_path = 0
-    histories_skipped_already_latest = 0
+    outcome_counts = Counter()
+    def record_outcome(item_id, outcome):
+        outcome_counts[outcome] += 1
+        if journal is not None and outcome != 'failed_fetch':
+            journal.mark_done(item_id)
 
-    for item_id in item_ids_to_update:
-        item_detail_for_path = all_items_details_for_paths.get(item_id)
+    def process_item(item_id):
+        return _process_item_history(item_id, all_items_details_for_paths.get(item_id), all_current_prices_map, tail_manifest, history_store, indicator_cache)
 
-        if not item_detail_for_path:
-            print(f"Skipping history for item ID {item_id}: Path details not found in {ITEMS_OUTPUT_CSV_FILE}.")
-            histories_skipped_no_detail_for_path += 1
-            continue
-
-        category = item_detail_for_path.get('category_name', 'UnknownCategory')
-        group = item_detail_for_path.get('group_name', 'UnknownGroup')
-        name = item_detail_for_path.get('name', f'UnknownItem_{item_id}')
-
-        sanitized_item_id_for_filename = sanitize_for_path(item_id)
-        sanitized_category = sanitize_for_path(category)
-        sanitized_group = sanitize_for_path(group)
-        sanitized_name = sanitize_for_path(name)
-
-        item_dir = os.path.join(HISTORIES_BASE_DIR, sanitized_category, sanitized_group, sanitized_name)
-        os.makedirs(item_dir, exist_ok=True)
-        history_file_path = os.path.join(item_dir, f"{sanitized_item_id_for_filename}_history.csv")
-
-        if os.path.exists(history_file_path):
-            current_price_data = all_current_prices_map.get(item_id)
-            if current_price_data and current_price_data.get('estimated_price') is not None and current_price_data.get('estimated_price') != '':
-                estimated_price = current_price_data['estimated_price']
-                api_date_updated = current_price_data['date_updated']
-
-                last_row_id_int = 0
-                last_date_updated_in_file = None
+    try:
+        if max_workers <= 1:
+            for item_id in item_ids_to_update:
                 try:
-                    with open(history_file_path, mode='r', encoding='utf-8', newline='') as hf_read:
-                        reader = csv.DictReader(hf_read)
-                        history_rows = list(reader)
-                        if history_rows:
-                            last_row = history_rows[-1]
-                            last_date_updated_in_file = last_row.get('date_updated')
-                            try:
-                                last_row_id_int = int(last_row.get('id', 0))
-                            except ValueError:
-                                print(f"Warning: Could not parse last row ID for {item_id} in {history_file_path}. Defaulting to 0.")
-                                last_row_id_int = 0 # Or len(history_rows) if IDs are sequential and 1-based
+                    outcome = process_item(item_id)
                 except Exception as e:
-                    print(f"Error reading existing history for {item_id} from {history_file_path}: {e}. Attempting full fetch as fallback.")
-                    # Fallback to full fetch logic below this if-block by clearing history_file_path or similar
-                    # For now, we'll let it try to fetch full history if append preparation fails badly.
-                    # This path makes it try a full fetch:
-                    history_file_path = None # Mark as non-existent to trigger full fetch logic
-
-                if history_file_path and api_date_updated == last_date_updated_in_file:
-                    print(f"Latest price for item {item_id} (date: {api_date_updated}) already in history. Skipping append.")
-                    histories_skipped_already_latest +=1
-                    continue
-
-                if history_file_path: # Proceed with append if not skipped
-                    new_unique_row_id = last_row_id_int + 1
-                    derived_week, derived_year = get_week_year_from_isodate(api_date_updated)
-                    new_row_dict = {
-                        'id': str(new_unique_row_id),
-                        'item_id': str(item_id),
-                        'price': str(estimated_price),
-                        'week': str(derived_week),
-                        'year': str(derived_year),
-                        'date_created': api_date_updated,
-                        'date_updated': api_date_updated
-                    }
+                    print(f"Error processing history for item {item_id}: {e}")
+                    outcome = 'failed_fetch'
+                record_outcome(item_id, outcome)
+        else:
+            print(f"Processing histories with up to {max_workers} workers (request rate adapted per endpoint)...")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(process_item, item_id): item_id for item_id in item_ids_to_update}
+                for future in as_completed(futures):
                     try:
-                        with open(history_file_path, mode='a', encoding='utf-8', newline='') as hf_append:
-                            writer = csv.DictWriter(hf_append, fieldnames=HISTORY_CSV_HEADERS)
-                            # Header is not written when appending
-                            writer.writerow(new_row_dict)
-                        print(f"Appended latest price for item {item_id} to {history_file_path}")
-                        histories_appended_count += 1
+                        outcome = future.result()
                     except Exception as e:
-                        print(f"Error appending to history for {item_id} at {history_file_path}: {e}")
-                        histories_failed_append_count += 1
-                    continue # Move to next item_id after append attempt
-            else: # Item not in v2 prices or price is empty
-                print(f"Could not find current price in v2 API for item {item_id} to append. Skipping append for this item.")
-                histories_failed_append_count += 1
-                continue # Skip to next item_id
-        
-        # This block executes if history_file_path does not exist OR was set to None due to read error
-        if not os.path.exists(history_file_path) or history_file_path is None :
-            history_api_url = f"{API_BASE_URL_HISTORY}{item_id}"
-            print(f"Fetching full history for new item ID {item_id} ('{name}')...")
-            try:
-                response = requests.get(history_api_url, headers=headers, timeout=30)
-                if response.status_code == 200:
-                    response_text_stripped = response.text.strip()
-                    history_lines = response_text_stripped.splitlines()
-                    if response_text_stripped and len(history_lines) > 1:
-                        # Reconstruct full path if it was None-d due to read error
-                        current_history_file_path = os.path.join(item_dir, f"{sanitized_item_id_for_filename}_history.csv")
-                        with open(current_history_file_path, 'w', encoding='utf-8', newline='') as hf:
-                            hf.write(response_text_stripped + '\n')
-                        print(f"Successfully saved new history for item {item_id} to {current_history_file_path}")
-                        new_histories_fetched_count += 1
-                    else:
-                        print(f"No actual history data (or only header) for new item {item_id} ('{name}'). Skipping file write.")
-                        histories_skipped_no_data_from_api += 1
-                else:
-                    print(f"Error fetching full history for {item_id} ('{name}'): Status {response.status_code}")
-                    histories_failed_fetch_count += 1
-            except requests.exceptions.RequestException as e:
-                print(f"Request failed for full history {item_id} ('{name}'): {e}")
-                histories_failed_fetch_count += 1
-            time.sleep(REQUEST_DELAY_SECONDS) # Delay only for full fetches
+                        print(f"Error processing history for item {futures[future]}: {e}")
+                        outcome = 'failed_fetch'
+                    record_outcome(futures[future], outcome)
+    finally:
+        # Save whatever the workers wrote, even if the phase was interrupted
+        tail_manifest.save()
+        if history_store:
+            history_store.save_index()
+        if journal is not None:
+            journal.finish()
+    if indicator_cache:
+        try:
+            indicator_cache.refresh(items_by_id.keys() if items_by_id is not None else None, history_store)
+            indicator_cache.write_screener()
+        except Exception as e:
+            print(f"Error updating the indicator cache: {e}")
 
+    run_metrics.add_counts('histories', outcome_counts)
     print("\n--- Item History Processing Summary ---")
-    print(f"New full histories fetched: {new_histories_fetched_count}")
-    print(f"Appended latest price to existing histories: {histories_appended_count}")
-    print(f"Skipped (already latest price in history): {histories_skipped_already_latest}")
-    print(f"Skipped (path details not found): {histories_skipped_no_detail_for_path}")
-    print(f"Skipped (no actual data from API for full fetch): {histories_skipped_no_data_from_api}")
-    print(f"Failed (full fetch API error or request exception): {histories_failed_fetch_count}")
-    print(f"Failed (append operation due to missing v2 price or file write error): {histories_failed_append_count}")
+    print(f"New full histories fetched: {outcome_counts['fetched']}")
+    print(f"Appended latest price to existing histories: {outcome_counts['appended']}")
+    print(f"Skipped (already latest price in history): {outcome_counts['skipped_already_latest']}")
+    print(f"Skipped (path details not found): {outcome_counts['skipped_no_detail_for_path']}")
+    print(f"Skipped (no actual data from API for full fetch): {outcome_counts['skipped_no_data_from_api']}")
+    print(f"Failed (full fetch API error or request exception): {outcome_counts['failed_fetch']}")
+    print(f"Failed (append operation due to missing v2 price or file write error): {outcome_counts['failed_append']}")
     print("---------------------------------------")
 
-if __name__ == "__main__":
-    items_to_update_history_for, all_items_data_list = fetch_and_save_items()
+def _row_week_number(row: dict) -> int | None:
+    """
+    Returns the ISO week of a history row as a running week number (Monday's days since epoch // 7),
+    from its week/year columns, falling back to its date_updated. None if neither is usable.
+    """
+    try:
+        week, year = int(row.get('week') or 0), int(row.get('year') or 0)
+        if not week or not year:
+            raise ValueError
+    except ValueError:
+        week_str, year_str = get_week_year_from_isodate(row.get('date_updated'))
+        week, year = int(week_str), int(year_str)
+        if not week or not year:
+            return None
+    try:
+        return date.fromisocalendar(year, week, 1).toordinal() // 7
+    except ValueError:
+        return None
 
-    if all_items_data_list: # Check if there's any data to process
-        all_items_data_list = download_item_icons(all_items_data_list) # Update icon_downloaded flags
+def find_history_gaps(history_file_path: str) -> tuple[list[str], list[dict], list[int]]:
+    """
+    Reads a history CSV and returns (fieldnames, rows, missing week numbers), the missing weeks
+    being the ISO weeks between its first and last row that have no row.
+    """
+    with open(history_file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+        fieldnames = reader.fieldnames or HISTORY_CSV_HEADERS
+    weeks = {week for week in map(_row_week_number, rows) if week is not None}
+    if not weeks:
+        return fieldnames, rows, []
+    return fieldnames, rows, [week for week in range(min(weeks), max(weeks) + 1) if week not in weeks]
 
-        current_prices = load_all_current_prices()
+def _backfill_item_history(history_file_path: str, tail_manifest: HistoryTailManifest,
+                           history_store: HistoryStore = None, indicator_cache=None) -> tuple[str, list[int]]:
+    """
+    Fetches an item's history from the API and merges in the rows for the weeks missing from
+    history_file_path, keeping every existing row. Rows are rewritten in week order via a temp file.
+    Returns (outcome key, weeks the API had no row for either).
+    """
+    fieldnames, rows, missing_weeks = find_history_gaps(history_file_path)
+    if not missing_weeks:
+        return 'no_gaps', []
+    item_id = next((row.get('item_id') for row in rows if row.get('item_id')), None) or os.path.basename(history_file_path).split('_')[0]
+
+    try:
+        with http_get(f"{API_BASE_URL_HISTORY}{item_id}", headers={'accept': 'text/csv'}, conditional=False, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Error fetching history for backfill of {item_id}: Status {response.status_code}")
+                return 'failed_fetch', missing_weeks
+            api_rows = list(csv.DictReader(_iter_csv_lines(response)))
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed for backfill of {item_id}: {e}")
+        return 'failed_fetch', missing_weeks
+
+    missing = set(missing_weeks)
+    filled_rows = []
+    for row in api_rows:
+        week = _row_week_number(row)
+        if week in missing:
+            missing.discard(week) # One row per missing week
+            filled_rows.append(row)
+    if not filled_rows:
+        return 'unfillable', missing_weeks
+
+    merged_rows = sorted(rows + filled_rows, key=lambda row: (_row_week_number(row) or 0, row.get('date_updated') or ''))
+    temp_path = history_file_path + '.part'
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(merged_rows)
+    os.replace(temp_path, history_file_path)
+    tail_manifest.record_rewrite(history_file_path, merged_rows[-1], len(merged_rows))
+    if history_store:
+        history_store.replace_item(item_id, merged_rows, history_file_path)
+    if indicator_cache:
+        indicator_cache.mark_for_rebuild(item_id, history_file_path.replace(os.sep, '/'))
+    run_metrics.log_item(f"Backfilled {len(filled_rows)} missing weeks for item {item_id} in {history_file_path}")
+    return 'backfilled', sorted(missing)
+
+def backfill_history_gaps(max_workers: int = HISTORY_FETCH_WORKERS, state_path: str = BACKFILL_STATE_FILE):
+    """
+    Repairs holes left in the weekly series by missed runs or failed appends.
+    Scans every history CSV under HISTORIES_BASE_DIR for ISO weeks missing between its first and
+    last row, then, for the affected items only and max_workers at a time, fetches the history
+    and merges in the missing weeks. Files are left unchanged if the API has no row for those weeks.
+    Files already checked by a previous backfill are skipped while their size and mtime are unchanged
+    (saved in state_path), so weeks the API cannot fill are not requested again on every run.
+    """
+    state = {}
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {state_path}: {e}. Rescanning all histories.")
+
+    print(f"\nScanning histories in {HISTORIES_BASE_DIR} for missing weeks...")
+    files_scanned = 0
+    files_with_gaps = {} # history_file_path -> missing week numbers
+    new_state = {}
+    for dirpath, _, filenames in os.walk(HISTORIES_BASE_DIR):
+        for filename in filenames:
+            if not filename.endswith('_history.csv'):
+                continue
+            history_file_path = os.path.join(dirpath, filename)
+            file_stat = os.stat(history_file_path)
+            previous = state.get(history_file_path)
+            if previous and previous['size'] == file_stat.st_size and previous['mtime_ns'] == file_stat.st_mtime_ns:
+                new_state[history_file_path] = previous
+                continue
+            files_scanned += 1
+            try:
+                missing_weeks = find_history_gaps(history_file_path)[2]
+            except (OSError, csv.Error, UnicodeDecodeError) as e:
+                print(f"Error reading {history_file_path}: {e}. Skipping it.")
+                continue
+            if missing_weeks:
+                files_with_gaps[history_file_path] = missing_weeks
+            else:
+                new_state[history_file_path] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'unfillable_weeks': []}
 
+    print(f"Scanned {files_scanned} changed histories: {len(files_with_gaps)} have missing weeks "
+          f"({sum(map(len, files_with_gaps.values()))} weeks in total).")
+
+    outcome_counts = Counter()
+    if files_with_gaps:
+        tail_manifest = HistoryTailManifest()
+        history_store = HistoryStore() if HistoryStore.exists() else None
+        indicator_cache = IndicatorCache() if IndicatorCache is not None and IndicatorCache.exists() else None
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+            futures = {
+                executor.submit(_backfill_item_history, history_file_path, tail_manifest, history_store, indicator_cache): history_file_path
+                for history_file_path in files_with_gaps
+            }
+            for future in as_completed(futures):
+                history_file_path = futures[future]
+                try:
+                    outcome, unfilled_weeks = future.result()
+                except (OSError, csv.Error) as e:
+                    print(f"Error backfilling {history_file_path}: {e}")
+                    outcome, unfilled_weeks = 'failed_write', None
+                outcome_counts[outcome] += 1
+                if outcome != 'failed_fetch' and unfilled_weeks is not None:
+                    # Failed fetches stay out of the state so they are retried next run
+                    file_stat = os.stat(history_file_path)
+                    new_state[history_file_path] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'unfillable_weeks': unfilled_weeks}
+
+        tail_manifest.save()
+        if history_store:
+            history_store.save_index()
+        if indicator_cache:
+            try:
+                indicator_cache.refresh(None, history_store)
+                indicator_cache.write_screener()
+            except Exception as e:
+                print(f"Error updating the indicator cache: {e}")
+
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    temp_path = state_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(new_state, f)
+    os.replace(temp_path, state_path)
+
+    run_metrics.add_counts('backfill', outcome_counts)
+    print("\n--- History Backfill Summary ---")
+    print(f"Histories backfilled: {outcome_counts['backfilled']}")
+    print(f"Gaps the API has no data for: {outcome_counts['unfillable']}")
+    print(f"Failed (API error or request exception): {outcome_counts['failed_fetch']}")
+    print(f"Failed (file write error): {outcome_counts['failed_write']}")
+    print("--------------------------------")
+
+def save_items_after_icon_download(all_items_data: ItemTable, icon_flags_before: bytes, catalog_db=None):
+    """
+    Persists the item list once download_item_icons has updated the icon_downloaded flags
+    (icon_flags_before being a copy of all_items_data.icon_downloaded taken before).
+    With a catalog_db, only rows whose flag changed are upserted and item_lists.csv is exported from it;
+    otherwise item_lists.csv is rewritten from all_items_data.
+    """
+    if catalog_db is not None:
+        # Only rows whose icon flag changed need to be written back; item_lists.csv is exported once.
+        changed_icon_rows = [all_items_data.row(row) for row, (before, after) in enumerate(zip(icon_flags_before, all_items_data.icon_downloaded)) if before != after]
+        try:
+            item_catalog_db.upsert_items(catalog_db, changed_icon_rows)
+            rows_exported = item_catalog_db.export_csv(catalog_db, ITEMS_OUTPUT_CSV_FILE)
+            print(f"\nUpdated icon status for {len(changed_icon_rows)} items and exported {rows_exported} items to {ITEMS_OUTPUT_CSV_FILE}")
+        except Exception as e:
+            print(f"Error updating the SQLite catalog or exporting {ITEMS_OUTPUT_CSV_FILE}: {e}")
+    else:
         # Write the potentially updated all_items_data (with new icon_downloaded flags) to CSV
-        # FINAL_CSV_HEADERS is defined globally
-        print(f"\nWriting final item data for {len(all_items_data_list)} items to {ITEMS_OUTPUT_CSV_FILE}...")
+        print(f"\nWriting final item data for {len(all_items_data)} items to {ITEMS_OUTPUT_CSV_FILE}...")
         try:
-            with open(ITEMS_OUTPUT_CSV_FILE, 'w', encoding='utf-8', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=FINAL_CSV_HEADERS)
-                writer.writeheader()
-                for item_dict in all_items_data_list:
-                    row_to_write = {header: item_dict.get(header, '') for header in FINAL_CSV_HEADERS}
-                    writer.writerow(row_to_write)
+            all_items_data.write_csv(ITEMS_OUTPUT_CSV_FILE)
             print(f"Final item data including icon status written to {ITEMS_OUTPUT_CSV_FILE}")
         except IOError as e:
             print(f"Error writing final item data to CSV: {e}")
         except Exception as e: # Catch any other unexpected error during write
              print(f"An unexpected error occurred while writing final CSV: {e}")
 
+def run_update(catalog_db=None, full_scan: bool = False):
+    """
+    Runs a full update: item list, icons, current prices and histories, each timed as a phase in run_metrics.
+    The item list is delta-synced unless full_scan is set (see fetch_and_save_items).
+    History work is checkpointed in the run journal (see RunJournal and resume_update).
+    """
+    journal = RunJournal()
+    with run_metrics.phase('items'):
+        items_to_update_history_for, all_items_data = fetch_and_save_items(catalog_db=catalog_db, journal=journal, full_scan=full_scan)
+
+    if all_items_data: # Check if there's any data to process
+        icon_flags_before = bytes(all_items_data.icon_downloaded)
+        with run_metrics.phase('icons'):
+            all_items_data = download_item_icons(all_items_data) # Update icon_downloaded flags
+
+        with run_metrics.phase('prices'):
+            current_prices = load_all_current_prices()
+
+        with run_metrics.phase('save_items'):
+            save_items_after_icon_download(all_items_data, icon_flags_before, catalog_db)
+
         if items_to_update_history_for:
-            fetch_and_save_histories(items_to_update_history_for, current_prices)
+            with run_metrics.phase('histories'):
+                fetch_and_save_histories(items_to_update_history_for, current_prices, items_by_id=all_items_data, journal=journal)
         else:
             print("No items require history updates based on initial fetch.")
     else:
         print("\nSkipping icon downloading and history fetching because item list was not created or is empty.")
+
+def resume_update(catalog_db=None):
+    """
+    Finishes the history work of an interrupted run from the run journal: only the items not
+    checkpointed as completed are processed, against freshly loaded current prices.
+    """
+    journal = RunJournal()
+    remaining_item_ids = journal.remaining_item_ids()
+    if not remaining_item_ids:
+        print(f"Nothing to resume: {journal.journal_path} has no unfinished items.")
+        return
+    print(f"Resuming interrupted run: {len(remaining_item_ids)} of {len(journal.pending)} items left.")
+    items_by_id = item_catalog_db.load_items(catalog_db) if catalog_db is not None else None
+    with run_metrics.phase('prices'):
+        current_prices = load_all_current_prices()
+    with run_metrics.phase('histories'):
+        fetch_and_save_histories(remaining_item_ids, current_prices, items_by_id=items_by_id, journal=journal)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update item_lists.csv, icons and item histories from the echoes.mobi API.")
+    parser.add_argument('--verbose', action='store_true', help="Print a line for every item processed")
+    parser.add_argument('--backfill', action='store_true', help="Only repair missing weeks in existing histories instead of running an update")
+    parser.add_argument('--resume', action='store_true', help="Only finish the histories left unfinished by an interrupted run")
+    parser.add_argument('--full-scan', action='store_true', help="Fetch every page of the item list instead of a delta sync")
+    parser.add_argument('--report', default=RUN_REPORT_FILE, help="Where to write the JSON run report")
+    parser.add_argument('--profile', help="Run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+    run_metrics.verbose_items = args.verbose
+
+    with profiled(args.profile):
+        if args.backfill:
+            with run_metrics.phase('backfill'):
+                backfill_history_gaps()
+        elif args.resume:
+            resume_update(item_catalog_db.open_catalog_db() if USE_SQLITE_CATALOG else None)
+        else:
+            run_update(item_catalog_db.open_catalog_db() if USE_SQLITE_CATALOG else None, full_scan=args.full_scan)
+    http_client.rate_controller.print_summary()
+    run_metrics.set_section('rate_control', http_client.rate_controller.report())
+    run_metrics.print_summary()
+    run_metrics.write_report(args.report)
+    print(f"Run report written to {args.report}")